@@ -0,0 +1,276 @@
+import argparse
+import json
+import os
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from config import OUTPUT_DIR, OUTPUT_FORMAT
+from data_processor import PROFILE_COLUMNS, NO_TIME, _column, _epoch_us, build_profiles, read_tables, user_codes, write_profiles
+from utils import parse_datetime, to_epoch_us, US_PER_DAY
+
+#this file contains the activity store, for profiles of any time window without crawling again
+#the posts, reposts and likes of every user are kept sorted by (user, time) with running sums of
+#the engagement counts, and indexed by (user, day) buckets: the activity of all users inside a
+#[start, end) window is two binary searches per user plus the partial days at both ends
+#usage: python activity_store.py --windows 2024-06-01:2024-07-01 2024-07-01:2024-08-01
+
+# Activity kinds, the table, user and time columns they come from and the counts summed over them
+KINDS = {
+    'posts': ('author_did', 'created_at', ['like_count', 'repost_count', 'reply_count']),
+    'reposts': ('repost_by', 'repost_time', []),
+    'likes_given': ('user_did', 'created_at', []),
+}
+
+# Profile columns that depend on the window, the others describe all the collected activity
+WINDOW_COLUMNS = [
+    'posts_count_timeframe', 'reposts_count_timeframe', 'posting_frequency_timeframe',
+    'timeframe_likes_received', 'timeframe_reposts_received', 'timeframe_replies_received',
+]
+
+BASE_FILE = 'profiles.parquet'
+META_FILE = 'activity.json'
+
+
+def activity_path(date_range):
+    return os.path.join(OUTPUT_DIR, f"activity_{date_range}")
+
+
+def window_profiles_path(start, end, output_format=OUTPUT_FORMAT):
+    """Profiles file of a queried window, never the profiles file of a collection run"""
+    extension = 'parquet' if output_format == 'parquet' else 'jsonl'
+    return os.path.join(OUTPUT_DIR, f"users_window_profiles_{start}_to_{end}.{extension}")
+
+
+def to_us(moment):
+    """Epoch microseconds of a datetime (naive ones are UTC), ISO string, datetime64 or int"""
+    if isinstance(moment, datetime):
+        return to_epoch_us(moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc))
+    if isinstance(moment, str):
+        return to_us(parse_datetime(moment))
+    if isinstance(moment, np.datetime64):
+        return int(moment.astype('datetime64[us]').astype(np.int64))
+    return int(moment)
+
+
+class ActivityIndex:
+    """Timed activity of one kind, sorted by (user, time).
+
+    time[indptr[u]:indptr[u + 1]] are the times of user u, bucket b holds the items
+    bucket_start[b]:bucket_start[b + 1] of user bucket_key[b] // days on day bucket_key[b] % days,
+    sums[name][i] is the total of column `name` over the first i items.
+    """
+
+    def __init__(self, time, indptr, bucket_key, bucket_start, sums):
+        self.time = time
+        self.indptr = indptr
+        self.bucket_key = bucket_key
+        self.bucket_start = bucket_start
+        self.sums = sums
+
+    @classmethod
+    def build(cls, codes, times, values, n, first_day, days):
+        order = np.lexsort((times, codes))
+        codes, times = codes[order], times[order]
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=n), out=indptr[1:])
+
+        keys = codes.astype(np.int64) * days + (times // US_PER_DAY - first_day)
+        bucket_key, bucket_start = np.unique(keys, return_index=True)
+        bucket_start = np.append(bucket_start, len(keys)).astype(np.int64)
+
+        sums = {}
+        for name, column in values.items():
+            sums[name] = np.zeros(len(times) + 1)
+            np.cumsum(column[order], out=sums[name][1:])
+        return cls(times, indptr, bucket_key, bucket_start, sums)
+
+    def positions(self, moment, first_day, days):
+        """Index of the first item of every user at or after `moment` (epoch microseconds)"""
+        n = len(self.indptr) - 1
+        day = moment // US_PER_DAY - first_day
+        if day < 0:
+            return self.indptr[:-1].copy()
+        if day >= days:
+            return self.indptr[1:].copy()
+
+        # The first bucket at or after the day: its first item, unless it is that very day
+        keys = np.arange(n, dtype=np.int64) * days + day
+        buckets = np.searchsorted(self.bucket_key, keys)
+        positions = self.bucket_start[buckets]
+
+        # On that day, only the items before `moment` come before it
+        same_day = np.flatnonzero(buckets < len(self.bucket_key))
+        same_day = same_day[self.bucket_key[buckets[same_day]] == keys[same_day]]
+        if len(same_day):
+            starts = self.bucket_start[buckets[same_day]]
+            lengths = self.bucket_start[buckets[same_day] + 1] - starts
+            owner = np.repeat(np.arange(len(same_day)), lengths)
+            items = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            positions[same_day] += np.bincount(owner, weights=self.time[items] < moment, minlength=len(same_day)).astype(np.int64)
+        return positions
+
+
+class ActivityStore:
+    """Activity of a cohort indexed by (user, time), and the profiles of any time window"""
+
+    def __init__(self, base, indexes, first_day, days):
+        self.base = base  # profiles over all the activity, the window columns are replaced
+        self.indexes = indexes  # kind -> ActivityIndex
+        self.first_day = first_day
+        self.days = days
+
+    @classmethod
+    def build(cls, users, posts, reposts, likes_given, followers_count, following_count):
+        """Index the tables build_profiles takes (posts, reposts and likes given need their
+        time column, created_at_us / repost_time_us are used where the collector stored them)"""
+        base = build_profiles(users, posts, reposts, likes_given, followers_count, following_count)
+        dids = pd.Index(base['user_id'])
+        tables = {'posts': posts, 'reposts': reposts, 'likes_given': likes_given}
+
+        activity = {}
+        for kind, (user_column, time_column, value_columns) in KINDS.items():
+            table = tables[kind]
+            codes, known = user_codes(dids, table, user_column)
+            stored = _column(table, f'{time_column}_us', None) if f'{time_column}_us' in table else None
+            times = _epoch_us(_column(table, time_column, None), stored) if len(codes) else np.zeros(0, dtype=np.int64)
+            timed = known & (times != NO_TIME)
+            values = {name: _column(table, name, 0)[timed].astype(np.float64) for name in value_columns}
+            activity[kind] = (codes[timed], times[timed], values)
+
+        all_times = np.concatenate([times for _, times, _ in activity.values()])
+        first_day = int(all_times.min() // US_PER_DAY) if len(all_times) else 0
+        days = int(all_times.max() // US_PER_DAY) - first_day + 1 if len(all_times) else 1
+
+        indexes = {kind: ActivityIndex.build(codes, times, values, len(dids), first_day, days)
+                   for kind, (codes, times, values) in activity.items()}
+        return cls(base, indexes, first_day, days)
+
+    @property
+    def dids(self):
+        return self.base['user_id']
+
+    # - - - - QUERIES - - - -
+
+    def window(self, kind, start, end):
+        """Per user activity of one kind in [start, end): count, first and last time, and
+        the sums of its count columns"""
+        index = self.indexes[kind]
+        low = index.positions(to_us(start), self.first_day, self.days)
+        high = np.maximum(index.positions(to_us(end), self.first_day, self.days), low)
+        active = high > low
+        first, last = np.full(len(low), NO_TIME), np.full(len(low), NO_TIME)
+        first[active], last[active] = index.time[low[active]], index.time[high[active] - 1]
+        result = {'count': high - low, 'first': first, 'last': last}
+        for name, sums in index.sums.items():
+            result[name] = sums[high] - sums[low]
+        return result
+
+    def profile(self, start, end):
+        """Comprehensive profiles of every user with `start` <= time < `end` as the timeframe"""
+        posts = self.window('posts', start, end)
+        reposts = self.window('reposts', start, end)
+
+        days_active = (posts['last'] - posts['first']) // US_PER_DAY + 1
+        frequency = np.divide(posts['count'], days_active, out=np.zeros(len(days_active)), where=posts['count'] > 0)
+
+        profiles = self.base.drop(columns=WINDOW_COLUMNS)
+        profiles['posts_count_timeframe'] = posts['count']
+        profiles['reposts_count_timeframe'] = reposts['count']
+        profiles['posting_frequency_timeframe'] = np.round(frequency, 4)
+        profiles['timeframe_likes_received'] = posts['like_count'].astype(np.int64)
+        profiles['timeframe_reposts_received'] = posts['repost_count'].astype(np.int64)
+        profiles['timeframe_replies_received'] = posts['reply_count'].astype(np.int64)
+        return profiles[PROFILE_COLUMNS]
+
+    def profiles(self, windows):
+        """Profiles of several (start, end) windows in one table, with window_start and
+        window_end columns"""
+        tables = []
+        for start, end in windows:
+            profiles = self.profile(start, end)
+            profiles.insert(0, 'window_start', pd.Timestamp(to_us(start), unit='us', tz='UTC'))
+            profiles.insert(1, 'window_end', pd.Timestamp(to_us(end), unit='us', tz='UTC'))
+            tables.append(profiles)
+        if not tables:
+            return pd.DataFrame(columns=['window_start', 'window_end'] + PROFILE_COLUMNS)
+        return pd.concat(tables, ignore_index=True)
+
+    def daily_counts(self, kind):
+        """Sparse users x days matrix of the activity of one kind per day (column 0 is
+        first_day days after the epoch)"""
+        import scipy.sparse as sp
+        index = self.indexes[kind]
+        counts = np.diff(index.bucket_start)
+        rows, columns = np.divmod(index.bucket_key, self.days)
+        return sp.csr_matrix((counts, (rows, columns)), shape=(len(self.base), self.days))
+
+    # - - - - STORAGE - - - -
+
+    def save(self, path):
+        """Write the store to the directory `path` (.npy arrays, memory-mapped when loaded)"""
+        os.makedirs(path, exist_ok=True)
+        for kind, index in self.indexes.items():
+            arrays = {'time': index.time, 'indptr': index.indptr, 'bucket_key': index.bucket_key,
+                      'bucket_start': index.bucket_start}
+            arrays.update({f'sum_{name}': sums for name, sums in index.sums.items()})
+            for name, values in arrays.items():
+                np.save(os.path.join(path, f"{kind}_{name}.npy"), values)
+        self.base.to_parquet(os.path.join(path, BASE_FILE), index=False, compression='zstd')
+        with open(os.path.join(path, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({
+                'first_day': self.first_day, 'days': self.days, 'users': len(self.base),
+                'items': {kind: len(index.time) for kind, index in self.indexes.items()},
+            }, f)
+        print(f"? Saved activity store: {len(self.base)} users, {self.days} days to {path}")
+        return path
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        mode = 'r' if mmap else None
+        with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+        def array(kind, name):
+            return np.load(os.path.join(path, f"{kind}_{name}.npy"), mmap_mode=mode)
+
+        indexes = {}
+        for kind, (_, _, value_columns) in KINDS.items():
+            indexes[kind] = ActivityIndex(
+                array(kind, 'time'), array(kind, 'indptr'), array(kind, 'bucket_key'), array(kind, 'bucket_start'),
+                {name: array(kind, f'sum_{name}') for name in value_columns}
+            )
+        base = pd.read_parquet(os.path.join(path, BASE_FILE))
+        return cls(base, indexes, meta['first_day'], meta['days'])
+
+
+def build_activity_store(date_range, output_format=None):
+    """Index the stored tables of a collection run and save the store next to them"""
+    store = ActivityStore.build(*read_tables(date_range, output_format))
+    store.save(activity_path(date_range))
+    return store
+
+
+def load_activity_store(date_range, mmap=True):
+    return ActivityStore.load(activity_path(date_range), mmap)
+
+
+if __name__ == "__main__":
+    from config import START_DATE, END_DATE
+    parser = argparse.ArgumentParser(description="Profiles of other time windows from the collected activity")
+    parser.add_argument('--windows', nargs='+', required=True, metavar='START:END',
+                        help="windows as ISO dates, start included and end excluded")
+    parser.add_argument('--rebuild', action='store_true', help="index the stored tables again")
+    args = parser.parse_args()
+
+    date_range = f"{START_DATE.strftime('%Y-%m-%d')}_to_{END_DATE.strftime('%Y-%m-%d')}"
+    if args.rebuild or not os.path.exists(activity_path(date_range)):
+        store = build_activity_store(date_range)
+    else:
+        store = load_activity_store(date_range)
+
+    # One profiles file per window, apart from the profiles file of the collection run
+    for window in args.windows:
+        start, end = window.split(':')
+        profiles = store.profile(start, end)
+        path = write_profiles(profiles, f"{start}_to_{end}", OUTPUT_FORMAT, window_profiles_path(start, end))
+        print(f"? {len(profiles)} profiles of {start} to {end} saved to {os.path.basename(path)}")
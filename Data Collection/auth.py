@@ -1,10 +1,131 @@
+import hashlib
+import os
+import threading
 from atproto import Client
-from config import BSKY_USERNAME, BSKY_PASSWORD
+from config import BSKY_USERNAME, BSKY_PASSWORD, SESSION_FILE, BSKY_BASE_URL, RECORD_FILE, OUTPUT_DIR
+from rate_limiter import install_rate_limiter
+from metrics import install_metrics
+
+def new_client():
+    """Client for the configured API server, with every request measured and going through
+    the rate limiter"""
+    client = Client(base_url=BSKY_BASE_URL)
+    if RECORD_FILE:
+        from mock_server import install_recorder
+        install_recorder(client, RECORD_FILE)
+    install_metrics(client)
+    return install_rate_limiter(client)
+
 
 def authenticate_client():
     """Authenticate with Bluesky API"""
-    client = Client()
+    client = new_client()
     print("Attempting to login...")
     client.login(BSKY_USERNAME, BSKY_PASSWORD)
     print("Login successful!")
-    return client
\ No newline at end of file
+    return client
+
+
+def session_path(session_file=SESSION_FILE, base_url=BSKY_BASE_URL, handle=BSKY_USERNAME):
+    """Session file of one server and account. A saved session carries the PDS it was made on
+    and resuming it sends every request there, so tokens are never shared between servers"""
+    key = f"{base_url or 'https://bsky.social'}|{handle}"
+    return f"{session_file}-{hashlib.blake2b(key.encode('utf-8'), digest_size=6).hexdigest()}"
+
+
+def remove_legacy_session(session_file):
+    """Earlier versions kept the session tokens next to the data files"""
+    legacy_file = os.path.join(OUTPUT_DIR, '.bsky_session')
+    if os.path.exists(legacy_file) and os.path.abspath(legacy_file) != os.path.abspath(session_file):
+        os.remove(legacy_file)
+        print(f"Removed the old session file {legacy_file}")
+
+
+class SessionManager:
+    """Keep a single logged-in Client for the whole run and refresh its tokens"""
+
+    def __init__(self, session_file=None):
+        self.session_file = session_file or session_path()
+        self.login_count = 0
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get_client(self):
+        """Return the shared client, logging in or refreshing only when needed"""
+        with self._lock:
+            if self._client is None:
+                remove_legacy_session(self.session_file)
+                self._client = self._resume_session() or self._login()
+            elif self._should_refresh():
+                self._refresh()
+            return self._client
+
+    def _login(self):
+        client = authenticate_client()
+        self.login_count += 1
+        client.on_session_change(lambda event, session: self._save_session(client))
+        self._save_session(client)
+        return client
+
+    def _resume_session(self):
+        """Reuse the session saved by a previous run instead of logging in again"""
+        if not os.path.exists(self.session_file):
+            return None
+        with open(self.session_file, 'r', encoding='utf-8') as f:
+            session_string = f.read().strip()
+        if not session_string:
+            return None
+
+        client = new_client()
+        try:
+            client.login(session_string=session_string)
+        except Exception as e:
+            print(f"Saved session rejected ({e}), logging in again...")
+            return None
+        print("Resumed saved session")
+        client.on_session_change(lambda event, session: self._save_session(client))
+        return client
+
+    def _should_refresh(self):
+        # atproto refreshes the access JWT on its own 15 minutes before expiry,
+        # we check ahead of it so an expired refresh JWT ends in a new login
+        # instead of an exception inside a collector call
+        try:
+            return self._client._should_refresh_session()
+        except Exception:
+            return False
+
+    def _refresh(self):
+        try:
+            # atproto refreshes under this lock too, before a request of another thread, which
+            # may have refreshed the tokens already
+            with self._client._refresh_lock:
+                if not self._should_refresh():
+                    return
+                self._client._refresh_and_set_session()
+            print("Session refreshed")
+        except Exception as e:
+            print(f"Session refresh failed ({e}), logging in again...")
+            self._client = self._login()
+
+    def _save_session(self, client):
+        """Write the session readable by the owner only (0600)"""
+        try:
+            os.makedirs(os.path.dirname(self.session_file) or '.', mode=0o700, exist_ok=True)
+            temporary_path = self.session_file + '.tmp'
+            fd = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            if hasattr(os, 'fchmod'):
+                os.fchmod(fd, 0o600)  # a left-over temporary file keeps its old mode
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(client.export_session_string())
+            os.replace(temporary_path, self.session_file)
+        except Exception as e:
+            print(f"Could not save session: {e}")
+
+
+# Shared by every collector function in the process
+session_manager = SessionManager()
+
+def get_client():
+    """Get the shared authenticated client"""
+    return session_manager.get_client()
@@ -0,0 +1,210 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+#this file contains the end to end benchmark of the collection pipeline
+#every scale runs main() in a fresh process against the local mock server (mock_server.py) and
+#reports users/sec, requests per user per endpoint, peak memory and where the time went
+#usage: python benchmark.py --scales 100 1000 10000 --output results.json --baseline old.json
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class Timings:
+    """Seconds spent per activity, summed over all threads"""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.seconds[name] += seconds
+
+    def wrap(self, name, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - start)
+        return timed
+
+
+def peak_rss_bytes():
+    """Peak resident memory of this process, None where the resource module is missing"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+# - - - - - - - - - - - - - - - - - - ONE SCALE (child process) - - - - - - - - - - - - - - - -
+
+def run_scale(users, result_file, real_rate_limits=False):
+    """Run main() for `users` users in the current directory and write the measurements"""
+    import config
+    config.MAX_USERS = users
+    if not real_rate_limits:
+        # Measure the pipeline, not the client side limits (429s from the server still apply)
+        config.RATE_LIMITS.update({family: (1e6, 1e6) for family in config.RATE_LIMITS})
+
+    timings = Timings()
+
+    # Requests: time inside the rate limiter minus the time waiting for a token
+    from rate_limiter import RateLimiter, rate_limiter
+    RateLimiter.call = timings.wrap('request', RateLimiter.call)
+
+    # Parsing: JSON to atproto models, done by the client after every response
+    from atproto_client.namespaces import sync_ns
+    sync_ns.get_response_model = timings.wrap('parse', sync_ns.get_response_model)
+
+    # Writing: output files, CSV conversion and the summary
+    import sinks
+    import file_io
+    for method in ('write', 'write_user', 'finish', 'close'):
+        setattr(sinks.OutputSinks, method, timings.wrap('write', getattr(sinks.OutputSinks, method)))
+
+    import main
+    main.saving_to_csv = timings.wrap('write', main.saving_to_csv)
+    main.save_statistics = timings.wrap('write', main.save_statistics)
+
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        main.main()
+    elapsed = time.perf_counter() - start
+
+    from crawl_store import CrawlStore
+    store = CrawlStore()
+    collected = store.count_done('user')
+    store.close()
+
+    from metrics import metrics
+    counters = rate_limiter.counters()
+    wait = sum(counters['wait_seconds'].values())
+    result = {
+        'users': users,
+        'collected_users': collected,
+        'elapsed_seconds': round(elapsed, 3),
+        'users_per_second': round(collected / elapsed, 3) if elapsed else None,
+        'requests': counters['requests'],
+        'requests_total': sum(counters['requests'].values()),
+        'requests_per_user': {nsid: round(count / max(collected, 1), 2) for nsid, count in counters['requests'].items()},
+        'throttled': counters['throttled'],
+        'peak_rss_bytes': peak_rss_bytes(),
+        'phase_seconds': {name: round(seconds, 3) for name, seconds in metrics.phases.items()},
+        # Summed over threads, so they can add up to more than elapsed_seconds
+        'thread_seconds': {
+            'rate_limit_wait': round(wait, 3),
+            'request': round(timings.seconds['request'] - wait, 3),
+            'parse': round(timings.seconds['parse'], 3),
+            'write': round(timings.seconds['write'], 3),
+        },
+    }
+    with open(result_file, 'w', encoding='utf-8') as f:
+        json.dump(result, f)
+
+
+# - - - - - - - - - - - - - - - - - - DRIVER - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(scales, latency=0.0, server_rate_limit=None, real_rate_limits=False, seed=42):
+    """Run every scale against its own mock server, returns the list of results"""
+    from mock_server import SyntheticNetwork, start_mock_server
+
+    results = []
+    for users in scales:
+        # Room for discovery to pick `users` distinct accounts
+        network = SyntheticNetwork(max(users * 2, 1000), seed=seed)
+        server = start_mock_server(network, latency=latency, rate_limit=server_rate_limit, window=60)
+        env = {**os.environ, 'BSKY_BASE_URL': server.base_url}
+        env.pop('BSKY_RECORD_FILE', None)
+
+        with tempfile.TemporaryDirectory() as workdir:
+            # Mock tokens stay in the workdir, never in (or resumed from) the user's session files
+            env['BSKY_SESSION_FILE'] = os.path.join(workdir, 'session')
+            result_file = os.path.join(workdir, 'result.json')
+            command = [sys.executable, os.path.join(HERE, 'benchmark.py'), '--child', str(users), result_file]
+            if real_rate_limits:
+                command.append('--real-rate-limits')
+            print(f"Benchmarking {users} users...")
+            subprocess.run(command, cwd=workdir, env=env, check=True)
+            with open(result_file, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+
+        server.shutdown()
+        server.server_close()
+        result['server_requests'] = dict(server.request_counts)
+        results.append(result)
+
+        peak = result['peak_rss_bytes']
+        memory = f"peak RSS {peak / 2**20:.0f} MB" if peak else "peak RSS unknown"
+        print(f"  {result['collected_users']} users in {result['elapsed_seconds']:.1f}s "
+              f"({result['users_per_second']} users/s), {result['requests_total']} requests, {memory}")
+        print(f"  thread seconds: {result['thread_seconds']}")
+    return results
+
+
+def compare(results, baseline):
+    """Print the change of the main figures against a previous results file"""
+    previous = {r['users']: r for r in baseline['results']}
+    print(f"\nCompared with {baseline.get('commit')} ({baseline.get('timestamp')}):")
+    for result in results:
+        old = previous.get(result['users'])
+        if not old:
+            continue
+        for key in ('users_per_second', 'requests_total', 'peak_rss_bytes'):
+            if old.get(key) and result.get(key) is not None:
+                print(f"  {result['users']:>6} users  {key:<17} {old[key]:>14} -> {result[key]:>14} "
+                      f"({(result[key] / old[key] - 1) * 100:+.1f}%)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the collection pipeline against the mock server")
+    parser.add_argument('--scales', type=int, nargs='+', default=[100, 1000, 10000], help="numbers of users")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="results file of an earlier commit to compare with")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds the mock server adds per request")
+    parser.add_argument('--server-rate-limit', type=int, help="requests per minute before the mock server answers 429")
+    parser.add_argument('--real-rate-limits', action='store_true', help="keep RATE_LIMITS from config.py")
+    parser.add_argument('--child', nargs=2, metavar=('USERS', 'RESULT_FILE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_scale(int(args.child[0]), args.child[1], args.real_rate_limits)
+        sys.exit()
+
+    results = benchmark(args.scales, args.latency, args.server_rate_limit, args.real_rate_limits)
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'latency': args.latency,
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            compare(results, json.load(f))
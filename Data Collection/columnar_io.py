@@ -0,0 +1,203 @@
+import os
+import shutil
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from config import PARQUET_ROW_GROUP_SIZE, PARQUET_COMPRESSION
+
+#this file contains the columnar (Parquet) output backend
+#records are buffered and written as typed row groups, repeated strings (DIDs, handles)
+#are dictionary-encoded so every value is stored once per row group
+#a Parquet file is only readable once closed, so every row group is written as a finished part
+#file in a .parts directory (readable as a dataset if the run is interrupted), and the parts are
+#joined into the output file on close
+
+# Repeated strings: DIDs, handles, display names
+DICT_STRING = pa.dictionary(pa.int32(), pa.string())
+
+SCHEMAS = {
+    'profiles': pa.schema([
+        ('user_id', pa.string()),
+        ('username', pa.string()),
+        ('display_name', pa.string()),
+        ('description', pa.string()),
+        ('created_at', pa.string()),
+        ('followers_count', pa.int64()),
+        ('following_count', pa.int64()),
+        ('posts_count_total', pa.int64()),
+        ('posts_count_timeframe', pa.int64()),
+        ('reposts_count_total', pa.int64()),
+        ('reposts_count_timeframe', pa.int64()),
+        ('likes_given_count', pa.int64()),
+        ('posting_frequency_total', pa.float64()),
+        ('posting_frequency_timeframe', pa.float64()),
+        ('total_likes_received', pa.int64()),
+        ('total_reposts_received', pa.int64()),
+        ('total_replies_received', pa.int64()),
+        ('timeframe_likes_received', pa.int64()),
+        ('timeframe_reposts_received', pa.int64()),
+        ('timeframe_replies_received', pa.int64()),
+        ('avg_likes_per_post', pa.float64()),
+        ('avg_reposts_per_post', pa.float64()),
+        ('avg_replies_per_post', pa.float64()),
+        ('data_collected_at', pa.string()),
+    ]),
+    'users_data': pa.schema([
+        ('did', pa.string()),
+        ('handle', pa.string()),
+        ('display_name', pa.string()),
+        ('description', pa.string()),
+        ('followers_count', pa.int64()),
+        ('following_count', pa.int64()),
+        ('posts_count', pa.int64()),
+        ('created_at', pa.string()),
+        ('followers_collected', pa.int64()),
+        ('following_collected', pa.int64()),
+    ]),
+    'followers': pa.schema([
+        ('user_did', DICT_STRING),
+        ('user_handle', DICT_STRING),
+        ('follower_did', DICT_STRING),
+        ('follower_handle', DICT_STRING),
+        ('follower_display_name', DICT_STRING),
+    ]),
+    'following': pa.schema([
+        ('user_did', DICT_STRING),
+        ('user_handle', DICT_STRING),
+        ('following_did', DICT_STRING),
+        ('following_handle', DICT_STRING),
+        ('following_display_name', DICT_STRING),
+    ]),
+    'posts': pa.schema([
+        ('uri', pa.string()),
+        ('cid', pa.string()),
+        ('text', pa.string()),
+        ('created_at', pa.string()),
+        ('created_at_us', pa.int64()),
+        ('author_did', DICT_STRING),
+        ('author_handle', DICT_STRING),
+        ('like_count', pa.int32()),
+        ('repost_count', pa.int32()),
+        ('reply_count', pa.int32()),
+        ('in_timeframe', pa.bool_()),
+    ]),
+    'reposts': pa.schema([
+        ('repost_by', DICT_STRING),
+        ('repost_by_handle', DICT_STRING),
+        ('original_uri', pa.string()),
+        ('original_cid', pa.string()),
+        ('original_author_did', DICT_STRING),
+        ('original_author_handle', DICT_STRING),
+        ('repost_time', pa.string()),
+        ('repost_time_us', pa.int64()),
+        ('in_timeframe', pa.bool_()),
+    ]),
+    'post_likes': pa.schema([
+        ('post_uri', DICT_STRING),
+        ('post_cid', DICT_STRING),
+        ('liker_did', DICT_STRING),
+        ('liker_handle', DICT_STRING),
+        ('liker_display_name', DICT_STRING),
+        ('created_at', pa.string()),
+    ]),
+    'post_reposts': pa.schema([
+        ('post_uri', DICT_STRING),
+        ('post_cid', DICT_STRING),
+        ('reposter_did', DICT_STRING),
+        ('reposter_handle', DICT_STRING),
+        ('reposter_display_name', DICT_STRING),
+    ]),
+    'likes_given': pa.schema([
+        ('user_did', DICT_STRING),
+        ('subject_uri', pa.string()),
+        ('created_at', pa.string()),
+        ('created_at_us', pa.int64()),
+    ]),
+}
+
+
+class ParquetSink:
+    """Parquet file written in row groups, same interface as sinks.JsonlSink"""
+
+    def __init__(self, path, schema, row_group_size=PARQUET_ROW_GROUP_SIZE, compression=PARQUET_COMPRESSION):
+        self.path = path
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.count = 0
+        self.rows = []
+        self.dropped = set()  # record keys missing from the schema, reported once
+        self.parts_dir = path + '.parts'
+        self.parts = []
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+        os.makedirs(self.parts_dir)
+        self.closed = False
+
+    def write(self, records):
+        self.rows.extend(records)
+        self.count += len(records)
+        if len(self.rows) >= self.row_group_size:
+            self.sync()
+
+    def _check_keys(self):
+        unknown = set().union(*(record.keys() for record in self.rows)) - set(self.schema.names) - self.dropped
+        if unknown:
+            print(f"Warning: {sorted(unknown)} not in the schema of {os.path.basename(self.path)}, "
+                  f"these fields are not written (add them to SCHEMAS in columnar_io.py)")
+            self.dropped |= unknown
+
+    def sync(self):
+        """Write the buffered records as a row group, in a finished part file"""
+        if self.rows:
+            self._check_keys()
+            part = os.path.join(self.parts_dir, f"part-{len(self.parts):05d}.parquet")
+            pq.write_table(pa.Table.from_pylist(self.rows, schema=self.schema), part + '.tmp',
+                           compression=self.compression, use_dictionary=True)
+            os.replace(part + '.tmp', part)
+            self.parts.append(part)
+            self.rows = []
+
+    def close(self):
+        """Join the parts into the output file"""
+        if self.closed:
+            return
+        self.sync()
+        with pq.ParquetWriter(self.path + '.tmp', self.schema, compression=self.compression, use_dictionary=True) as writer:
+            for part in self.parts:
+                writer.write_table(pq.read_table(part).cast(self.schema))
+        os.replace(self.path + '.tmp', self.path)
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+        self.closed = True
+
+
+def iter_parquet(path, columns=None, batch_size=PARQUET_ROW_GROUP_SIZE):
+    """Read a Parquet file one record at a time, decoding only `columns`"""
+    if not os.path.exists(path):
+        return
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield from batch.to_pylist()
+
+
+def parquet_to_csv(parquet_file, csv_file):
+    """Convert a Parquet file to CSV format one row group at a time"""
+    try:
+        source = pq.ParquetFile(parquet_file)
+        if source.metadata.num_rows == 0:
+            print(f"No data in {parquet_file}, skipping conversion")
+            return False
+
+        # Dictionary columns are written as plain strings
+        schema = pa.schema([
+            pa.field(field.name, field.type.value_type if pa.types.is_dictionary(field.type) else field.type)
+            for field in source.schema_arrow
+        ])
+        with pa_csv.CSVWriter(csv_file, schema) as writer:
+            for batch in source.iter_batches():
+                writer.write_table(pa.Table.from_batches([batch]).cast(schema))
+        print(f"Successfully converted {parquet_file} to {csv_file}")
+        return True
+
+    except Exception as e:
+        print(f"Error converting {parquet_file}: {e}")
+        return False
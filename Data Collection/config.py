@@ -1,5 +1,5 @@
 import os
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 
 # Configuration constants
 OUTPUT_DIR = './users'
@@ -7,11 +7,88 @@ CSV_DIR = './users/csv'
 START_DATE = datetime(2024, 2, 1, tzinfo=timezone.utc)
 END_DATE = datetime(2025, 2, 1, tzinfo=timezone.utc)
 MAX_USERS = 500
+CONCURRENCY = 16  # Users collected at the same time
+PROFILE_BATCH_SIZE = 25  # Max actors per getProfiles request
+PROFILE_WORKERS = 4  # getProfiles requests running at the same time
+FOLLOWS_LIMIT = 2000  # Max followers / following collected per user
+POSTS_LIMIT = 1000  # Max author feed items collected per user
+LIKES_LIMIT = 1000  # Max likes given collected per user (inside the author feed window)
+
+# User discovery: sources paged at the same time, post search queries, and retries of a
+# source after network or server errors before it is dropped
+DISCOVERY_WORKERS = 8
+DISCOVERY_QUERIES = ['news', 'update', 'today', 'like', 'follow', 'tech', 'art', 'music']
+DISCOVERY_MAX_RETRIES = 4
+
+# Post interactions: posts harvested at the same time, and max likes / reposts collected per post
+INTERACTIONS_CONCURRENCY = 32
+INTERACTIONS_BUDGET = 1000
+
+# Author feed window: items after END_DATE are skipped and paging stops at the first one
+# older than the window start (END_DATE - LOOKBACK_DAYS, or START_DATE when it is None).
+# FULL_HISTORY = True collects the whole feed and only tags items with in_timeframe
+FULL_HISTORY = False
+LOOKBACK_DAYS = None
+POSTS_WINDOW = None if FULL_HISTORY else (
+    START_DATE if LOOKBACK_DAYS is None else END_DATE - timedelta(days=LOOKBACK_DAYS),
+    END_DATE
+)
+
+# API server, None for the real one. Set BSKY_BASE_URL to the address of mock_server.py
+# to run the collector offline
+BSKY_BASE_URL = os.environ.get('BSKY_BASE_URL')
+# When set, every API response is appended to this file, mock_server.py --replay serves them back
+RECORD_FILE = os.environ.get('BSKY_RECORD_FILE')
 
 # Bluesky credentials (should use environment variables in production)
 BSKY_USERNAME = 'yourname.bsky.social'
 BSKY_PASSWORD = 'yourpassword'
 
+# Crawl progress and collected records, used to resume interrupted runs
+CRAWL_DB = os.path.join(OUTPUT_DIR, 'crawl_state.sqlite')
+# 'full' collects (or resumes) everything, 'delta' refreshes the users of the crawl store
+# with the posts, followers and follows that appeared since the previous run
+CRAWL_MODE = 'full'
+
+# Output files: 'parquet' (typed, compressed, read directly by the classification scripts)
+# or 'jsonl'. CSV copies of every file are written when WRITE_CSV is set
+OUTPUT_FORMAT = 'parquet'
+WRITE_CSV = True
+PARQUET_ROW_GROUP_SIZE = 50000
+PARQUET_COMPRESSION = 'zstd'
+
+# Streaming output: write buffer per file and how often buffered records are fsynced (seconds)
+# Follows are saved as a compact integer graph (see graph_store.py), the per-edge
+# followers/following files repeating handles and display names only when this is True
+WRITE_EDGE_FILES = False
+SINK_BUFFER_BYTES = 1024 * 1024
+SINK_FSYNC_INTERVAL = 30
+
+# Saved login session, reused across runs so we do not log in every time. It holds the session
+# tokens, so it lives in the user's config directory (BSKY_SESSION_FILE overrides it), away from
+# the data files that get copied and shared, and only the owner can read it. Each server and
+# account gets its own file (SESSION_FILE-<key>, see auth.session_path)
+SESSION_FILE = os.environ.get('BSKY_SESSION_FILE') or os.path.join(
+    os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config'), 'bsky_collector', 'session'
+)
+
+# Requests per second and burst size for each endpoint family (see rate_limiter.py).
+# These are starting values, the RateLimit-* headers sent by the server adjust them at runtime
+RATE_LIMITS = {
+    'auth': (0.1, 3),
+    'actor': (10, 20),
+    'graph': (10, 20),
+    'feed': (10, 20),
+    'repo': (10, 20),
+    'default': (5, 10),
+}
+MAX_RATE_LIMIT_RETRIES = 5
+
+# Live metrics of the run (see metrics.py): Prometheus text on http://127.0.0.1:<port>/metrics
+# and a JSON summary line printed every METRICS_LOG_INTERVAL seconds. None disables either
+METRICS_PORT = 9108
+METRICS_LOG_INTERVAL = 60
+
 # Ensure output directories exist
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(CSV_DIR, exist_ok=True)
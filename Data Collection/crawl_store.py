@@ -0,0 +1,213 @@
+import json
+import sqlite3
+import threading
+import numpy as np
+from datetime import datetime, timezone
+from config import CRAWL_DB
+from utils import parse_datetime, parse_timestamps
+
+#this file contains the crawl state store used to resume interrupted runs
+#every page of data is saved together with the cursor of the next page in one transaction,
+#so a restarted run continues exactly where the previous one stopped
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    position INTEGER PRIMARY KEY,
+    did TEXT NOT NULL UNIQUE,
+    handle TEXT
+);
+CREATE TABLE IF NOT EXISTS progress (
+    key TEXT NOT NULL,          -- user DID, or post URI for post interactions
+    endpoint TEXT NOT NULL,
+    cursor TEXT,
+    done INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT,
+    PRIMARY KEY (key, endpoint)
+);
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL,
+    entity TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_key_entity ON records (key, entity);
+CREATE TABLE IF NOT EXISTS watermarks (
+    key TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    value TEXT,                 -- newest timestamp already collected
+    PRIMARY KEY (key, endpoint)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Endpoints refreshed by a delta run
+DELTA_ENDPOINTS = ['followers', 'following', 'posts', 'likes_given', 'user']
+# Endpoints paged until the newest item of the previous run, with the entities and time column
+# of their items. The author feed is ordered by when an item entered it, the repost time for reposts
+WATERMARK_ENDPOINTS = {
+    'posts': [('posts', 'created_at'), ('reposts', 'repost_time')],
+    'likes_given': [('likes_given', 'created_at')],
+}
+
+
+class CrawlStore:
+    """SQLite (WAL mode) store of crawl progress and collected records"""
+
+    def __init__(self, path=CRAWL_DB):
+        self.path = path
+        # One connection shared by the crawler threads, access is serialised with a lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    # - - - - - - - - - - - - - - - - USERS TO CRAWL - - - - - - - - - - - - - - - - - - - - -
+
+    def save_users(self, users):
+        """Remember the discovered users so a restarted run crawls the same ones"""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO users (did, handle) VALUES (?, ?)", users
+            )
+
+    def load_users(self):
+        with self.lock:
+            return self.conn.execute("SELECT did, handle FROM users ORDER BY position").fetchall()
+
+    # - - - - - - - - - - - - - - - - PROGRESS - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def _progress(self, key, endpoint):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT cursor, done FROM progress WHERE key = ? AND endpoint = ?", (key, endpoint)
+            ).fetchone()
+
+    def is_done(self, key, endpoint):
+        row = self._progress(key, endpoint)
+        return bool(row and row[1])
+
+    def get_cursor(self, key, endpoint):
+        """Cursor of the next page to fetch, None if the endpoint was never started"""
+        row = self._progress(key, endpoint)
+        return row[0] if row else None
+
+    def save_page(self, key, endpoint, page, cursor, done=False):
+        """Save one page of records ({entity: [records]}) and the cursor to continue from"""
+        with self.lock, self.conn:
+            for entity, records in page.items():
+                self.conn.executemany(
+                    "INSERT INTO records (key, entity, data) VALUES (?, ?, ?)",
+                    [(key, entity, json.dumps(record, ensure_ascii=False)) for record in records]
+                )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO progress (key, endpoint, cursor, done, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (key, endpoint, cursor, int(done), datetime.now(timezone.utc).isoformat())
+            )
+
+    def mark_done(self, key, endpoint):
+        self.save_page(key, endpoint, {}, None, done=True)
+
+    def count_done(self, endpoint):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM progress WHERE endpoint = ? AND done = 1", (endpoint,)
+            ).fetchone()[0]
+
+    # - - - - - - - - - - - - - - - - DELTA RUNS - - - - - - - - - - - - - - - - - - - - - - -
+
+    def _meta(self, name):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, name, value):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+    def in_delta_run(self):
+        return self._meta('delta_run') == 'running'
+
+    def begin_delta_run(self):
+        """Re-open finished users so only their new activity is fetched.
+
+        The newest post and like times of every user are saved as watermarks first, the
+        author feed and like records are paged until they reach them. An interrupted delta
+        run is resumed as is.
+        """
+        if self.in_delta_run():
+            print("Resuming interrupted delta run")
+            return
+
+        dids = [did for did, _ in self.load_users() if self.is_done(did, 'user')]
+        for did in dids:
+            watermarks = []
+            for endpoint, sources in WATERMARK_ENDPOINTS.items():
+                times = []
+                for entity, column in sources:
+                    # Parsed once by the collector, older records only have the string
+                    records = self.load_records(did, entity)
+                    parsed = parse_timestamps([r.get(column) for r in records])
+                    stored = [i for i, r in enumerate(records) if r.get(column + '_us') is not None]
+                    parsed[stored] = np.array([records[i][column + '_us'] for i in stored], dtype='datetime64[us]')
+                    times.append(parsed)
+                times = np.concatenate(times)
+                times = times[~np.isnat(times)]
+                if len(times):
+                    newest = times.max().item().replace(tzinfo=timezone.utc)
+                    watermarks.append((did, endpoint, newest.isoformat()))
+            with self.lock, self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO watermarks (key, endpoint, value) VALUES (?, ?, ?)", watermarks
+                )
+                self.conn.executemany(
+                    "UPDATE progress SET done = 0, cursor = NULL WHERE key = ? AND endpoint = ?",
+                    [(did, endpoint) for endpoint in DELTA_ENDPOINTS]
+                )
+                # Marks the users this run re-opened, see abandon_delta_run
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO progress (key, endpoint, done) VALUES (?, 'delta', 0)", (did,)
+                )
+        self._set_meta('delta_run', 'running')
+        print(f"Delta run started for {len(dids)} users")
+
+    def end_delta_run(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM progress WHERE endpoint = 'delta'")
+        self._set_meta('delta_run', 'finished')
+
+    def abandon_delta_run(self):
+        """Close an interrupted delta run before a full run. The users it re-opened keep what
+        they have (earlier runs and the delta pages saved so far) and count as finished again"""
+        placeholders = ', '.join('?' * len(DELTA_ENDPOINTS))
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"UPDATE progress SET done = 1, cursor = NULL WHERE endpoint IN ({placeholders}) "
+                "AND key IN (SELECT key FROM progress WHERE endpoint = 'delta')", DELTA_ENDPOINTS
+            )
+            self.conn.execute("DELETE FROM progress WHERE endpoint = 'delta'")
+        self._set_meta('delta_run', 'abandoned')
+
+    def get_watermark(self, key, endpoint):
+        """Newest timestamp collected before this delta run, None if there is none"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM watermarks WHERE key = ? AND endpoint = ?", (key, endpoint)
+            ).fetchone()
+        return parse_datetime(row[0]) if row and row[0] else None
+
+    # - - - - - - - - - - - - - - - - RECORDS - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def load_records(self, key, entity):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT data FROM records WHERE key = ? AND entity = ? ORDER BY id", (key, entity)
+            ).fetchall()
+        return [json.loads(data) for (data,) in rows]
@@ -0,0 +1,139 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from config import CONCURRENCY, FOLLOWS_LIMIT, POSTS_LIMIT, LIKES_LIMIT, CRAWL_MODE
+from data_collector import get_user_info, get_users_info, get_user_following, get_user_followers, get_all_user_posts, get_user_likes_given
+from data_processor import create_comprehensive_user_profile
+
+#this file contains the concurrent collection engine used by main.py
+#the collector functions are blocking (atproto Client is synchronous), so each one
+#runs in a worker thread and asyncio only schedules them, many users at a time
+#progress is saved page by page in the crawl store (crawl_store.py), finished work is never fetched again
+#in a delta run (CRAWL_MODE = 'delta') finished users are refreshed with their new activity only
+
+
+def delta_arguments(store, did, endpoint):
+    """What a delta run already has for this endpoint, so the collector only fetches new items"""
+    if endpoint == 'posts':
+        return {
+            'since': store.get_watermark(did, 'posts'),
+            'known': {r['original_uri'] for r in store.load_records(did, 'reposts')},
+        }
+    if endpoint == 'likes_given':
+        return {'since': store.get_watermark(did, 'likes_given')}
+    if endpoint == 'followers':
+        return {'known': {r['follower_did'] for r in store.load_records(did, 'followers')}}
+    if endpoint == 'following':
+        return {'known': {r['following_did'] for r in store.load_records(did, 'following')}}
+    return {}
+
+
+def resume_endpoint(store, key, label, endpoint, entities, fetch, limit=None):
+    """Fetch one endpoint of a user (key=did, label=handle) or a post (key=uri, label=cid),
+    continuing from the stored cursor. Returns {entity: records}"""
+    if not store.is_done(key, endpoint):
+
+        def save_page(page, cursor, done):
+            store.save_page(key, endpoint, page, cursor, done)
+
+        kwargs = {'cursor': store.get_cursor(key, endpoint), 'on_page': save_page}
+        if CRAWL_MODE == 'delta' and store.in_delta_run():
+            # New items are appended to the ones of earlier runs, `limit` applies to the new ones
+            kwargs.update(delta_arguments(store, key, endpoint))
+            if limit is not None:
+                kwargs['limit'] = limit
+        elif limit is not None:
+            already_collected = sum(len(store.load_records(key, entity)) for entity in entities)
+            kwargs['limit'] = limit - already_collected
+        fetch(key, label, **kwargs)
+
+    # The store holds the pages of earlier runs as well as the ones just fetched
+    return {entity: store.load_records(key, entity) for entity in entities}
+
+
+async def collect_user(client, store, did, handle, user_info=None):
+    """Collect profile, connections and posts of one user, fetching the endpoints at the same time"""
+
+    if store.is_done(did, 'profile'):
+        user_info = store.load_records(did, 'user_info')[0]
+    else:
+        # Profiles are normally hydrated in batches beforehand, fall back to a single request
+        if user_info is None:
+            user_info = await asyncio.to_thread(get_user_info, client, did, handle)
+        store.save_page(did, 'profile', {'user_info': [user_info]}, None, done=True)
+
+    followers, following, posts, likes_given = await asyncio.gather(
+        asyncio.to_thread(resume_endpoint, store, did, handle, 'followers', ['followers'], get_user_followers, FOLLOWS_LIMIT),
+        asyncio.to_thread(resume_endpoint, store, did, handle, 'following', ['following'], get_user_following, FOLLOWS_LIMIT),
+        asyncio.to_thread(resume_endpoint, store, did, handle, 'posts', ['posts', 'reposts'], get_all_user_posts, POSTS_LIMIT),
+        asyncio.to_thread(resume_endpoint, store, did, handle, 'likes_given', ['likes_given'], get_user_likes_given, LIKES_LIMIT),
+    )
+    user_followers = followers['followers']
+    user_following = following['following']
+    user_posts, user_reposts = posts['posts'], posts['reposts']
+    user_likes_given = likes_given['likes_given']
+
+    comprehensive_profile = create_comprehensive_user_profile(
+        user_info, user_posts, user_reposts, user_likes_given,
+        user_followers, user_following
+    )
+
+    # The user only counts as finished when every endpoint completed
+    if all(store.is_done(did, endpoint) for endpoint in ('followers', 'following', 'posts', 'likes_given')):
+        store.mark_done(did, 'user')
+
+    return {
+        'did': did,
+        'handle': handle,
+        'user_info': user_info,
+        'followers': user_followers,
+        'following': user_following,
+        'posts': user_posts,
+        'reposts': user_reposts,
+        'likes_given': user_likes_given,
+        'profile': comprehensive_profile,
+    }
+
+
+async def crawl_users(client, store, users, concurrency=CONCURRENCY, on_user_done=None):
+    """Collect all users with at most `concurrency` users in flight.
+
+    `on_user_done(done_count, result)` is called as each user finishes successfully, in
+    completion order. Results are not kept, so memory only holds the users in flight.
+    Returns the number of users collected.
+    """
+    # Every user can have up to 4 endpoint calls running at the same time
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency * 4))
+
+    # Basic profiles for everybody not collected yet, 25 per request
+    pending_profiles = [(did, handle) for did, handle in users if not store.is_done(did, 'profile')]
+    users_info = await asyncio.to_thread(get_users_info, pending_profiles) if pending_profiles else {}
+
+    semaphore = asyncio.Semaphore(concurrency)
+    done_count = 0
+
+    async def worker(idx, did, handle):
+        nonlocal done_count
+        async with semaphore:
+            if store.is_done(did, 'user'):
+                print(f"Loading finished user {idx+1}/{len(users)}: {handle}")
+            else:
+                print(f"Processing user {idx+1}/{len(users)}: {handle}")
+            try:
+                result = await collect_user(client, store, did, handle, users_info.get(did))
+                print(f"? Created comprehensive profile for {handle}")
+            except Exception as e:
+                print(f"? Error processing user {handle}: {e}")
+                return
+        done_count += 1
+        if on_user_done:
+            on_user_done(done_count, result)
+
+    await asyncio.gather(*(worker(idx, did, handle) for idx, (did, handle) in enumerate(users)))
+
+    return done_count
+
+
+def run_crawl(client, store, users, concurrency=CONCURRENCY, on_user_done=None):
+    """Blocking entry point for the concurrent crawl"""
+    return asyncio.run(crawl_users(client, store, users, concurrency, on_user_done))
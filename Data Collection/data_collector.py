@@ -1,13 +1,10 @@
-import time
-from auth import authenticate_client
-from utils import parse_datetime, START_DATE, END_DATE
+from concurrent.futures import ThreadPoolExecutor
+from auth import get_client
+from utils import parse_datetime, to_epoch_us
+from config import START_DATE, END_DATE, PROFILE_BATCH_SIZE, PROFILE_WORKERS, FOLLOWS_LIMIT, POSTS_LIMIT, POSTS_WINDOW, LIKES_LIMIT, INTERACTIONS_BUDGET
 
-def get_user_info (client, did, handle):
-    # MAKE IT A FUNCTION LATER
-    #access user profile through API
-    user_profile = client.app.bsky.actor.get_profile({'actor': did})
-    
-    # get basic user info thorugh API
+def profile_to_user_info(user_profile, did, handle):
+    """Build the basic user info dict from a profile returned by the API"""
     user_info = {
         'did': did,
         'handle': handle,
@@ -21,14 +18,57 @@ def get_user_info (client, did, handle):
     return user_info
 
 
-def get_user_following(did, handle):
-    """Get following for a user with increased limits, returning formatted data"""
+def get_user_info (client, did, handle):
+    #access user profile through API
+    user_profile = client.app.bsky.actor.get_profile({'actor': did})
     
-    client = authenticate_client()
+    # get basic user info thorugh API
+    return profile_to_user_info(user_profile, did, handle)
+
+
+def get_users_info(users, batch_size=PROFILE_BATCH_SIZE, max_workers=PROFILE_WORKERS):
+    """Get basic info for many users with getProfiles, `batch_size` actors per request.
+
+    Returns a dict did -> user_info. Accounts the API did not return (deleted,
+    suspended...) are missing from the result.
+    """
+    client = get_client()  # Shared authenticated client
+    handles = dict(users)
+    dids = list(handles)
+    batches = [dids[i:i + batch_size] for i in range(0, len(dids), batch_size)]
+
+    def fetch_batch(batch):
+        try:
+            response = client.app.bsky.actor.get_profiles({'actors': batch})
+            return response.profiles
+        except Exception as e:
+            print(f"Error getting profiles batch starting at {batch[0]}: {e}")
+            return []
+
+    users_info = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for profiles in pool.map(fetch_batch, batches):
+            for user_profile in profiles:
+                if user_profile.did in handles:
+                    users_info[user_profile.did] = profile_to_user_info(user_profile, user_profile.did, handles[user_profile.did])
+
+    print(f"Retrieved {len(users_info)}/{len(dids)} profiles in {len(batches)} requests")
+    return users_info
+
+
+def get_user_following(did, handle, cursor=None, on_page=None, limit=FOLLOWS_LIMIT, known=None):
+    """Get following for a user with increased limits, returning formatted data.
+
+    Starts from `cursor` when resuming. `on_page(page, next_cursor, done)` is called
+    after every page so the caller can save progress. With `known` (DIDs collected in an
+    earlier run) only new follows are returned: the list is newest first, so paging stops
+    at the first known one.
+    """
+    
+    client = get_client()  # Shared authenticated client
     following = []  # This will store the formatted data
     
     try:
-        cursor = None
         while True:
             print(f"Getting following for {handle} (cursor: {cursor})")
             following_page = client.app.bsky.graph.get_follows({
@@ -38,26 +78,33 @@ def get_user_following(did, handle):
             })
             
             # Format each follow immediately with user context
+            page = []
+            reached_known = False
             for follow in following_page.follows:
-                following.append({
+                if known and follow.did in known:
+                    reached_known = True
+                    continue
+                page.append({
                     'user_did': did,
                     'user_handle': handle,
                     'following_did': follow.did,
                     'following_handle': follow.handle,
                     'following_display_name': follow.display_name if hasattr(follow, 'display_name') else None
                 })
+            following.extend(page)
             
             print(f"Retrieved {len(following_page.follows)} following, total: {len(following)}")
             
             cursor = following_page.cursor
-            if not cursor:
-                break
-                
-            time.sleep(0.5)  # Rate limiting
-            
             # For very large accounts, limit to 2000 following to avoid excessive API calls
-            if len(following) >= 2000:
-                print(f"Reached 2000 following limit for {handle}, stopping collection")
+            reached_limit = len(following) >= limit
+            if on_page:
+                on_page({'following': page}, cursor, not cursor or reached_limit or reached_known)
+            if not cursor or reached_known:
+                break
+
+            if reached_limit:
+                print(f"Reached {limit} following limit for {handle}, stopping collection")
                 break
     except Exception as e:
         print(f"Error getting following for {handle}: {e}")
@@ -65,14 +112,17 @@ def get_user_following(did, handle):
     return following
 
 
-def get_user_followers(did, handle):
-    """Get followers for a user with increased limits, returning formatted data"""
+def get_user_followers(did, handle, cursor=None, on_page=None, limit=FOLLOWS_LIMIT, known=None):
+    """Get followers for a user with increased limits, returning formatted data.
+
+    Resumes from `cursor`, reports each page to `on_page` and stops at `known` DIDs
+    like get_user_following.
+    """
     
-    client = authenticate_client()
+    client = get_client()  # Shared authenticated client
     followers = []  # This will store the formatted data
     
     try:
-        cursor = None
         while True:
             print(f"Getting followers for {handle} (cursor: {cursor})")
             followers_page = client.app.bsky.graph.get_followers({
@@ -82,25 +132,32 @@ def get_user_followers(did, handle):
             })
             
             # Format each follower immediately with user context
+            page = []
+            reached_known = False
             for follower in followers_page.followers:
-                followers.append({
+                if known and follower.did in known:
+                    reached_known = True
+                    continue
+                page.append({
                     'user_did': did,
                     'user_handle': handle,
                     'follower_did': follower.did,
                     'follower_handle': follower.handle,
                     'follower_display_name': follower.display_name if hasattr(follower, 'display_name') else None
                 })
+            followers.extend(page)
             
             print(f"Retrieved {len(followers_page.followers)} followers, total: {len(followers)}")
             
             cursor = followers_page.cursor
-            if not cursor:
+            reached_limit = len(followers) >= limit
+            if on_page:
+                on_page({'followers': page}, cursor, not cursor or reached_limit or reached_known)
+            if not cursor or reached_known:
                 break
-                
-            time.sleep(0.5)
-            
-            if len(followers) >= 2000:
-                print(f"Reached 2000 followers limit for {handle}, stopping collection")
+
+            if reached_limit:
+                print(f"Reached {limit} followers limit for {handle}, stopping collection")
                 break
                 
     except Exception as e:
@@ -108,17 +165,23 @@ def get_user_followers(did, handle):
     
     return followers
 
-def get_all_user_posts(did, handle):
-    """Get ALL posts by a user (not just within timeframe) for comprehensive analysis"""
+def get_all_user_posts(did, handle, cursor=None, on_page=None, limit=POSTS_LIMIT, since=None, known=None, window=POSTS_WINDOW):
+    """Get the posts and reposts of a user for comprehensive analysis.
+
+    With `window` (start, end) only items inside it are kept and paging stops at the first
+    item older than its start, the feed being newest first. `window=None` collects the
+    whole history. Resumes from `cursor` and reports each page to `on_page` like
+    get_user_following. With `since` (newest post time collected in an earlier run) only
+    newer items are returned and paging stops once the feed reaches it, or reaches a
+    repost of a URI in `known`.
+    """
 
-    client = authenticate_client()  # Get the authenticated client
+    client = get_client()  # Shared authenticated client
 
     posts = []
     reposts = []
     
     try:
-        cursor = None
-        
         while True:
             print(f"Getting all posts for {handle} (cursor: {cursor})")
             feed = client.app.bsky.feed.get_author_feed({
@@ -129,7 +192,14 @@ def get_all_user_posts(did, handle):
             
             if not feed.feed:
                 print("No posts found.")
+                if on_page:
+                    on_page({}, None, True)
                 break
+
+            # Where this page starts, to report only its own items
+            page_posts_start, page_reposts_start = len(posts), len(reposts)
+            reached_seen = False
+            reached_window_start = False
                 
             for item in feed.feed:
                 try:
@@ -146,6 +216,18 @@ def get_all_user_posts(did, handle):
                     if not post_datetime:
                         print(f"Could not determine post date, skipping")
                         continue
+
+                    # Time the item entered the feed (reposts are ordered by when they were reposted)
+                    reason = getattr(item, 'reason', None)
+                    feed_datetime = parse_datetime(reason.indexed_at) if getattr(reason, 'indexed_at', None) else post_datetime
+
+                    # Outside the collection window
+                    if window:
+                        if feed_datetime < window[0]:
+                            reached_window_start = True
+                            break
+                        if feed_datetime > window[1]:
+                            continue
                     
                     # Check if it's a repost or a regular post
                     is_repost = False
@@ -157,11 +239,17 @@ def get_all_user_posts(did, handle):
                             # Different possible structures for reason
                             if hasattr(item.reason, '$type'):
                                 reason_type = getattr(item.reason, '$type')
+                            elif hasattr(item.reason, 'py_type'):
+                                reason_type = item.reason.py_type  # atproto models
                             elif hasattr(item.reason, 'type'):
                                 reason_type = item.reason.type
                                 
                             if reason_type == 'app.bsky.feed.defs#reasonRepost':
                                 is_repost = True
+                                # Already collected in an earlier run, and so is everything older
+                                if (known and post.uri in known) or (since and feed_datetime <= since):
+                                    reached_seen = True
+                                    continue
                                 repost_info = {
                                     'repost_by': did,
                                     'repost_by_handle': handle,
@@ -169,8 +257,10 @@ def get_all_user_posts(did, handle):
                                     'original_cid': post.cid,
                                     'original_author_did': post.author.did,
                                     'original_author_handle': post.author.handle,
-                                    'repost_time': post_datetime.isoformat(),
-                                    'in_timeframe': START_DATE <= post_datetime <= END_DATE
+                                    # When it was reposted, not when the original was posted
+                                    'repost_time': feed_datetime.isoformat(),
+                                    'repost_time_us': to_epoch_us(feed_datetime),
+                                    'in_timeframe': START_DATE <= feed_datetime <= END_DATE
                                 }
                                 reposts.append(repost_info)
                         except Exception as e:
@@ -178,11 +268,16 @@ def get_all_user_posts(did, handle):
                     
                     # For regular posts
                     if not is_repost:
+                        # Already collected in an earlier run, the feed is newest first
+                        if since and post_datetime <= since:
+                            reached_seen = True
+                            continue
                         post_info = {
                             'uri': post.uri,
                             'cid': post.cid,
                             'text': post.record.text if hasattr(post.record, 'text') else '',
                             'created_at': post_datetime.isoformat(),
+                            'created_at_us': to_epoch_us(post_datetime),
                             'author_did': did,
                             'author_handle': handle,
                             'like_count': post.like_count if hasattr(post, 'like_count') else 0,
@@ -195,14 +290,24 @@ def get_all_user_posts(did, handle):
                     print(f"Error processing post item: {e}")
             
             cursor = feed.cursor
+            # Limit total posts per user to avoid excessive data
+            reached_limit = len(posts) + len(reposts) >= limit
+            if on_page:
+                page = {'posts': posts[page_posts_start:], 'reposts': reposts[page_reposts_start:]}
+                on_page(page, cursor, not cursor or reached_limit or reached_seen or reached_window_start)
             if not cursor:
                 break
-                
-            time.sleep(0.5)  # Rate limiting
-            
-            # Limit total posts per user to avoid excessive data
-            if len(posts) + len(reposts) >= 1000:
-                print(f"Reached 1000 posts limit for {handle}, stopping collection")
+
+            if reached_window_start:
+                print(f"Reached the start of the collection window for {handle}, stopping collection")
+                break
+
+            if reached_seen:
+                print(f"Reached already collected posts for {handle}, stopping collection")
+                break
+
+            if reached_limit:
+                print(f"Reached {limit} posts limit for {handle}, stopping collection")
                 break
             
     except Exception as e:
@@ -211,69 +316,136 @@ def get_all_user_posts(did, handle):
     print(f"Found {len(posts)} posts and {len(reposts)} reposts for {handle}")
     return posts, reposts
 
-def get_user_likes_given(did, handle):
-    """Get likes given by a user - Note: This might be limited by API availability"""
+def get_user_likes_given(did, handle, cursor=None, on_page=None, limit=LIKES_LIMIT, since=None, window=POSTS_WINDOW):
+    """Get the likes given by a user from the like records of their repository.
+
+    Records are listed newest first, 100 per request: likes after the window end are
+    skipped and paging stops at the first one older than its start (or than `since`, the
+    newest like collected in an earlier run). Only the liked post and the time are kept.
+    Resumes from `cursor` and reports each page to `on_page` like get_user_following.
+    """
+
+    client = get_client()  # Shared authenticated client
     likes_given = []
-    
-    # Note: Bluesky API might not provide a direct way to get all likes by a user
-    # This is a placeholder for future implementation if the API supports it
-    print(f"Getting likes given by {handle} - Limited by API capabilities")
-    
-    # For now, we'll return empty list and calculate from other sources
+
+    try:
+        while True:
+            response = client.com.atproto.repo.list_records({
+                'repo': did,
+                'collection': 'app.bsky.feed.like',
+                'limit': 100,
+                'cursor': cursor
+            })
+
+            page = []
+            reached_end = False
+            for record in response.records:
+                subject = getattr(record.value, 'subject', None)
+                created_at = getattr(record.value, 'created_at', None)
+                if subject is None or not created_at:
+                    continue
+                like_datetime = parse_datetime(created_at)
+                if (window and like_datetime < window[0]) or (since and like_datetime <= since):
+                    reached_end = True
+                    break
+                if window and like_datetime > window[1]:
+                    continue
+                page.append({
+                    'user_did': did,
+                    'subject_uri': subject.uri,
+                    'created_at': like_datetime.isoformat(),
+                    'created_at_us': to_epoch_us(like_datetime),
+                })
+            likes_given.extend(page)
+
+            cursor = response.cursor
+            reached_limit = len(likes_given) >= limit
+            done = not cursor or reached_end or reached_limit or not response.records
+            if on_page:
+                on_page({'likes_given': page}, cursor, done)
+            if done:
+                break
+    except Exception as e:
+        print(f"Error getting likes given by {handle}: {e}")
+
+    print(f"Found {len(likes_given)} likes given by {handle}")
     return likes_given
 
 
 
-def get_post_interactions(post_uri, post_cid):
-    """Get likes and reposts for a specific post"""
+def get_post_likes(post_uri, post_cid, cursor=None, on_page=None, limit=INTERACTIONS_BUDGET):
+    """Get the likes of a post, paging until the end or `limit` likes.
 
-    client = authenticate_client()  # Get the authenticated client
+    Resumes from `cursor` and reports each page to `on_page` like get_user_following.
+    """
 
+    client = get_client()  # Shared authenticated client
     likes = []
-    reposts = []
-    
-    # Get likes
+
     try:
-        print(f"Getting likes for post {post_cid[:8]}...")
-        likes_response = client.app.bsky.feed.get_likes({
-            'uri': post_uri,
-            'limit': 100
-        })
-        
-        for like in likes_response.likes:
-            likes.append({
-                'post_uri': post_uri,
-                'post_cid': post_cid,
-                'liker_did': like.actor.did,
-                'liker_handle': like.actor.handle,
-                'liker_display_name': like.actor.display_name if hasattr(like.actor, 'display_name') else None,
-                'created_at': like.created_at if hasattr(like, 'created_at') else None
+        while True:
+            likes_response = client.app.bsky.feed.get_likes({
+                'uri': post_uri,
+                'limit': 100,
+                'cursor': cursor
             })
-            
-        print(f"Found {len(likes)} likes")
+
+            page = []
+            for like in likes_response.likes:
+                page.append({
+                    'post_uri': post_uri,
+                    'post_cid': post_cid,
+                    'liker_did': like.actor.did,
+                    'liker_handle': like.actor.handle,
+                    'liker_display_name': like.actor.display_name if hasattr(like.actor, 'display_name') else None,
+                    'created_at': like.created_at if hasattr(like, 'created_at') else None
+                })
+            likes.extend(page)
+
+            cursor = likes_response.cursor
+            reached_limit = len(likes) >= limit
+            if on_page:
+                on_page({'post_likes': page}, cursor, not cursor or reached_limit or not page)
+            if not cursor or reached_limit or not page:
+                break
     except Exception as e:
         print(f"Error getting likes for post {post_cid[:8]}: {e}")
-    
-    # Get reposts
+
+    return likes
+
+
+def get_post_reposts(post_uri, post_cid, cursor=None, on_page=None, limit=INTERACTIONS_BUDGET):
+    """Get the accounts that reposted a post, paging like get_post_likes"""
+
+    client = get_client()  # Shared authenticated client
+    reposts = []
+
     try:
-        print(f"Getting reposts for post {post_cid[:8]}...")
-        reposts_response = client.app.bsky.feed.get_reposted_by({
-            'uri': post_uri,
-            'limit': 100
-        })
-        
-        for repost in reposts_response.reposted_by:
-            reposts.append({
-                'post_uri': post_uri,
-                'post_cid': post_cid,
-                'reposter_did': repost.did,
-                'reposter_handle': repost.handle,
-                'reposter_display_name': repost.display_name if hasattr(repost, 'display_name') else None
+        while True:
+            reposts_response = client.app.bsky.feed.get_reposted_by({
+                'uri': post_uri,
+                'limit': 100,
+                'cursor': cursor
             })
-            
-        print(f"Found {len(reposts)} reposts")
+
+            page = []
+            for repost in reposts_response.reposted_by:
+                page.append({
+                    'post_uri': post_uri,
+                    'post_cid': post_cid,
+                    'reposter_did': repost.did,
+                    'reposter_handle': repost.handle,
+                    'reposter_display_name': repost.display_name if hasattr(repost, 'display_name') else None
+                })
+            reposts.extend(page)
+
+            cursor = reposts_response.cursor
+            reached_limit = len(reposts) >= limit
+            if on_page:
+                on_page({'post_reposts': page}, cursor, not cursor or reached_limit or not page)
+            if not cursor or reached_limit or not page:
+                break
     except Exception as e:
         print(f"Error getting reposts for post {post_cid[:8]}: {e}")
-        
-    return likes, reposts
 
+    return reposts
@@ -1,57 +1,268 @@
-from utils import calculate_posting_frequency
-import datetime
-from datetime import timezone
+import os
+import numpy as np
+import pandas as pd
+from utils import parse_timestamps, US_PER_DAY
+from datetime import datetime, timezone
+
+#this file contains the comprehensive profile builder
+#profiles are computed for many users at once from columnar posts, reposts and likes tables:
+#every attribute is a group-by reduction (np.bincount, np.minimum.at) over the user of each
+#row, so each table is scanned once whatever the number of users
+
+# Columns of a comprehensive profile, in output order
+PROFILE_COLUMNS = [
+    'user_id', 'username', 'display_name', 'description', 'created_at',
+    'followers_count', 'following_count',
+    'posts_count_total', 'posts_count_timeframe', 'reposts_count_total', 'reposts_count_timeframe',
+    'likes_given_count',
+    'posting_frequency_total', 'posting_frequency_timeframe',
+    'total_likes_received', 'total_reposts_received', 'total_replies_received',
+    'timeframe_likes_received', 'timeframe_reposts_received', 'timeframe_replies_received',
+    'avg_likes_per_post', 'avg_reposts_per_post', 'avg_replies_per_post',
+    'data_collected_at',
+]
+
+NO_TIME = np.iinfo(np.int64).max
+
+
+def _epoch_us(values, parsed=None):
+    """ISO timestamps to microseconds since the epoch, NO_TIME where missing or invalid.
+
+    `parsed` holds the times the collector already stored (created_at_us), only the rows
+    where it is missing are parsed.
+    """
+    if parsed is not None:
+        parsed = pd.Series(parsed, dtype='Int64')
+        missing = parsed.isna().to_numpy()
+        us = parsed.to_numpy(dtype=np.int64, na_value=NO_TIME)
+        if missing.any():
+            us[missing] = _epoch_us(np.asarray(values, dtype=object)[missing])
+        return us
+    us = parse_timestamps(values).view(np.int64).copy()
+    us[us == np.iinfo(np.int64).min] = NO_TIME
+    return us
+
+
+def _rows(table):
+    return len(next(iter(table.values()), [])) if isinstance(table, dict) else len(table)
+
+
+def _column(table, name, default=None):
+    """Column of a DataFrame or dict of lists as an array, `default` for missing values"""
+    if name not in table:
+        return np.full(_rows(table), default, dtype=object if default is None or isinstance(default, str) else None)
+    values = pd.Series(table[name], dtype=object if isinstance(table, dict) else None)
+    if default is not None:
+        values = values.fillna(default)
+    return values.to_numpy()
+
+
+def _posting_frequency(codes, times, n, since=None):
+    """Items per active day of every user: count / (days between first and last item + 1).
+
+    Items without a time only count when the user has some timed item, like the per-user
+    version did. `since` (per user, NO_TIME if unknown) moves the first day earlier.
+    """
+    counts = np.bincount(codes, minlength=n)
+    timed = times != NO_TIME
+    earliest = np.full(n, NO_TIME)
+    latest = np.full(n, np.iinfo(np.int64).min)
+    np.minimum.at(earliest, codes[timed], times[timed])
+    np.maximum.at(latest, codes[timed], times[timed])
+
+    has_times = np.bincount(codes[timed], minlength=n) > 0
+    if since is not None:
+        earliest = np.minimum(earliest, since)
+    days_active = np.where(has_times, (latest - earliest) // US_PER_DAY + 1, 1)
+    frequency = np.where(has_times & (days_active > 0), counts / np.maximum(days_active, 1), 0.0)
+    return frequency
+
+
+def user_codes(dids, table, column):
+    """Row in `dids` (a pd.Index) of the user of every record, and which records are of known users"""
+    if not _rows(table):
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=bool)
+    values = table[column]
+    if isinstance(values, pd.Series) and isinstance(values.dtype, pd.CategoricalDtype):
+        # Dictionary-encoded DIDs (Parquet): look up each distinct DID once
+        categories = np.append(dids.get_indexer(values.cat.categories), -1)
+        codes = categories[values.cat.codes.to_numpy()]
+    else:
+        codes = dids.get_indexer(_column(table, column, None))
+    return codes, codes >= 0
+
+
+def build_profiles(users, posts, reposts, likes_given, followers_count, following_count):
+    """Comprehensive profiles of all `users` in one pass over each table.
+
+    `users` has the basic profile columns (did, handle, display_name, description,
+    created_at), `posts` author_did, created_at, like/repost/reply counts and in_timeframe,
+    `reposts` repost_by and in_timeframe, `likes_given` user_did. Each can be a DataFrame or
+    a dict of lists. followers_count / following_count are aligned with `users`.
+    Returns a DataFrame with PROFILE_COLUMNS, one row per user in `users` order.
+    """
+    dids = pd.Index(_column(users, 'did', None))
+    n = len(dids)
+
+    # Posts: counts, engagement sums and posting frequency, all and inside the timeframe
+    codes, known = user_codes(dids, posts, 'author_did')
+    codes = codes[known]
+    in_timeframe = _column(posts, 'in_timeframe', False)[known].astype(bool)
+    post_times = _epoch_us(
+        _column(posts, 'created_at', None)[known],
+        _column(posts, 'created_at_us', None)[known] if 'created_at_us' in posts else None
+    )
+    engagement = {
+        name: _column(posts, f'{name}_count', 0)[known].astype(np.float64)
+        for name in ('like', 'repost', 'reply')
+    }
+
+    posts_total = np.bincount(codes, minlength=n)
+    posts_timeframe = np.bincount(codes[in_timeframe], minlength=n)
+    totals = {name: np.bincount(codes, weights=values, minlength=n) for name, values in engagement.items()}
+    timeframe = {name: np.bincount(codes[in_timeframe], weights=values[in_timeframe], minlength=n) for name, values in engagement.items()}
+
+    created_at = _epoch_us(_column(users, 'created_at', None))
+    frequency_total = _posting_frequency(codes, post_times, n, since=created_at)
+    frequency_timeframe = _posting_frequency(codes[in_timeframe], post_times[in_timeframe], n)
+
+    # Reposts and likes given: counts only
+    repost_codes, known = user_codes(dids, reposts, 'repost_by')
+    repost_timeframe = _column(reposts, 'in_timeframe', False).astype(bool) & known
+    like_codes, known_likes = user_codes(dids, likes_given, 'user_did')
+
+    def average(total):
+        return np.round(np.divide(total, posts_total, out=np.zeros(n), where=posts_total > 0), 2)
+
+    profiles = pd.DataFrame({
+        'user_id': dids,
+        'username': _column(users, 'handle', None),
+        'display_name': _column(users, 'display_name', ''),
+        'description': _column(users, 'description', ''),
+        'created_at': _column(users, 'created_at', ''),
 
-def create_comprehensive_user_profile(user_info, all_posts, all_reposts, all_likes_given, followers, following):
-    """Create comprehensive user profile with all requested attributes"""
-    
-    # Filter posts within timeframe
-    timeframe_posts = [p for p in all_posts if p.get('in_timeframe', False)]
-    timeframe_reposts = [r for r in all_reposts if r.get('in_timeframe', False)]
-    
-    # Calculate posting frequency
-    posting_frequency = calculate_posting_frequency(all_posts, user_info.get('created_at'))
-    
-    # Calculate timeframe-specific posting frequency
-    timeframe_posting_frequency = calculate_posting_frequency(timeframe_posts) if timeframe_posts else 0.0
-    
-    profile = {
-        'user_id': user_info['did'],
-        'username': user_info['handle'],
-        'display_name': user_info.get('display_name', ''),
-        'description': user_info.get('description', ''),
-        'created_at': user_info.get('created_at', ''),
-        
         # Counts
-        'followers_count': len(followers),
-        'following_count': len(following),
-        'posts_count_total': len(all_posts),
-        'posts_count_timeframe': len(timeframe_posts),
-        'reposts_count_total': len(all_reposts),
-        'reposts_count_timeframe': len(timeframe_reposts),
-        'likes_given_count': len(all_likes_given),  # Will be 0 for now due to API limitations
-        
+        'followers_count': np.asarray(followers_count, dtype=np.int64),
+        'following_count': np.asarray(following_count, dtype=np.int64),
+        'posts_count_total': posts_total,
+        'posts_count_timeframe': posts_timeframe,
+        'reposts_count_total': np.bincount(repost_codes[known], minlength=n),
+        'reposts_count_timeframe': np.bincount(repost_codes[repost_timeframe], minlength=n),
+        'likes_given_count': np.bincount(like_codes[known_likes], minlength=n),
+
         # Posting frequency
-        'posting_frequency_total': round(posting_frequency, 4),
-        'posting_frequency_timeframe': round(timeframe_posting_frequency, 4),
-        
+        'posting_frequency_total': np.round(frequency_total, 4),
+        'posting_frequency_timeframe': np.round(frequency_timeframe, 4),
+
         # Engagement metrics (total across all posts)
-        'total_likes_received': sum(p.get('like_count', 0) for p in all_posts),
-        'total_reposts_received': sum(p.get('repost_count', 0) for p in all_posts),
-        'total_replies_received': sum(p.get('reply_count', 0) for p in all_posts),
-        
+        'total_likes_received': totals['like'].astype(np.int64),
+        'total_reposts_received': totals['repost'].astype(np.int64),
+        'total_replies_received': totals['reply'].astype(np.int64),
+
         # Timeframe-specific engagement
-        'timeframe_likes_received': sum(p.get('like_count', 0) for p in timeframe_posts),
-        'timeframe_reposts_received': sum(p.get('repost_count', 0) for p in timeframe_posts),
-        'timeframe_replies_received': sum(p.get('reply_count', 0) for p in timeframe_posts),
-        
+        'timeframe_likes_received': timeframe['like'].astype(np.int64),
+        'timeframe_reposts_received': timeframe['repost'].astype(np.int64),
+        'timeframe_replies_received': timeframe['reply'].astype(np.int64),
+
         # Average engagement per post
-        'avg_likes_per_post': round(sum(p.get('like_count', 0) for p in all_posts) / len(all_posts), 2) if all_posts else 0,
-        'avg_reposts_per_post': round(sum(p.get('repost_count', 0) for p in all_posts) / len(all_posts), 2) if all_posts else 0,
-        'avg_replies_per_post': round(sum(p.get('reply_count', 0) for p in all_posts) / len(all_posts), 2) if all_posts else 0,
-        
+        'avg_likes_per_post': average(totals['like']),
+        'avg_reposts_per_post': average(totals['repost']),
+        'avg_replies_per_post': average(totals['reply']),
+
         # Data collection timestamp
-        'data_collected_at': datetime.now(timezone.utc).isoformat()
-    }
-    
-    return profile
\ No newline at end of file
+        'data_collected_at': datetime.now(timezone.utc).isoformat(),
+    })
+    return profiles
+
+
+def _records_to_columns(records, columns):
+    return {column: [r.get(column) for r in records] for column in columns}
+
+
+def create_comprehensive_user_profile(user_info, all_posts, all_reposts, all_likes_given, followers, following):
+    """Create comprehensive user profile with all requested attributes"""
+    profiles = build_profiles(
+        _records_to_columns([user_info], ['did', 'handle', 'display_name', 'description', 'created_at']),
+        _records_to_columns(all_posts, ['author_did', 'created_at', 'created_at_us', 'like_count', 'repost_count', 'reply_count', 'in_timeframe']),
+        _records_to_columns(all_reposts, ['repost_by', 'in_timeframe']),
+        _records_to_columns(all_likes_given, ['user_did']),
+        [len(followers)], [len(following)],
+    )
+    return profiles.to_dict('records')[0]
+
+
+def read_tables(date_range, output_format=None):
+    """The stored tables of a collection run that profiles are built from, as the arguments
+    of build_profiles. Follower and follow counts are the ones collected at crawl time,
+    the follow graph degrees for files written before they were stored"""
+    from config import OUTPUT_FORMAT
+    from graph_store import load_follow_graph
+    from sinks import entity_path
+
+    output_format = output_format or OUTPUT_FORMAT
+    extension = 'parquet' if output_format == 'parquet' else 'jsonl'
+
+    def read(entity, columns, optional=()):
+        """`optional` columns are skipped in files written before they existed"""
+        path = entity_path(entity, date_range, extension)
+        if output_format == 'parquet':
+            import pyarrow.parquet as pq
+            present = set(pq.read_schema(path).names)
+            return pd.read_parquet(path, columns=columns + [c for c in optional if c in present])
+        table = pd.read_json(path, lines=True, dtype=False, convert_dates=False)
+        # An empty file has no columns at all
+        return table.reindex(columns=columns + [c for c in optional if c in table.columns])
+
+    users = read('users_data', ['did', 'handle', 'display_name', 'description', 'created_at'],
+                 optional=['followers_collected', 'following_collected'])
+    posts = read('posts', ['author_did', 'created_at', 'like_count', 'repost_count', 'reply_count', 'in_timeframe'],
+                 optional=['created_at_us'])
+    reposts = read('reposts', ['repost_by', 'repost_time', 'in_timeframe'], optional=['repost_time_us'])
+    likes_given = read('likes_given', ['user_did', 'created_at'], optional=['created_at_us'])
+
+    if 'followers_collected' in users.columns and 'following_collected' in users.columns:
+        followers_count = users['followers_collected'].fillna(0).to_numpy(dtype=np.int64)
+        following_count = users['following_collected'].fillna(0).to_numpy(dtype=np.int64)
+    else:
+        # The graph also has edges seen from other users, and lists past FOLLOWS_LIMIT are cut
+        graph = load_follow_graph(date_range)
+        ids = pd.Index(graph.dids).get_indexer(users['did'])
+        in_degrees, out_degrees = graph.in_degrees(), graph.out_degrees()
+        followers_count = np.where(ids >= 0, in_degrees[ids], 0)
+        following_count = np.where(ids >= 0, out_degrees[ids], 0)
+    return users, posts, reposts, likes_given, followers_count, following_count
+
+
+def write_profiles(profiles, date_range, output_format=None, path=None):
+    """Write a profiles table to `path` (by default the profiles file of `date_range`),
+    replacing it atomically"""
+    from config import OUTPUT_FORMAT
+    from sinks import entity_path
+
+    output_format = output_format or OUTPUT_FORMAT
+    if path is None:
+        path = entity_path('profiles', date_range, 'parquet' if output_format == 'parquet' else 'jsonl')
+    temporary_path = path + '.tmp'
+    if output_format == 'parquet':
+        profiles.to_parquet(temporary_path, index=False, compression='zstd')
+    else:
+        profiles.to_json(temporary_path, orient='records', lines=True, force_ascii=False)
+    os.replace(temporary_path, path)
+    return path
+
+
+def rebuild_profiles(date_range, output_format=None):
+    """Recompute every comprehensive profile of a collection run from its stored tables,
+    without any API call"""
+    profiles = build_profiles(*read_tables(date_range, output_format))
+    path = write_profiles(profiles, date_range, output_format)
+    print(f"? Rebuilt {len(profiles)} profiles into {os.path.basename(path)}")
+    return profiles
+
+
+if __name__ == "__main__":
+    from config import START_DATE, END_DATE
+    from graph_features import add_graph_features
+    date_range = f"{START_DATE.strftime('%Y-%m-%d')}_to_{END_DATE.strftime('%Y-%m-%d')}"
+    rebuild_profiles(date_range)
+    add_graph_features(date_range)
@@ -1,60 +1,102 @@
+import heapq
 import json
 import pandas as pd
 import os
-from config import OUTPUT_DIR, CSV_DIR, START_DATE, END_DATE, MAX_USERS
+from config import OUTPUT_DIR, CSV_DIR, START_DATE, END_DATE, MAX_USERS, OUTPUT_FORMAT
 from datetime import datetime, timezone
+from sinks import ENTITY_FILES, entity_path, output_entities
 
-def saving_to_csv (date_range):
+def saving_to_csv (date_range, output_format=OUTPUT_FORMAT):
 
-    # Conversion objects: (input JSON, output CSV)
+    extension = 'parquet' if output_format == 'parquet' else 'jsonl'
+
+    # Conversion objects: (input JSONL/Parquet, output CSV) of the files the sinks wrote
     files_to_convert = [
-        (f'users_comprehensive_profiles_{date_range}.json', f'users_comprehensive_profiles_{date_range}.csv'),
-        (f'users_basic_profiles_{date_range}.json', f'users_basic_profiles_{date_range}.csv'),
-        (f'followers_{date_range}.json', f'followers_{date_range}.csv'),
-        (f'following_{date_range}.json', f'following_{date_range}.csv'),
-        (f'posts_all_{date_range}.json', f'posts_all_{date_range}.csv'),
-        (f'reposts_all_{date_range}.json', f'reposts_all_{date_range}.csv'),
-        (f'post_likes_{date_range}.json', f'post_likes_{date_range}.csv'),
-        (f'post_reposts_{date_range}.json', f'post_reposts_{date_range}.csv'),
-        (f'user_likes_given_{date_range}.json', f'user_likes_given_{date_range}.csv')
+        (os.path.basename(entity_path(entity, date_range, extension)), f'{ENTITY_FILES[entity]}_{date_range}.csv')
+        for entity in output_entities()
     ]
     
-    # Process each JSON file and convert to CSV
+    # Process each file and convert to CSV
     successful_conversions = 0
-    for json_filename, csv_filename in files_to_convert:
-        json_path = os.path.join(OUTPUT_DIR, json_filename)
+    for source_filename, csv_filename in files_to_convert:
+        source_path = os.path.join(OUTPUT_DIR, source_filename)
         csv_path = os.path.join(CSV_DIR, csv_filename)
         
-        # Check if JSON file exists
-        if not os.path.exists(json_path):
-            print(f"File {json_path} not found, skipping")
+        # Check if the file exists
+        if not os.path.exists(source_path):
+            print(f"File {source_path} not found, skipping")
             continue
             
         # Convert to CSV
-        if json_to_csv(json_path, csv_path):
+        if output_format == 'parquet':
+            from columnar_io import parquet_to_csv
+            converted = parquet_to_csv(source_path, csv_path)
+        else:
+            converted = jsonl_to_csv(source_path, csv_path)
+        if converted:
             successful_conversions += 1
 
     return successful_conversions, files_to_convert
 
-def save_statistics(successful_conversions, date_range, all_users_profiles,
-                   all_followers, all_following,
-                   all_posts, all_reposts, all_likes,
-                   all_post_reposts, all_likes_given, files_to_convert):  # Added files_to_convert
+
+class CollectionStats:
+    """Summary statistics updated record by record, so the full data never has to be in memory"""
+
+    def __init__(self, top_n=5):
+        self.top_n = top_n
+        self.counts = dict.fromkeys([
+            'users_collected', 'total_posts', 'timeframe_posts', 'total_reposts', 'timeframe_reposts',
+            'total_followers', 'total_following', 'post_likes', 'post_reposts', 'user_likes_given'
+        ], 0)
+        self.sample_user_profile = {}
+        # Min-heaps of (key, order, profile) holding the current top users
+        self._most_active = []
+        self._most_followed = []
+        self._order = 0
+
+    def _push_top(self, heap, key, profile):
+        self._order += 1
+        entry = (key, self._order, profile)
+        if len(heap) < self.top_n:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+
+    def add_user(self, result):
+        """Count everything collected for one user (a result of crawler.collect_user)"""
+        profile = result['profile']
+        self.counts['users_collected'] += 1
+        self.counts['total_posts'] += len(result['posts'])
+        self.counts['timeframe_posts'] += sum(1 for p in result['posts'] if p.get('in_timeframe', False))
+        self.counts['total_reposts'] += len(result['reposts'])
+        self.counts['timeframe_reposts'] += sum(1 for r in result['reposts'] if r.get('in_timeframe', False))
+        self.counts['total_followers'] += len(result['followers'])
+        self.counts['total_following'] += len(result['following'])
+        self.counts['user_likes_given'] += len(result['likes_given'])
+
+        if not self.sample_user_profile:
+            self.sample_user_profile = profile
+        self._push_top(self._most_active, profile['posts_count_total'], profile)
+        self._push_top(self._most_followed, profile['followers_count'], profile)
+
+    def add_interactions(self, post_likes, post_reposts):
+        self.counts['post_likes'] += len(post_likes)
+        self.counts['post_reposts'] += len(post_reposts)
+
+    def most_active_users(self):
+        return [profile for _, _, profile in sorted(self._most_active, reverse=True)]
+
+    def most_followed_users(self):
+        return [profile for _, _, profile in sorted(self._most_followed, reverse=True)]
+
+
+def save_statistics(successful_conversions, date_range, stats, files_to_convert):
     
     # Create a summary statistics file
     summary_stats = {
         'collection_date': datetime.now(timezone.utc).isoformat(),
         'date_range': f"{START_DATE.strftime('%Y-%m-%d')} to {END_DATE.strftime('%Y-%m-%d')}",
-        'users_collected': len(all_users_profiles),
-        'total_posts': len(all_posts),
-        'timeframe_posts': len([p for p in all_posts if p.get('in_timeframe', False)]),
-        'total_reposts': len(all_reposts),
-        'timeframe_reposts': len([r for r in all_reposts if r.get('in_timeframe', False)]),
-        'total_followers': len(all_followers),
-        'total_following': len(all_following),
-        'post_likes': len(all_likes),
-        'post_reposts': len(all_post_reposts),
-        'user_likes_given': len(all_likes_given),
+        **stats.counts,
         'files_converted_to_csv': successful_conversions,
         'total_files_to_convert': len(files_to_convert),  # Added
         'conversion_success_rate': f"{(successful_conversions/len(files_to_convert))*100:.1f}%" if files_to_convert else "0%",  # Added
@@ -64,11 +106,11 @@ def save_statistics(successful_conversions, date_range, all_users_profiles,
         'csv_directory': CSV_DIR,
         
         # Top users
-        'most_active_users': sorted(all_users_profiles, key=lambda x: x['posts_count_total'], reverse=True)[:5] if all_users_profiles else [],
-        'most_followed_users': sorted(all_users_profiles, key=lambda x: x['followers_count'], reverse=True)[:5] if all_users_profiles else [],
+        'most_active_users': stats.most_active_users(),
+        'most_followed_users': stats.most_followed_users(),
         
         # Sample user profile for verification
-        'sample_user_profile': all_users_profiles[0] if all_users_profiles else {},
+        'sample_user_profile': stats.sample_user_profile,
         
         # Collection parameters
         'max_users': MAX_USERS,
@@ -88,63 +130,41 @@ def save_statistics(successful_conversions, date_range, all_users_profiles,
         json.dump(summary_stats, f, indent=2, ensure_ascii=False)
     
     return summary_file  # Return for potential use
-    
 
 
-def saving_to_json(date_range, all_users_profiles, all_users_data,
-                       all_followers, all_following,
-                       all_posts, all_reposts, all_likes,
-                       all_post_reposts, all_likes_given):
-    # Store all data in JSON files
-    json_files = [
-        # _ _ _ _ USERS _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _
-        (all_users_profiles, f'users_comprehensive_profiles_{date_range}.json'),
-        (all_users_data, f'users_basic_profiles_{date_range}.json'),
-        (all_followers, f'followers_{date_range}.json'),
-        (all_following, f'following_{date_range}.json'),
-        (all_posts, f'posts_all_{date_range}.json'),
-        (all_reposts, f'reposts_all_{date_range}.json'),
-        # _ _ _ _ POSTS _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _
-        (all_likes, f'post_likes_{date_range}.json'),
-        (all_post_reposts, f'post_reposts_{date_range}.json'),
-        # _ _ _ _  NOT IMPLEMENTED YET _ _ _ _ _ _ _ _ 
-        (all_likes_given, f'user_likes_given_{date_range}.json')
-    ]
+def jsonl_columns(jsonl_file):
+    """Keys of every record of a JSONL file, in the order they first appear"""
+    columns = {}
+    with open(jsonl_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                columns.update(dict.fromkeys(json.loads(line)))
+    return list(columns)
 
-    # Dumping each data list to its respective JSON file
-    for data, filename in json_files:
-        filepath = os.path.join(OUTPUT_DIR, filename)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        print(f"? Saved {len(data)} records to {filename}")
 
-    return
-
-def json_to_csv(json_file, csv_file):
-    """Convert a JSON file to CSV format"""
+def jsonl_to_csv(jsonl_file, csv_file, chunk_size=50000):
+    """Convert a JSONL file to CSV format, `chunk_size` records at a time"""
     try:
-        # Read the JSON data
-        with open(json_file, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            
+        # Records written by older versions lack some fields, every chunk gets the same columns
+        # so the rows stay under the header
+        columns = jsonl_columns(jsonl_file)
+        rows = 0
+        with pd.read_json(jsonl_file, lines=True, chunksize=chunk_size, dtype=False) as reader:
+            for chunk in reader:
+                # Integer fields missing from some records stay integers (nullable) instead of floats
+                chunk.reindex(columns=columns).convert_dtypes().to_csv(
+                    csv_file, index=False, encoding='utf-8', mode='w' if rows == 0 else 'a', header=rows == 0
+                )
+                rows += len(chunk)
+
         # If data is empty, skip
-        if not data:
-            print(f"No data in {json_file}, skipping conversion")
+        if rows == 0:
+            print(f"No data in {jsonl_file}, skipping conversion")
             return False
-            
-        # Convert to DataFrame and save as CSV
-        df = pd.DataFrame(data)
-        df.to_csv(csv_file, index=False, encoding='utf-8')
-        print(f"Successfully converted {json_file} to {csv_file}")
+
+        print(f"Successfully converted {jsonl_file} to {csv_file}")
         return True
         
     except Exception as e:
-        print(f"Error converting {json_file}: {e}")
+        print(f"Error converting {jsonl_file}: {e}")
         return False
-
-def save_checkpoint(data, filename, current_idx):
-    """Save data collected so far as a checkpoint"""
-    checkpoint_file = os.path.join(OUTPUT_DIR, f"checkpoint_{filename}_{current_idx}.json")
-    with open(checkpoint_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2)
-    print(f"Saved checkpoint to {checkpoint_file}")
@@ -0,0 +1,155 @@
+import os
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from config import OUTPUT_FORMAT
+from graph_store import load_follow_graph
+from sinks import entity_path
+
+#this file contains the graph features added to the comprehensive profiles
+#the follow graph (see graph_store.py) becomes a scipy sparse adjacency matrix and every feature
+#is a handful of sparse matrix operations over all users at once: reciprocity, degrees inside
+#the crawled sample, PageRank, k-core number and local clustering coefficient
+
+GRAPH_FEATURES = [
+    'reciprocity', 'in_degree_sample', 'out_degree_sample',
+    'pagerank', 'core_number', 'clustering_coefficient',
+]
+
+
+def adjacency(graph):
+    """A[i, j] = 1 when actor i follows actor j, built on the stored CSR arrays"""
+    n = graph.num_actors
+    data = np.ones(graph.num_edges, dtype=np.float32)
+    return sp.csr_matrix((data, graph.out_indices, graph.out_indptr), shape=(n, n))
+
+
+def reciprocity(A):
+    """Share of each actor's follows that follow back"""
+    mutual = np.asarray(A.multiply(A.T).sum(axis=1)).ravel()
+    out_degree = np.asarray(A.sum(axis=1)).ravel()
+    return np.divide(mutual, out_degree, out=np.zeros_like(mutual), where=out_degree > 0)
+
+
+def pagerank(A, damping=0.85, tol=1e-10, max_iter=100):
+    """PageRank by power iteration, followers passing rank to the accounts they follow"""
+    n = A.shape[0]
+    if n == 0:
+        return np.zeros(0)
+    out_degree = np.asarray(A.sum(axis=1)).ravel()
+    dangling = out_degree == 0
+    inverse_degree = np.divide(1.0, out_degree, out=np.zeros(n), where=~dangling)
+    transition = (sp.diags(inverse_degree) @ A).T.tocsr()
+
+    rank = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        # Rank of accounts following nobody is spread over everyone
+        previous = rank
+        rank = damping * (transition @ rank + rank[dangling].sum() / n) + (1 - damping) / n
+        if np.abs(rank - previous).sum() < n * tol:
+            break
+    return rank
+
+
+def undirected(A):
+    """Symmetric 0/1 matrix of follow links in either direction, without self links"""
+    U = ((A + A.T) > 0).astype(np.float32)
+    U.setdiag(0)
+    U.eliminate_zeros()
+    return U.tocsr()
+
+
+def core_numbers(U):
+    """k-core number of every actor, peeling all low degree actors of a level at once"""
+    n = U.shape[0]
+    degree = np.asarray(U.sum(axis=1)).ravel()
+    alive = np.ones(n, dtype=bool)
+    core = np.zeros(n, dtype=np.int32)
+    k = 0
+    while alive.any():
+        removed = alive & (degree <= k)
+        if not removed.any():
+            # Jump straight to the next level that removes somebody
+            k = int(degree[alive].min())
+            continue
+        core[removed] = k
+        alive &= ~removed
+        degree -= U @ removed.astype(np.float32)
+    return core
+
+
+def triangle_counts(U):
+    """Triangles through every actor.
+
+    Links are oriented from the lower to the higher degree end, so each triangle a < b < c
+    is found once and the two-step paths never go through a popular account's full
+    neighbourhood. Its three corners are credited from the first, last and middle position.
+    """
+    n = U.shape[0]
+    degree = np.asarray(U.sum(axis=1)).ravel()
+    rank = np.empty(n, dtype=np.int64)
+    rank[np.lexsort((np.arange(n), degree))] = np.arange(n)
+
+    links = U.tocoo()
+    upward = rank[links.row] < rank[links.col]
+    L = sp.csr_matrix(
+        (np.ones(upward.sum(), dtype=np.float32), (links.row[upward], links.col[upward])),
+        shape=(n, n)
+    )
+    closing = (L @ L).multiply(L)  # [a, c] = triangles with a first and c last
+    first = np.asarray(closing.sum(axis=1)).ravel()
+    last = np.asarray(closing.sum(axis=0)).ravel()
+    middle = np.asarray((L.T.tocsr() @ L).multiply(L).sum(axis=1)).ravel()
+    return first + middle + last
+
+
+def clustering_coefficients(U):
+    """Local clustering coefficient: links among an actor's neighbours over the possible ones"""
+    degree = np.asarray(U.sum(axis=1)).ravel()
+    pairs = degree * (degree - 1) / 2
+    triangles = triangle_counts(U)
+    return np.divide(triangles, pairs, out=np.zeros_like(triangles), where=pairs > 0)
+
+
+def compute_graph_features(graph):
+    """Graph features of the crawled users (the actors whose follow lists were collected)"""
+    A = adjacency(graph)
+    crawled = np.flatnonzero(graph.crawled)
+    sample = A[crawled][:, crawled]
+    U = undirected(A)
+
+    return pd.DataFrame({
+        'user_id': [graph.dids[i] for i in crawled],
+        'reciprocity': reciprocity(A)[crawled],
+        'in_degree_sample': np.asarray(sample.sum(axis=0)).ravel().astype(np.int64),
+        'out_degree_sample': np.asarray(sample.sum(axis=1)).ravel().astype(np.int64),
+        'pagerank': pagerank(A)[crawled],
+        'core_number': core_numbers(U)[crawled],
+        'clustering_coefficient': clustering_coefficients(U)[crawled],
+    })
+
+
+def add_graph_features(date_range, output_format=OUTPUT_FORMAT):
+    """Compute the graph features of a collection run and add them to its profiles file"""
+    features = compute_graph_features(load_follow_graph(date_range))
+
+    extension = 'parquet' if output_format == 'parquet' else 'jsonl'
+    path = entity_path('profiles', date_range, extension)
+    if output_format == 'parquet':
+        profiles = pd.read_parquet(path)
+    else:
+        # Read every value as written, so that the file is written back unchanged
+        profiles = pd.read_json(path, lines=True, dtype=False, convert_dates=False)
+
+    # Rerunning replaces the features of the previous run
+    profiles = profiles.drop(columns=[c for c in GRAPH_FEATURES if c in profiles.columns])
+    profiles = profiles.merge(features, on='user_id', how='left')
+
+    temporary_path = path + '.tmp'
+    if output_format == 'parquet':
+        profiles.to_parquet(temporary_path, index=False, compression='zstd')
+    else:
+        profiles.to_json(temporary_path, orient='records', lines=True, force_ascii=False)
+    os.replace(temporary_path, path)
+    print(f"? Added graph features of {len(features)} users to {os.path.basename(path)}")
+    return features
@@ -0,0 +1,178 @@
+import json
+import os
+from array import array
+import numpy as np
+from config import OUTPUT_DIR
+
+#this file contains the storage of the follow graph
+#every DID gets an integer id in the actor table (the only place holding handles and display
+#names), follows are stored once as int32 arrays sorted in CSR (who a user follows) and CSC
+#(who follows a user) form, saved as .npy files that are memory-mapped when loaded
+
+ACTORS_FILE = 'actors.parquet'
+META_FILE = 'graph.json'
+ARRAYS = ('out_indptr', 'out_indices', 'in_indptr', 'in_indices')
+
+
+def graph_path(date_range):
+    return os.path.join(OUTPUT_DIR, f"follow_graph_{date_range}")
+
+
+class GraphBuilder:
+    """Collects follow edges as ids while the crawl runs, 8 bytes per edge"""
+
+    def __init__(self):
+        self.ids = {}  # did -> id
+        self.dids = []
+        self.handles = []
+        self.display_names = []
+        self.crawled = bytearray()  # 1 for users whose own followers/follows were collected
+        self.sources = array('i')  # edge i: sources[i] follows targets[i]
+        self.targets = array('i')
+
+    def actor_id(self, did, handle=None, display_name=None):
+        """Id of a DID, added to the actor table the first time it is seen"""
+        actor = self.ids.get(did)
+        if actor is None:
+            actor = self.ids[did] = len(self.dids)
+            self.dids.append(did)
+            self.handles.append(handle)
+            self.display_names.append(display_name)
+            self.crawled.append(0)
+        else:
+            # Later records may know what earlier ones did not
+            if handle and not self.handles[actor]:
+                self.handles[actor] = handle
+            if display_name and not self.display_names[actor]:
+                self.display_names[actor] = display_name
+        return actor
+
+    def add_user(self, result):
+        """Add the followers and follows of one user (a result of crawler.collect_user)"""
+        profile = result.get('profile') or {}
+        user = self.actor_id(result['did'], result['handle'], profile.get('display_name'))
+        self.crawled[user] = 1
+        for follower in result['followers']:
+            self.sources.append(self.actor_id(follower['follower_did'], follower['follower_handle'], follower['follower_display_name']))
+            self.targets.append(user)
+        for followed in result['following']:
+            self.sources.append(user)
+            self.targets.append(self.actor_id(followed['following_did'], followed['following_handle'], followed['following_display_name']))
+
+    def save(self, path):
+        """Sort and deduplicate the edges and write the graph to the directory `path`"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        os.makedirs(path, exist_ok=True)
+        n = len(self.dids)
+        key_base = max(n, 1)
+        sources = np.frombuffer(self.sources, dtype=np.int32)
+        targets = np.frombuffer(self.targets, dtype=np.int32)
+
+        # One int64 key per edge sorts by (source, target) and drops edges seen from both ends
+        keys = np.unique(sources.astype(np.int64) * key_base + targets)
+        sources, targets = (keys // key_base).astype(np.int32), (keys % key_base).astype(np.int32)
+        in_order = np.lexsort((sources, targets))
+
+        arrays = {
+            'out_indptr': _indptr(sources, n),
+            'out_indices': targets,
+            'in_indptr': _indptr(targets[in_order], n),
+            'in_indices': sources[in_order],
+        }
+        for name, values in arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), values)
+
+        actors = pa.table({
+            'id': pa.array(np.arange(n, dtype=np.int32)),
+            'did': pa.array(self.dids, pa.string()),
+            'handle': pa.array(self.handles, pa.string()),
+            'display_name': pa.array(self.display_names, pa.string()),
+            'crawled': pa.array(np.frombuffer(bytes(self.crawled), dtype=np.bool_)),
+        })
+        pq.write_table(actors, os.path.join(path, ACTORS_FILE), compression='zstd')
+
+        with open(os.path.join(path, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'actors': n, 'edges': len(keys), 'crawled': int(sum(self.crawled))}, f)
+        print(f"? Saved follow graph: {n} actors, {len(keys)} edges to {path}")
+        return path
+
+
+def _indptr(rows, n):
+    """Row pointers of sorted row ids: row i spans indptr[i]:indptr[i + 1]"""
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr
+
+
+class FollowGraph:
+    """Read-only follow graph, with neighbour and degree lookups by id or DID"""
+
+    def __init__(self, path, mmap=True):
+        import pyarrow.parquet as pq
+
+        self.path = path
+        mode = 'r' if mmap else None
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode))
+        self.actors = pq.read_table(os.path.join(path, ACTORS_FILE))
+        self.dids = self.actors.column('did').to_pylist()
+        self.crawled = self.actors.column('crawled').to_numpy(zero_copy_only=False)
+        self._ids = None
+
+    @property
+    def num_actors(self):
+        return len(self.dids)
+
+    @property
+    def num_edges(self):
+        return len(self.out_indices)
+
+    def id_of(self, did):
+        """Integer id of a DID (KeyError if it is not in the graph)"""
+        if self._ids is None:
+            self._ids = {did: i for i, did in enumerate(self.dids)}
+        return self._ids[did]
+
+    def _id(self, actor):
+        return actor if isinstance(actor, (int, np.integer)) else self.id_of(actor)
+
+    def actor(self, actor):
+        """did, handle and display name of an id or DID"""
+        i = self._id(actor)
+        return {name: self.actors.column(name)[i].as_py() for name in ('did', 'handle', 'display_name', 'crawled')}
+
+    # - - - - NEIGHBOURS AND DEGREES - - - -
+
+    def following(self, actor):
+        """Sorted ids of the accounts `actor` follows"""
+        i = self._id(actor)
+        return self.out_indices[self.out_indptr[i]:self.out_indptr[i + 1]]
+
+    def followers(self, actor):
+        """Sorted ids of the accounts following `actor`"""
+        i = self._id(actor)
+        return self.in_indices[self.in_indptr[i]:self.in_indptr[i + 1]]
+
+    def follows(self, source, target):
+        """True if `source` follows `target` (binary search in the sorted row)"""
+        row = self.following(source)
+        target = self._id(target)
+        position = np.searchsorted(row, target)
+        return bool(position < len(row) and row[position] == target)
+
+    def out_degrees(self):
+        """Follows of every actor that were collected, indexed by id"""
+        return np.diff(self.out_indptr)
+
+    def in_degrees(self):
+        """Followers of every actor that were collected, indexed by id"""
+        return np.diff(self.in_indptr)
+
+    def to_dids(self, ids):
+        return [self.dids[i] for i in ids]
+
+
+def load_follow_graph(date_range, mmap=True):
+    return FollowGraph(graph_path(date_range), mmap)
@@ -0,0 +1,68 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from config import INTERACTIONS_CONCURRENCY, INTERACTIONS_BUDGET
+from crawler import resume_endpoint
+from data_collector import get_post_likes, get_post_reposts
+
+#this file contains the post interaction harvester (likes and reposts of the collected posts)
+#posts are taken from a queue and many of them are paged at the same time, every request
+#still goes through the shared rate limiter, and progress is saved per post in the crawl store
+
+
+async def harvest_post(store, post, budget=INTERACTIONS_BUDGET):
+    """Collect likes and reposts of one post, skipping the ones its counters say are empty"""
+    uri, cid = post['uri'], post['cid']
+
+    async def fetch(endpoint, entity, collector, count):
+        if count == 0:
+            return []
+        records = await asyncio.to_thread(resume_endpoint, store, uri, cid, endpoint, [entity], collector, budget)
+        return records[entity]
+
+    # Missing counters mean unknown, not zero
+    return await asyncio.gather(
+        fetch('likes', 'post_likes', get_post_likes, post.get('like_count')),
+        fetch('reposted_by', 'post_reposts', get_post_reposts, post.get('repost_count')),
+    )
+
+
+async def harvest_interactions(store, posts, on_post_done, concurrency=INTERACTIONS_CONCURRENCY, budget=INTERACTIONS_BUDGET):
+    """Harvest the interactions of every post in `posts` (an iterable of post records).
+
+    At most `concurrency` posts are in flight and `posts` is consumed lazily, so it can be a
+    reader over the posts file. `on_post_done(post, likes, reposts)` is called in the event
+    loop thread as each post finishes. Returns the number of posts processed.
+    """
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency * 2))
+
+    semaphore = asyncio.Semaphore(concurrency)
+    in_flight = set()
+    done_count = 0
+
+    async def worker(post):
+        nonlocal done_count
+        try:
+            likes, reposts = await harvest_post(store, post, budget)
+            on_post_done(post, likes, reposts)
+        except Exception as e:
+            print(f"Error harvesting interactions for post {post['uri']}: {e}")
+        finally:
+            done_count += 1
+            if done_count % 100 == 0:
+                print(f"Processed post interactions for {done_count} posts...")
+            semaphore.release()
+
+    for post in posts:
+        await semaphore.acquire()
+        task = asyncio.create_task(worker(post))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+    await asyncio.gather(*in_flight)
+    return done_count
+
+
+def run_harvest(store, posts, on_post_done, concurrency=INTERACTIONS_CONCURRENCY, budget=INTERACTIONS_BUDGET):
+    """Blocking entry point for the interaction harvest"""
+    return asyncio.run(harvest_interactions(store, posts, on_post_done, concurrency, budget))
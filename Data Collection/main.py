@@ -1,10 +1,13 @@
 from user_discovery import get_initial_users
-from config import MAX_USERS, START_DATE, END_DATE, OUTPUT_DIR, CSV_DIR
-from file_io import save_checkpoint, saving_to_csv, saving_to_json, save_statistics
-from auth import authenticate_client
-from data_collector import get_user_info, get_user_following, get_user_followers, get_all_user_posts, get_user_likes_given, get_post_interactions
-from data_processor import create_comprehensive_user_profile
-import time
+from config import MAX_USERS, START_DATE, END_DATE, OUTPUT_DIR, CSV_DIR, CONCURRENCY, WRITE_CSV, CRAWL_MODE
+from file_io import saving_to_csv, save_statistics, CollectionStats
+from sinks import OutputSinks
+from auth import get_client
+from interactions import run_harvest
+from crawler import run_crawl
+from crawl_store import CrawlStore
+from metrics import metrics
+from graph_features import add_graph_features
 import os
 import json
 from datetime import datetime, timezone
@@ -12,116 +15,57 @@ from datetime import datetime, timezone
 
 def main():
 
-    # Authenticate and get client
-    client = authenticate_client()
-
-    # Get initial set of users
-    initial_users = get_initial_users(max_users=MAX_USERS)
+    # Live counters of every request and phase, served on METRICS_PORT (see metrics.py)
+    metrics.start()
+
+    # Authenticate once, the same client is shared by every collector call
+    with metrics.phase('login'):
+        client = get_client()
+
+    # Crawl state of this and previous runs, finished work is skipped
+    store = CrawlStore()
+
+    # Get initial set of users (the same ones again when resuming a run)
+    initial_users = store.load_users()
+    if initial_users and CRAWL_MODE == 'delta':
+        # Only new posts, followers and follows since the last run are fetched
+        store.begin_delta_run()
+    elif initial_users:
+        if store.in_delta_run():
+            print("Closing the interrupted delta run, CRAWL_MODE is 'full'")
+            store.abandon_delta_run()
+        print(f"Resuming previous crawl: {store.count_done('user')}/{len(initial_users)} users already finished")
+    else:
+        with metrics.phase('discovery'):
+            initial_users = get_initial_users(max_users=MAX_USERS)
+        store.save_users(initial_users)
     
     # Check if any users were found
     if not initial_users:
         print("No users found. Exiting.")
+        metrics.stop()
         return
         
     print(f"Starting data collection for {len(initial_users)} users...")
     
 
-    # Data structures
-    all_users_profiles = []
-    all_users_data = []
-    all_followers = []
-    all_following = []
-    all_posts = []
-    all_reposts = []
-    all_likes = []
-    all_post_reposts = []
-    all_likes_given = []
-      
-    # Process each user
-    checkpoint_interval = 25  # Save checkpoint every 25 users
-    for idx, (did, handle) in enumerate(initial_users):
-        # Save checkpoints periodically
-        if idx > 0 and idx % checkpoint_interval == 0:
-            print(f"\nSaving checkpoint at user {idx}/{len(initial_users)}...")
-            save_checkpoint(all_users_data, "users_profiles", idx)
-            save_checkpoint(all_followers, "followers", idx)
-            save_checkpoint(all_following, "following", idx)
-            save_checkpoint(all_posts, "posts", idx)
-            save_checkpoint(all_reposts, "reposts", idx)
-        
-        print(f"\n{'='*60}")
-        print(f"Processing user {idx+1}/{len(initial_users)}: {handle}")
-        print(f"{'='*60}")
-        
-        # Initialize user data (whiped each iteration)
-        user_posts, user_reposts, user_followers, user_following, user_likes_given = []
-
-        # Get user profile
-        try:
-
-            # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
-            # - - - - - - - - - - - - GET BASIC USER INFO - - - - - - - - - - - - - - - - - - - - - - - 
-            # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
-
-            print("Getting basic user information...")
-
-            user_info = get_user_info (client, did, handle)
-            all_users_data.append(user_info)
-
-            print(f"? Added user profile for {handle}")
-
-            # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
-            # - - - - - - - - - - - GET FOLLOWERS & FOLLOWING LIST - - - - - - - - - - - - - - - - - - - 
-            # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
-
-            print("Getting user connections...")
-
-            user_followers = get_user_followers(did, handle)
-            all_followers.extend(user_followers)  
-
-            user_following = get_user_following(did, handle)
-            all_following.extend(user_followers)  
-                        
-                
-            print(f"? Added {len(user_followers)} followers and {len(user_following)} following for {handle}")
-            
-            # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
-            # - - - - - - - - - - - - GET POSTS OF THE USER - - - - - - - - - - - - - - - - - - - - - -
-            # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
-
-            # Get ALL posts (not just timeframe)
-            print("Getting all posts from the user...")
-
-            user_posts, user_reposts = get_all_user_posts(did, handle)
-            all_posts.extend(user_posts)
-            all_reposts.extend(user_reposts)
-
-            # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
-            # - - - - - - - - - - - - GET LIKES OF THE USER - - - - - - - - - - - - - - - - - - - - - -
-            # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-            
-            user_likes_given = get_user_likes_given(did, handle)
-            all_likes_given.extend(user_likes_given)
-
-            # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
-            # - - - - - - - CREATE A USER PROFILE WITH THE COLLECTED DATA - - - - - - - - - - - - - - -
-            # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-            
-            # Create comprehensive user profile
-            comprehensive_profile = create_comprehensive_user_profile(
-                user_info, user_posts, user_reposts, user_likes_given, 
-                user_followers, user_following
-            )
-
-            #profile of all users with all attributes
-            all_users_profiles.append(comprehensive_profile)
-            
-            print(f"? Created comprehensive profile for {handle}")
-            
-        except Exception as e:
-            print(f"? Error processing user {handle}: {e}")
-            
-        time.sleep(2)  # Rate limiting between users
+    date_range = f"{START_DATE.strftime('%Y-%m-%d')}_to_{END_DATE.strftime('%Y-%m-%d')}"
+
+    # Records are streamed to one JSONL/Parquet file per entity as they arrive (see sinks.py),
+    # only the summary statistics are kept in memory
+    sinks = OutputSinks(date_range)
+    stats = CollectionStats()
+
+    def save_user(done_count, result):
+        sinks.write_user(result)
+        stats.add_user(result)
+
+    # Process users concurrently (see crawler.py), CONCURRENCY users at a time.
+    # Every page is saved in the crawl store as soon as it arrives
+    with metrics.phase('crawl'):
+        collected = run_crawl(client, store, initial_users, CONCURRENCY, on_user_done=save_user)
+
+    print(f"? Collected {collected}/{len(initial_users)} users")
     
     # Collect interactions for timeframe posts only (to save time)
     print(f"\n{'='*60}")
@@ -131,52 +75,52 @@ def main():
 
     #  _ _ _ _ _ _ SEGREGATE BETTER THIS IS POST PART_ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ 
     # _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ _ 
-    # Posts block section
-    timeframe_posts = [p for p in all_posts if p.get('in_timeframe', False)]
-    post_count = len(timeframe_posts)
-    
-    # from posts of each user, get likes and repsots
-    for i, post in enumerate(timeframe_posts):
-        if i % 10 == 0:  # Progress update
-            print(f"Processing post interactions {i+1}/{post_count}...")
-            
-        if i % 50 == 0 and i > 0:  # Checkpoint for interactions
-            save_checkpoint(all_likes, "post_likes", i)
-            save_checkpoint(all_post_reposts, "post_reposts", i)
-            
-        post_likes, post_reposts = get_post_interactions(post['uri'], post['cid'])
-        all_likes.extend(post_likes)
-        all_post_reposts.extend(post_reposts)
-        time.sleep(0.8)  # Rate limiting
+    # Posts block section, the posts are read back from their file one at a time and
+    # harvested concurrently (see interactions.py)
+    with metrics.phase('interactions'):
+        sinks.finish('posts')
+        post_columns = ['uri', 'cid', 'like_count', 'repost_count', 'in_timeframe']
+        timeframe_posts = (p for p in sinks.iter_records('posts', post_columns) if p.get('in_timeframe', False))
+        print(f"Harvesting interactions of {stats.counts['timeframe_posts']} posts...")
+
+        def save_interactions(post, post_likes, post_reposts):
+            sinks.write('post_likes', post_likes)
+            sinks.write('post_reposts', post_reposts)
+            stats.add_interactions(post_likes, post_reposts)
+
+        run_harvest(store, timeframe_posts, save_interactions)
     
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
     # - - - - - - - - - - - - FILE CREATION AND HANDLING - - - - - - - - - - - - - - - - - - - - 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
-    
-    date_range = f"{START_DATE.strftime('%Y-%m-%d')}_to_{END_DATE.strftime('%Y-%m-%d')}"
 
-    print("Saving all collected data in JSON...")
-    
-    saving_to_json(date_range, all_users_profiles, all_users_data,
-                       all_followers, all_following,
-                       all_posts, all_reposts, all_likes,
-                       all_post_reposts, all_likes_given)
+    with metrics.phase('output'):
+        print("Closing output files...")
 
-    print("Converting JSON files to CSV format...")
-    
-    successful_conversions, files_to_convert = saving_to_csv(date_range)
-    
-    print ("Saving statistics...")
+        sinks.close()
 
-    summary_file = save_statistics(
-        successful_conversions, date_range, all_users_profiles,
-        all_followers, all_following, all_posts, all_reposts, 
-        all_likes, all_post_reposts, all_likes_given, files_to_convert
-    )
+        # Reciprocity, PageRank, k-core... of every user from the follow graph, added to the profiles
+        add_graph_features(date_range)
+
+        # Parquet output is read directly by the classification scripts, CSV only on request
+        if WRITE_CSV:
+            print("Converting output files to CSV format...")
+            successful_conversions, files_to_convert = saving_to_csv(date_range)
+        else:
+            successful_conversions, files_to_convert = 0, []
+        
+        print ("Saving statistics...")
+
+        summary_file = save_statistics(successful_conversions, date_range, stats, files_to_convert)
     
     print(f" Comprehensive summary saved to: {summary_file}")
 
+    if CRAWL_MODE == 'delta':
+        store.end_delta_run()
+    store.close()
+
+    metrics.stop()
     print("DATA COLLECTION COMPLETE!")
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - 
@@ -189,6 +133,8 @@ if __name__ == "__main__":
         print(" Starting Enhanced Bluesky User Data Collection")
         print(f" Date range: {START_DATE.strftime('%Y-%m-%d')} to {END_DATE.strftime('%Y-%m-%d')}")
         print(f" Target users: {MAX_USERS}")
+        print(f" Concurrency: {CONCURRENCY} users")
+        print(f" Crawl mode: {CRAWL_MODE}")
         print(f" Output directory: {OUTPUT_DIR}")
         print(f" CSV directory: {CSV_DIR}")
         print("="*60)
@@ -197,7 +143,7 @@ if __name__ == "__main__":
         
     except KeyboardInterrupt:
         print("\n?  Collection interrupted by user")
-        print("Partial data may have been saved in checkpoint files")
+        print("Progress is saved in the crawl store, run again to resume")
     except Exception as e:
         print(f"\n Critical error in script execution: {e}")
         import traceback
@@ -0,0 +1,268 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from atproto import exceptions
+from config import METRICS_PORT, METRICS_LOG_INTERVAL
+from rate_limiter import rate_limiter
+
+#this file contains the instrumentation of the collector
+#every XRPC attempt is counted per endpoint (latency histogram, status, bytes), every phase of
+#main() is timed; the numbers are served in Prometheus text format on METRICS_PORT and printed
+#as one JSON line every METRICS_LOG_INTERVAL seconds
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+
+class Histogram:
+    """Fixed-bucket latency histogram, cheap enough to update on every request"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile"""
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target and count:
+                return bound
+        return None
+
+
+class Metrics:
+    """Counters of the whole run, shared by every thread"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.latency = defaultdict(Histogram)  # per XRPC method
+        self.statuses = defaultdict(int)  # (method, status) -> responses
+        self.bytes = defaultdict(int)  # per XRPC method
+        self.parse_seconds = 0.0
+        self.phases = {}  # phase -> seconds, in the order they ran
+        self.current_phase = None
+        self._phase_started = None
+        self._stop = threading.Event()
+        self._server = None
+
+    # - - - - RECORDING - - - -
+
+    def observe_request(self, nsid, seconds, status, size):
+        with self.lock:
+            self.latency[nsid].observe(seconds)
+            self.statuses[(nsid, status)] += 1
+            self.bytes[nsid] += size
+
+    def observe_parse(self, seconds):
+        with self.lock:
+            self.parse_seconds += seconds
+
+    @contextmanager
+    def phase(self, name):
+        """Time one phase of the run: `with metrics.phase('crawl'): ...`"""
+        with self.lock:
+            self.current_phase, self._phase_started = name, time.monotonic()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0.0) + time.monotonic() - self._phase_started
+                self.current_phase = None
+
+    def _phase_seconds(self):
+        phases = dict(self.phases)
+        if self.current_phase:
+            phases[self.current_phase] = phases.get(self.current_phase, 0.0) + time.monotonic() - self._phase_started
+        return phases
+
+    # - - - - REPORTING - - - -
+
+    def snapshot(self):
+        """Totals of the run so far, the content of the periodic log line"""
+        limiter = rate_limiter.counters()
+        with self.lock:
+            requests = {nsid: h.count for nsid, h in self.latency.items()}
+            p95 = {nsid: h.quantile(0.95) for nsid, h in self.latency.items()}
+            throttled = sum(n for (_, status), n in self.statuses.items() if status == 429)
+            errors = sum(n for (_, status), n in self.statuses.items() if status != 200)
+            return {
+                'event': 'metrics',
+                'elapsed': round(time.monotonic() - self.started, 1),
+                'phase': self.current_phase,
+                'requests': sum(requests.values()),
+                'errors': errors,
+                'throttled': throttled,
+                'retries': sum(limiter['retries'].values()),
+                'bytes': sum(self.bytes.values()),
+                'rate_limit_wait': round(sum(limiter['wait_seconds'].values()), 1),
+                'parse_seconds': round(self.parse_seconds, 1),
+                'phases': {name: round(seconds, 1) for name, seconds in self._phase_seconds().items()},
+                'endpoints': {nsid: {'requests': n, 'p95': p95[nsid]} for nsid, n in requests.items()},
+            }
+
+    def prometheus(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        limiter = rate_limiter.counters()
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        with self.lock:
+            metric('bsky_responses_total', 'counter', 'XRPC responses by method and HTTP status',
+                   [({'endpoint': nsid, 'status': status}, n) for (nsid, status), n in sorted(self.statuses.items(), key=str)])
+            metric('bsky_response_bytes_total', 'counter', 'Bytes received per XRPC method',
+                   [({'endpoint': nsid}, n) for nsid, n in sorted(self.bytes.items())])
+
+            lines.append("# HELP bsky_request_duration_seconds Latency of one XRPC attempt")
+            lines.append("# TYPE bsky_request_duration_seconds histogram")
+            for nsid, histogram in sorted(self.latency.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else bound
+                    lines.append(f'bsky_request_duration_seconds_bucket{{endpoint="{nsid}",le="{le}"}} {cumulative}')
+                lines.append(f'bsky_request_duration_seconds_sum{{endpoint="{nsid}"}} {histogram.sum}')
+                lines.append(f'bsky_request_duration_seconds_count{{endpoint="{nsid}"}} {histogram.count}')
+
+            metric('bsky_parse_seconds_total', 'counter', 'Time spent turning responses into models',
+                   [({}, self.parse_seconds)])
+            metric('bsky_phase_seconds', 'gauge', 'Time spent in each phase of the run',
+                   [({'phase': name}, seconds) for name, seconds in self._phase_seconds().items()])
+
+        metric('bsky_retries_total', 'counter', 'Requests retried after a 429',
+               [({'endpoint': nsid}, n) for nsid, n in sorted(limiter['retries'].items())])
+        metric('bsky_rate_limit_wait_seconds_total', 'counter', 'Time spent waiting for the rate limiter',
+               [({'family': family}, seconds) for family, seconds in sorted(limiter['wait_seconds'].items())])
+        return '\n'.join(lines) + '\n'
+
+    # - - - - EXPORT - - - -
+
+    def start(self, port=METRICS_PORT, log_interval=METRICS_LOG_INTERVAL):
+        """Serve /metrics on `port` and log a snapshot every `log_interval` seconds (None disables)"""
+        if port:
+            try:
+                self._server = ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+                self._server.daemon_threads = True
+                threading.Thread(target=self._server.serve_forever, daemon=True).start()
+                print(f"Metrics on http://127.0.0.1:{port}/metrics")
+            except OSError as e:
+                print(f"Could not serve metrics on port {port}: {e}")
+        if log_interval:
+            threading.Thread(target=self._log_loop, args=(log_interval,), daemon=True).start()
+
+    def _log_loop(self, interval):
+        while not self._stop.wait(interval):
+            print(json.dumps(self.snapshot()))
+
+    def stop(self):
+        """Stop the exporters and log the final numbers"""
+        self._stop.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        print(json.dumps(self.snapshot()))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# Shared by every client in the process
+metrics = Metrics()
+
+
+def _body_size(response):
+    """Bytes of a response body, from the Content-Length header only when the body is not at hand
+    (the header is missing from chunked and compressed responses)"""
+    content = getattr(response, 'content', None)
+    if isinstance(content, (bytes, bytearray)):
+        return len(content)
+    return int((getattr(response, 'headers', None) or {}).get('content-length') or 0)
+
+
+def install_metrics(client, registry=metrics):
+    """Measure every request attempt of `client` (install before the rate limiter so its
+    waiting time is not counted as latency)"""
+    invoke = client._invoke
+    send_request = client.request._send_request
+    # atproto replaces a JSON body with the parsed dict, the raw size is taken from the HTTP
+    # response before that, per thread as every worker thread shares the client
+    received = threading.local()
+
+    def measured_send_request(*args, **kwargs):
+        response = send_request(*args, **kwargs)
+        received.size = _body_size(response)
+        return response
+
+    def measured_invoke(invoke_type, **kwargs):
+        nsid = kwargs.get('url', '').rsplit('/', 1)[-1]
+        received.size = None
+        start = time.perf_counter()
+        try:
+            response = invoke(invoke_type, **kwargs)
+        except exceptions.RequestErrorBase as e:
+            response = getattr(e, 'response', None)
+            status = response.status_code if response is not None else 'error'
+            registry.observe_request(nsid, time.perf_counter() - start, status, _body_size(response))
+            raise
+        except Exception:
+            registry.observe_request(nsid, time.perf_counter() - start, 'error', 0)
+            raise
+        size = received.size if received.size is not None else _body_size(response)
+        registry.observe_request(nsid, time.perf_counter() - start, response.status_code, size)
+        return response
+
+    client.request._send_request = measured_send_request
+    client._invoke = measured_invoke
+    _measure_parsing(registry)
+    return client
+
+
+def _measure_parsing(registry):
+    """Time the conversion of every response into atproto models (done once per process)"""
+    from atproto_client.namespaces import sync_ns
+    get_response_model = sync_ns.get_response_model
+    if getattr(get_response_model, 'measured', False):
+        return
+
+    def measured(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return get_response_model(*args, **kwargs)
+        finally:
+            registry.observe_parse(time.perf_counter() - start)
+
+    measured.measured = True
+    sync_ns.get_response_model = measured
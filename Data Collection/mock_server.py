@@ -0,0 +1,451 @@
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+#this file contains a local stand-in for the Bluesky XRPC API, to measure the collector offline
+#it answers the endpoints the collector calls, with cursors, configurable latency and 429 rate
+#limiting, from a synthetic social graph or from responses recorded during a real crawl
+#point the collector at it with BSKY_BASE_URL=http://127.0.0.1:<port> (see config.py) and a separate
+#BSKY_SESSION_FILE, so the mock tokens stay apart from the session of the real account
+#discovery pages several sources at once, record and replay with DISCOVERY_WORKERS = 1 to get
+#the same users in both runs
+
+BASE32 = 'abcdefghijklmnopqrstuvwxyz234567'
+# Account every login gets, whatever the credentials
+COLLECTOR_ACCOUNT = {'did': 'did:plc:mockcollectoraaaaaaaaaaaa', 'handle': 'collector.bsky.social'}
+
+
+def _b64url(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b'=').decode()
+
+
+def make_jwt(did, scope, lifetime):
+    """Unsigned JWT with the claims the atproto client reads"""
+    now = int(time.time())
+    header = {'alg': 'HS256', 'typ': 'JWT'}
+    payload = {'scope': scope, 'sub': did, 'aud': 'did:web:mock.local', 'iat': now, 'exp': now + lifetime}
+    return f"{_b64url(header)}.{_b64url(payload)}.mock"
+
+
+def _query_value(value):
+    """Parameter value as it appears in the query string"""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (list, tuple)):
+        return [_query_value(v) for v in value]
+    return str(value)
+
+
+def canonical_key(nsid, params):
+    """Key of a recorded response: method plus sorted parameters"""
+    return json.dumps([nsid, sorted((k, _query_value(v)) for k, v in params.items() if v is not None)])
+
+
+# - - - - - - - - - - - - - - - - - - SYNTHETIC BACKEND - - - - - - - - - - - - - - - - - - - -
+
+class SyntheticNetwork:
+    """Deterministic social graph: same seed, same users, follows, posts and likes"""
+
+    def __init__(self, users=10000, seed=42, avg_follows=30, max_posts=400, now=None):
+        self.n = users
+        self.seed = seed
+        self.max_posts = max_posts
+        self.now = now or datetime(2025, 3, 1, tzinfo=timezone.utc)
+
+        # Follows are skewed towards low ids, which become the popular accounts
+        rng = random.Random(seed)
+        self.follows = [[] for _ in range(users)]
+        self.followers = [[] for _ in range(users)]
+        for i in range(users):
+            targets = {int(users * rng.random() ** 3) for _ in range(int(rng.expovariate(1 / avg_follows)) + 1)}
+            targets.discard(i)
+            self.follows[i] = sorted(targets)
+        for i in range(users):
+            for j in self.follows[i]:
+                self.followers[j].append(i)
+
+    # - - - - ACTORS - - - -
+
+    def did(self, i):
+        digits = ''
+        for _ in range(8):
+            i, r = divmod(i, 32)
+            digits = BASE32[r] + digits
+        return f"did:plc:mock{digits}{'a' * 12}"
+
+    def index(self, actor):
+        """User index from a DID or handle, None if unknown"""
+        try:
+            if actor.startswith('did:plc:mock'):
+                i = 0
+                for c in actor[12:20]:
+                    i = i * 32 + BASE32.index(c)
+            else:
+                i = int(actor.split('.')[0].removeprefix('user'))
+        except ValueError:
+            return None
+        return i if 0 <= i < self.n else None
+
+    def profile_basic(self, i):
+        return {'did': self.did(i), 'handle': f"user{i}.bsky.social", 'displayName': f"User {i}"}
+
+    def created_at(self, i):
+        days = random.Random(f"{self.seed}-created-{i}").randint(30, 900)
+        return (self.now - timedelta(days=days)).isoformat().replace('+00:00', 'Z')
+
+    def profile_detailed(self, i):
+        return {
+            **self.profile_basic(i),
+            'description': f"Synthetic user {i}",
+            'followersCount': len(self.followers[i]),
+            'followsCount': len(self.follows[i]),
+            'postsCount': self.post_count(i),
+            'createdAt': self.created_at(i),
+        }
+
+    # - - - - POSTS - - - -
+
+    def post_count(self, i):
+        return int(random.Random(f"{self.seed}-posts-{i}").paretovariate(1.5) * 20) % self.max_posts
+
+    def feed_items(self, i):
+        """Author feed of user i, newest first: (is_repost, post, feed time)"""
+        rng = random.Random(f"{self.seed}-feed-{i}")
+        t = self.now
+        items = []
+        for k in range(self.post_count(i)):
+            t -= timedelta(hours=rng.expovariate(1 / 36))
+            if k % 7 == 6 and self.follows[i]:
+                # Repost of someone followed, the original is older than the repost
+                author = rng.choice(self.follows[i])
+                post = self.post(author, k, t - timedelta(days=rng.randint(0, 30)))
+                items.append((True, post, t))
+            else:
+                items.append((False, self.post(i, k, t), t))
+        return items
+
+    def post(self, i, k, created):
+        rng = random.Random(f"{self.seed}-post-{i}-{k}")
+        created_at = created.isoformat().replace('+00:00', '.123456789Z')
+        rkey = f"3mock{k:06d}"
+        return {
+            'uri': f"at://{self.did(i)}/app.bsky.feed.post/{rkey}",
+            'cid': 'bafyrei' + hashlib.sha256(f"{i}-{k}".encode()).hexdigest()[:52],
+            'author': self.profile_basic(i),
+            'record': {'$type': 'app.bsky.feed.post', 'text': f"Post {k} by user {i}", 'createdAt': created_at},
+            'indexedAt': created_at,
+            'likeCount': min(len(self.followers[i]), int(rng.expovariate(1 / 5))),
+            'repostCount': min(len(self.followers[i]), int(rng.expovariate(1 / 2))),
+            'replyCount': int(rng.expovariate(1)),
+        }
+
+    def post_from_uri(self, uri):
+        """(author index, post number) of a synthetic post URI"""
+        try:
+            _, _, did, _, rkey = uri.split('/')
+            return self.index(did), int(rkey.removeprefix('3mock'))
+        except ValueError:
+            return None, None
+
+    def like_records(self, i):
+        """Like records in the repository of user i, newest first, mostly of followed accounts"""
+        rng = random.Random(f"{self.seed}-likes-{i}")
+        t = self.now
+        records = []
+        for k in range(int(rng.paretovariate(1.5) * 30) % (2 * self.max_posts)):
+            t -= timedelta(hours=rng.expovariate(1 / 24))
+            author = rng.choice(self.follows[i]) if self.follows[i] and rng.random() < 0.8 else rng.randrange(self.n)
+            post = self.post(author, rng.randrange(max(self.post_count(author), 1)), t)
+            records.append({
+                'uri': f"at://{self.did(i)}/app.bsky.feed.like/3mocklike{k:06d}",
+                'cid': 'bafyrei' + hashlib.sha256(f"like-{i}-{k}".encode()).hexdigest()[:52],
+                'value': {
+                    '$type': 'app.bsky.feed.like',
+                    'subject': {'uri': post['uri'], 'cid': post['cid']},
+                    'createdAt': t.isoformat().replace('+00:00', 'Z'),
+                },
+            })
+        return records
+
+    # - - - - XRPC - - - -
+
+    @staticmethod
+    def _page(items, params, default_limit=50):
+        start = int(params.get('cursor') or 0)
+        limit = min(int(params.get('limit') or default_limit), 100)
+        end = start + limit
+        return items[start:end], (str(end) if end < len(items) else None)
+
+    def _actor_or_error(self, params):
+        i = self.index(params.get('actor', ''))
+        if i is None:
+            return None, (400, {'error': 'InvalidRequest', 'message': 'Profile not found'})
+        return i, None
+
+    def handle(self, nsid, params):
+        """Answer one XRPC query: (status, body)"""
+        if nsid == 'app.bsky.actor.getProfile':
+            i, error = self._actor_or_error(params)
+            return error or (200, self.profile_detailed(i))
+
+        if nsid == 'app.bsky.actor.getProfiles':
+            actors = params.get('actors', [])
+            indexes = [self.index(a) for a in (actors if isinstance(actors, list) else [actors])][:25]
+            return 200, {'profiles': [self.profile_detailed(i) for i in indexes if i is not None]}
+
+        if nsid in ('app.bsky.graph.getFollowers', 'app.bsky.graph.getFollows'):
+            i, error = self._actor_or_error(params)
+            if error:
+                return error
+            followers = nsid.endswith('getFollowers')
+            # Newest first, like the real API
+            ids = list(reversed(self.followers[i] if followers else self.follows[i]))
+            page, cursor = self._page(ids, params)
+            return 200, {
+                'subject': self.profile_basic(i),
+                'followers' if followers else 'follows': [self.profile_basic(j) for j in page],
+                'cursor': cursor,
+            }
+
+        if nsid == 'app.bsky.feed.getAuthorFeed':
+            i, error = self._actor_or_error(params)
+            if error:
+                return error
+            page, cursor = self._page(self.feed_items(i), params)
+            feed = []
+            for is_repost, post, feed_time in page:
+                item = {'post': post}
+                if is_repost:
+                    item['reason'] = {
+                        '$type': 'app.bsky.feed.defs#reasonRepost',
+                        'by': self.profile_basic(i),
+                        'indexedAt': feed_time.isoformat().replace('+00:00', 'Z'),
+                    }
+                feed.append(item)
+            return 200, {'feed': feed, 'cursor': cursor}
+
+        if nsid in ('app.bsky.feed.getLikes', 'app.bsky.feed.getRepostedBy'):
+            author, k = self.post_from_uri(params.get('uri', ''))
+            if author is None:
+                return 400, {'error': 'InvalidRequest', 'message': 'Post not found'}
+            post = self.post(author, k, self.now)
+            likes = nsid.endswith('getLikes')
+            count = post['likeCount'] if likes else post['repostCount']
+            ids = self.followers[author][:count]
+            page, cursor = self._page(ids, params)
+            if likes:
+                created_at = self.now.isoformat().replace('+00:00', 'Z')
+                body = {'likes': [{'actor': self.profile_basic(j), 'createdAt': created_at, 'indexedAt': created_at} for j in page]}
+            else:
+                body = {'repostedBy': [self.profile_basic(j) for j in page]}
+            return 200, {'uri': params['uri'], **body, 'cursor': cursor}
+
+        if nsid == 'com.atproto.repo.listRecords':
+            i = self.index(params.get('repo', ''))
+            if i is None:
+                return 400, {'error': 'InvalidRequest', 'message': 'Could not find repo'}
+            records = self.like_records(i) if params.get('collection') == 'app.bsky.feed.like' else []
+            if params.get('reverse') == 'true':
+                records.reverse()
+            page, cursor = self._page(records, params)
+            return 200, {'records': page, 'cursor': cursor}
+
+        if nsid in ('app.bsky.feed.searchPosts', 'app.bsky.feed.getTimeline', 'app.bsky.unspecced.getPopular'):
+            # Posts of pseudo-random users, a different sequence per query, at most 10 pages
+            query = params.get('q', nsid)
+            start = int(params.get('cursor') or 0)
+            limit = min(int(params.get('limit') or 50), 100)
+            rng = random.Random(f"{self.seed}-{query}-{start}")
+            posts = [self.post(rng.randrange(self.n), 0, self.now) for _ in range(limit)]
+            cursor = str(start + limit) if start + limit < 1000 else None
+            if nsid == 'app.bsky.feed.searchPosts':
+                return 200, {'posts': posts, 'cursor': cursor}
+            return 200, {'feed': [{'post': p} for p in posts], 'cursor': cursor}
+
+        return 501, {'error': 'MethodNotImplemented', 'message': f"{nsid} is not served by the mock server"}
+
+
+# - - - - - - - - - - - - - - - - - - RECORD / REPLAY - - - - - - - - - - - - - - - - - - - - -
+
+class RecordedResponses:
+    """Backend answering with responses recorded from the real API (see install_recorder)"""
+
+    def __init__(self, path):
+        self.responses = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.responses[canonical_key(entry['nsid'], entry['params'])] = (entry['status'], entry['body'])
+
+    def handle(self, nsid, params):
+        return self.responses.get(
+            canonical_key(nsid, params),
+            (404, {'error': 'NotRecorded', 'message': f"No recorded response for {nsid}"})
+        )
+
+
+def install_recorder(client, path):
+    """Append every response `client` receives to `path`, for later replay by the mock server"""
+    from atproto_client.models.utils import get_model_as_dict
+    invoke = client._invoke
+    lock = threading.Lock()
+
+    def recording_invoke(invoke_type, **kwargs):
+        nsid = kwargs.get('url', '').rsplit('/', 1)[-1]
+        params = kwargs.get('params') or {}
+        if not isinstance(params, dict):
+            params = get_model_as_dict(params)
+        response = invoke(invoke_type, **kwargs)
+        # Logins are not recorded, the mock server makes its own sessions
+        if not nsid.startswith('com.atproto.server.') and isinstance(response.content, dict):
+            entry = {'nsid': nsid, 'params': params, 'status': response.status_code, 'body': response.content}
+            with lock, open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+        return response
+
+    client._invoke = recording_invoke
+    return client
+
+
+# - - - - - - - - - - - - - - - - - - HTTP SERVER - - - - - - - - - - - - - - - - - - - - - - -
+
+class RateWindow:
+    """Fixed window request limit, reported with the RateLimit-* headers like the real API"""
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self.reset_at = time.time() + window
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Count one request: (allowed, headers)"""
+        with self.lock:
+            now = time.time()
+            if now >= self.reset_at:
+                self.reset_at = now + self.window
+                self.used = 0
+            allowed = self.used < self.limit
+            if allowed:
+                self.used += 1
+            headers = {
+                'RateLimit-Limit': str(self.limit),
+                'RateLimit-Remaining': str(self.limit - self.used),
+                'RateLimit-Reset': str(int(self.reset_at)),
+                'RateLimit-Policy': f"{self.limit};w={self.window}",
+            }
+        return allowed, headers
+
+
+class MockXrpcServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, backend, latency=0.0, jitter=0.0, rate_limit=None, window=300):
+        super().__init__(address, MockXrpcHandler)
+        self.backend = backend
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_window = RateWindow(rate_limit, window) if rate_limit else None
+        self.request_counts = {}
+        self.counts_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, nsid):
+        with self.counts_lock:
+            self.request_counts[nsid] = self.request_counts.get(nsid, 0) + 1
+
+
+class MockXrpcHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass  # One line per request would drown the collector output
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, method):
+        url = urlparse(self.path)
+        nsid = url.path.rsplit('/', 1)[-1]
+        server = self.server
+        server.count(nsid)
+
+        if method == 'POST':
+            length = int(self.headers.get('Content-Length') or 0)
+            self.rfile.read(length)
+
+        headers = {}
+        if server.rate_window:
+            allowed, headers = server.rate_window.take()
+            if not allowed:
+                return self._send(429, {'error': 'RateLimitExceeded', 'message': 'Rate Limit Exceeded'}, headers)
+
+        if server.latency or server.jitter:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+
+        if nsid in ('com.atproto.server.createSession', 'com.atproto.server.refreshSession'):
+            return self._send(200, {
+                **COLLECTOR_ACCOUNT,
+                'accessJwt': make_jwt(COLLECTOR_ACCOUNT['did'], 'com.atproto.access', 2 * 3600),
+                'refreshJwt': make_jwt(COLLECTOR_ACCOUNT['did'], 'com.atproto.refresh', 60 * 24 * 3600),
+            }, headers)
+
+        # Repeated parameters (getProfiles actors) are lists, the others plain values
+        params = {k: (v if k == 'actors' else v[0]) for k, v in parse_qs(url.query).items()}
+        if nsid == 'app.bsky.actor.getProfile' and params.get('actor') in COLLECTOR_ACCOUNT.values():
+            # Fetched by the client right after login
+            return self._send(200, COLLECTOR_ACCOUNT, headers)
+        status, body = server.backend.handle(nsid, params)
+        self._send(status, body, headers)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+def start_mock_server(backend, host='127.0.0.1', port=0, **options):
+    """Run the mock server in a background thread, returns the server (see .base_url)"""
+    server = MockXrpcServer((host, port), backend, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock of the Bluesky XRPC API")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--users', type=int, default=10000, help="size of the synthetic network")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--replay', help="serve responses recorded with RECORD_FILE instead")
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--rate-limit', type=int, default=3000, help="requests per window, 0 to disable")
+    parser.add_argument('--window', type=int, default=300, help="rate limit window in seconds")
+    args = parser.parse_args()
+
+    backend = RecordedResponses(args.replay) if args.replay else SyntheticNetwork(args.users, args.seed)
+    server = MockXrpcServer(('127.0.0.1', args.port), backend, args.latency, args.jitter, args.rate_limit or None, args.window)
+    print(f"Mock XRPC server on {server.base_url} ({'replay of ' + args.replay if args.replay else f'{args.users} synthetic users'})")
+    print(f"Run the collector with BSKY_BASE_URL={server.base_url} BSKY_SESSION_FILE=mock_session")
+    server.serve_forever()
@@ -0,0 +1,169 @@
+import threading
+import time
+from collections import defaultdict
+from atproto import exceptions
+from config import RATE_LIMITS, MAX_RATE_LIMIT_RETRIES
+
+#this file contains the rate limiter every API call goes through
+#one token bucket per endpoint family, adjusted at runtime with the RateLimit-* headers and 429s
+
+
+def endpoint_family(nsid):
+    """Map an XRPC method (e.g. app.bsky.graph.getFollowers) to its rate limit family"""
+    if nsid.startswith('com.atproto.server.'):
+        return 'auth'
+    if nsid.startswith('com.atproto.repo.'):
+        return 'repo'
+    for family in ('actor', 'graph', 'feed'):
+        if nsid.startswith(f'app.bsky.{family}.'):
+            return family
+    return 'default'
+
+
+class TokenBucket:
+    """Thread-safe token bucket that can be slowed down or paused by the server"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate  # Tokens added per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Take one token, sleeping until one is available. Returns the seconds waited"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.blocked_until:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return waited
+                    delay = (1 - self.tokens) / self.rate
+                else:
+                    delay = self.blocked_until - now
+            time.sleep(delay)
+            waited += delay
+
+    def update_from_headers(self, headers, default_rate):
+        """Spread the quota the server says is left evenly until its window resets"""
+        remaining = headers.get('ratelimit-remaining')
+        reset = headers.get('ratelimit-reset')
+        if remaining is None or reset is None:
+            return
+        try:
+            remaining = int(remaining)
+            seconds_to_reset = max(float(reset) - time.time(), 1.0)
+        except ValueError:
+            return
+
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, remaining)
+            if remaining <= 0:
+                self.pause(seconds_to_reset)
+            else:
+                # Never drop far below the configured rate just because the window is long,
+                # the server still answers with 429 if we go over
+                self.rate = max(remaining / seconds_to_reset, default_rate / 10)
+
+    def pause(self, seconds):
+        """Stop handing out tokens for `seconds` (caller may hold the lock)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class RateLimiter:
+    """Route every XRPC call through the token bucket of its endpoint family"""
+
+    def __init__(self, limits=RATE_LIMITS, max_retries=MAX_RATE_LIMIT_RETRIES):
+        self.limits = limits
+        self.max_retries = max_retries
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+        # Accounting, read by the benchmark and the final summary. Worker threads update it under
+        # _lock (see count), readers running alongside them take a copy with counters()
+        self.requests = defaultdict(int)  # per XRPC method
+        self.throttled = defaultdict(int)  # 429 responses per XRPC method
+        self.retries = defaultdict(int)  # requests sent again after a 429, per XRPC method
+        self.wait_seconds = defaultdict(float)  # time spent waiting per family
+
+    def bucket_for(self, family):
+        with self._lock:
+            if family not in self.buckets:
+                rate, capacity = self.limits.get(family, self.limits['default'])
+                self.buckets[family] = TokenBucket(rate, capacity)
+            return self.buckets[family]
+
+    def count(self, counter, key, amount=1):
+        with self._lock:
+            counter[key] += amount
+
+    def counters(self):
+        """Copies of the accounting counters"""
+        with self._lock:
+            return {
+                'requests': dict(self.requests), 'throttled': dict(self.throttled),
+                'retries': dict(self.retries), 'wait_seconds': dict(self.wait_seconds),
+            }
+
+    def call(self, nsid, func, *args, **kwargs):
+        """Run func once a token is available, retrying after 429 responses"""
+        family = endpoint_family(nsid)
+        bucket = self.bucket_for(family)
+        default_rate = self.limits.get(family, self.limits['default'])[0]
+
+        for attempt in range(self.max_retries + 1):
+            self.count(self.wait_seconds, family, bucket.acquire())
+            self.count(self.requests, nsid)
+            try:
+                response = func(*args, **kwargs)
+            except exceptions.RateLimitExceededError as e:
+                self.count(self.throttled, nsid)
+                if attempt == self.max_retries:
+                    raise
+                headers = e.response.headers if e.response is not None else {}
+                delay = self._retry_delay(headers, attempt)
+                print(f"Rate limited on {nsid}, pausing {family} requests for {delay:.1f}s")
+                with bucket.lock:
+                    bucket.pause(delay)
+                self.count(self.retries, nsid)
+                continue
+
+            bucket.update_from_headers(response.headers, default_rate)
+            return response
+
+    @staticmethod
+    def _retry_delay(headers, attempt):
+        """Wait until the server's reset time, or back off exponentially if it did not send one"""
+        try:
+            if 'ratelimit-reset' in headers:
+                return max(float(headers['ratelimit-reset']) - time.time(), 1.0)
+            if 'retry-after' in headers:
+                return max(float(headers['retry-after']), 1.0)
+        except ValueError:
+            pass
+        return min(2 ** attempt, 60)
+
+
+# Shared by every client in the process
+rate_limiter = RateLimiter()
+
+def install_rate_limiter(client, limiter=rate_limiter):
+    """Make every request of `client` go through the rate limiter"""
+    invoke = client._invoke
+
+    def limited_invoke(invoke_type, **kwargs):
+        nsid = kwargs.get('url', '').rsplit('/', 1)[-1]
+        return limiter.call(nsid, invoke, invoke_type, **kwargs)
+
+    client._invoke = limited_invoke
+    return client
@@ -0,0 +1,133 @@
+import json
+import os
+import time
+from config import OUTPUT_DIR, OUTPUT_FORMAT, SINK_BUFFER_BYTES, SINK_FSYNC_INTERVAL, WRITE_EDGE_FILES
+from graph_store import GraphBuilder, graph_path
+
+#this file contains the streaming writers for the collected data
+#records are appended to one file per entity as they arrive (newline-delimited JSON, or
+#Parquet with OUTPUT_FORMAT = 'parquet', see columnar_io.py), so memory does not grow
+#with the number of users crawled; follows go to the follow graph (see graph_store.py)
+
+# Entity -> output file name (without the date range and extension)
+ENTITY_FILES = {
+    'profiles': 'users_comprehensive_profiles',
+    'users_data': 'users_basic_profiles',
+    'followers': 'followers',
+    'following': 'following',
+    'posts': 'posts_all',
+    'reposts': 'reposts_all',
+    'post_likes': 'post_likes',
+    'post_reposts': 'post_reposts',
+    'likes_given': 'user_likes_given',
+}
+
+
+def entity_path(entity, date_range, extension='jsonl'):
+    return os.path.join(OUTPUT_DIR, f"{ENTITY_FILES[entity]}_{date_range}.{extension}")
+
+
+def output_entities(edge_files=WRITE_EDGE_FILES):
+    """Entities written to a file, the per-edge follow files only when they are enabled"""
+    return [e for e in ENTITY_FILES if edge_files or e not in ('followers', 'following')]
+
+
+def iter_jsonl(path):
+    """Read a JSONL file one record at a time"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class JsonlSink:
+    """Newline-delimited JSON file with buffered writes and periodic fsync"""
+
+    def __init__(self, path, buffer_bytes=SINK_BUFFER_BYTES, fsync_interval=SINK_FSYNC_INTERVAL):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.count = 0
+        self.file = open(path, 'w', encoding='utf-8', buffering=buffer_bytes)
+        self.last_sync = time.monotonic()
+
+    def write(self, records):
+        for record in records:
+            self.file.write(json.dumps(record, ensure_ascii=False))
+            self.file.write('\n')
+        self.count += len(records)
+        if time.monotonic() - self.last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        """Push buffered records to disk"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+
+class OutputSinks:
+    """One sink per entity of a collection run"""
+
+    def __init__(self, date_range, output_format=OUTPUT_FORMAT, edge_files=WRITE_EDGE_FILES):
+        self.date_range = date_range
+        self.output_format = output_format
+        entities = output_entities(edge_files)
+        if output_format == 'parquet':
+            from columnar_io import ParquetSink, SCHEMAS
+            self.sinks = {
+                entity: ParquetSink(entity_path(entity, date_range, 'parquet'), SCHEMAS[entity])
+                for entity in entities
+            }
+        else:
+            self.sinks = {entity: JsonlSink(entity_path(entity, date_range)) for entity in entities}
+        self.graph = GraphBuilder()
+
+    def write(self, entity, records):
+        self.sinks[entity].write(records)
+
+    def write_user(self, result):
+        """Write everything collected for one user (a result of crawler.collect_user)"""
+        self.write('profiles', [result['profile']])
+        # With the follower and follow counts collected, the profile counts (see data_processor.read_tables)
+        self.write('users_data', [{**result['user_info'], 'followers_collected': len(result['followers']),
+                                   'following_collected': len(result['following'])}])
+        self.graph.add_user(result)
+        for entity in ('followers', 'following', 'posts', 'reposts', 'likes_given'):
+            if entity in self.sinks:
+                self.write(entity, result[entity])
+
+    def finish(self, entity):
+        """Close one entity once nothing more will be written to it, so it can be read back"""
+        self.sinks[entity].close()
+
+    def iter_records(self, entity, columns=None):
+        """Read back the records of a finished entity one at a time"""
+        path = self.sinks[entity].path
+        if self.output_format == 'parquet':
+            from columnar_io import iter_parquet
+            return iter_parquet(path, columns)
+        return iter_jsonl(path)
+
+    def counts(self):
+        return {entity: sink.count for entity, sink in self.sinks.items()}
+
+    def close(self):
+        for entity, sink in self.sinks.items():
+            sink.close()
+            print(f"? Saved {sink.count} records to {os.path.basename(sink.path)}")
+        if self.graph is not None:
+            self.graph.save(graph_path(self.date_range))
+            self.graph = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,128 +1,210 @@
+import heapq
 import time
-from auth import authenticate_client
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from atproto import exceptions
+from auth import get_client
+from config import DISCOVERY_WORKERS, DISCOVERY_QUERIES, DISCOVERY_MAX_RETRIES
+
+#this file contains the user discovery engine
+#users come from paginated sources (timeline, popular feed, post searches, followers and
+#follows of users already found); the sources that find the most new users per request are
+#paged first, and users seen most often are expanded first through the follower graph
+#a source that fails with a network or server error is retried with backoff before it is dropped
+
+
+class Source:
+    """A paginated API listing users, remembers its cursor and how many new users it found"""
+
+    def __init__(self, name, fetch):
+        self.name = name
+        self.fetch = fetch  # fetch(cursor) -> API response
+        self.cursor = None
+        self.requests = 0
+        self.found = 0
+        self.failures = 0  # consecutive failed requests
+        self.retry_at = 0.0
+        self.exhausted = False
+
+    def priority(self):
+        # New users per request, sources not tried yet go first
+        return self.found / self.requests if self.requests else float('inf')
+
+
+def retryable(error):
+    """Network errors, 429s and server errors can succeed later, other errors will not"""
+    if isinstance(error, (exceptions.NetworkError, exceptions.RateLimitExceededError)):
+        return True
+    response = getattr(error, 'response', None)
+    return response is not None and response.status_code >= 500
+
+
+def get_search_strategies(client, queries=DISCOVERY_QUERIES):
+    """Return the paginated feed and search sources used to discover users."""
+    sources = [
+        Source("timeline", lambda cursor: client.app.bsky.feed.get_timeline({'limit': 100, 'cursor': cursor})),
+        Source("popular feed", lambda cursor: client.app.bsky.unspecced.get_popular({'limit': 100, 'cursor': cursor})),
+    ]
+    for query in queries:
+        sources.append(Source(
+            f"search - {query}",
+            lambda cursor, query=query: client.app.bsky.feed.search_posts({'q': query, 'limit': 100, 'cursor': cursor})
+        ))
+    return sources
 
 
-def get_search_strategies(client):
-    """Return a list of search strategies to discover users."""
+def get_network_sources(client, did, handle):
+    """Followers and follows of one user as paginated sources"""
     return [
-        ("timeline", lambda: client.app.bsky.feed.get_timeline({'limit': 100})),
-        ("popular feed", lambda: client.app.bsky.unspecced.get_popular({'limit': 100})),
-        ("search - news", lambda: client.app.bsky.feed.search_posts({'q': 'news', 'limit': 100})),
-        ("search - update", lambda: client.app.bsky.feed.search_posts({'q': 'update', 'limit': 100})),
-        ("search - today", lambda: client.app.bsky.feed.search_posts({'q': 'today', 'limit': 100})),
-        ("search - like", lambda: client.app.bsky.feed.search_posts({'q': 'like', 'limit': 100})),
-        ("search - follow", lambda: client.app.bsky.feed.search_posts({'q': 'follow', 'limit': 100})),
-        ("search - tech", lambda: client.app.bsky.feed.search_posts({'q': 'tech', 'limit': 100})),
-        ("search - art", lambda: client.app.bsky.feed.search_posts({'q': 'art', 'limit': 100})),
-        ("search - music", lambda: client.app.bsky.feed.search_posts({'q': 'music', 'limit': 100}))
+        Source(f"followers of {handle}", lambda cursor: client.app.bsky.graph.get_followers({'actor': did, 'limit': 100, 'cursor': cursor})),
+        Source(f"follows of {handle}", lambda cursor: client.app.bsky.graph.get_follows({'actor': did, 'limit': 100, 'cursor': cursor})),
     ]
 
 
-def expand_user_network(users_seen, client, max_users):
-    """Expand through followers/following of known users."""
-    users_processed = 0
-    seed_users = list(users_seen)[:50]
-
-    for i, (did, handle) in enumerate(seed_users):
-        if len(users_seen) >= max_users:
-            break
-
-        print(f"Expanding network through user {i+1}/{len(seed_users)}: {handle}")
-        try:
-            # Get followers
-            followers = client.app.bsky.graph.get_followers({'actor': did, 'limit': 50})
-            for follower in followers.followers:
-                users_seen.add((follower.did, follower.handle))
-                users_processed += 1
-                if len(users_seen) >= max_users:
-                    break
-
-            # Get following
-            following = client.app.bsky.graph.get_follows({'actor': did, 'limit': 50})
-            for follow in following.follows:
-                users_seen.add((follow.did, follow.handle))
-                users_processed += 1
-                if len(users_seen) >= max_users:
-                    break
-
-            time.sleep(1)  # Rate limiting
-
-        except Exception as e:
-            print(f"Error expanding through {handle}: {e}")
-
-    return users_seen
-
-
-def discover_users_with_strategy(strategies_used, users_seen, users_processed, strategies):
-    """Apply one unused strategy to discover users."""
-    # Choose a strategy not used yet
-    available_strategies = [(name, func) for name, func in strategies if name not in strategies_used]
-    if not available_strategies:
-        strategies_used.clear()
-        available_strategies = strategies
-
-    strategy_name, strategy_func = available_strategies[0]
-    strategies_used.add(strategy_name)
-
-    print(f"Finding users with strategy: {strategy_name}")
-    try:
-        result = strategy_func()
-
-        # Process results based on structure
-        items = []
-        if hasattr(result, 'feed'):
-            items = result.feed
-        elif hasattr(result, 'posts'):
-            items = result.posts
-
-        print(f"Got {len(items)} items from {strategy_name}")
-
-        for item in items:
-            # Extract post info
-            post = item.post if hasattr(item, 'post') else item
-
-            # Extract author
-            if hasattr(post, 'author'):
-                users_seen.add((post.author.did, post.author.handle))
-
-                # Also add users from replies/mentions
-                if hasattr(post, 'reply') and post.reply:
-                    if hasattr(post.reply, 'parent') and hasattr(post.reply.parent, 'author'):
-                        parent_author = post.reply.parent.author
-                        users_seen.add((parent_author.did, parent_author.handle))
-
-            users_processed += 1
-
-        print(f"Found {len(users_seen)} unique users so far")
-        time.sleep(1)  # Rate limiting
-
-    except Exception as e:
-        print(f"Error with {strategy_name}: {e}")
-
-    return users_seen, users_processed
+def extract_users(result):
+    """(did, handle) of every account in a feed, search or graph response"""
+    if hasattr(result, 'followers'):
+        return [(actor.did, actor.handle) for actor in result.followers]
+    if hasattr(result, 'follows'):
+        return [(actor.did, actor.handle) for actor in result.follows]
+
+    items = []
+    if hasattr(result, 'feed'):
+        items = result.feed
+    elif hasattr(result, 'posts'):
+        items = result.posts
+
+    users = []
+    for item in items:
+        # Extract post info
+        post = item.post if hasattr(item, 'post') else item
+
+        # Extract author
+        if hasattr(post, 'author'):
+            users.append((post.author.did, post.author.handle))
+
+        # Also add users from replies
+        reply = getattr(item, 'reply', None)
+        parent = getattr(reply, 'parent', None) if reply else None
+        if hasattr(parent, 'author'):
+            users.append((parent.author.did, parent.author.handle))
+    return users
+
+
+class DiscoveryEngine:
+    """Discover up to `max_users` unique users running several sources at the same time"""
+
+    def __init__(self, client, max_users, workers=DISCOVERY_WORKERS):
+        self.client = client
+        self.max_users = max_users
+        self.workers = workers
+        self.users = {}  # did -> handle, in discovery order
+        self.hits = {}  # did -> times seen, for users in self.users
+        self.frontier = []  # heap of (-hits, order, did) of users not expanded yet
+        self.expanded = set()
+        self.sources = get_search_strategies(client)
+        self.requests = 0
+        self._order = 0
+
+    def add_user(self, did, handle):
+        if did in self.users:
+            self.hits[did] += 1
+            # Re-prioritise when the count doubles, keeps the heap small
+            hits = self.hits[did]
+            if did not in self.expanded and hits & (hits - 1) == 0:
+                self._push_frontier(did)
+            return False
+        if len(self.users) >= self.max_users:
+            return False
+        self.users[did] = handle
+        self.hits[did] = 1
+        self._push_frontier(did)
+        return True
+
+    def _push_frontier(self, did):
+        # Lazy priority update: stale entries are skipped when popped
+        self._order += 1
+        heapq.heappush(self.frontier, (-self.hits[did], self._order, did))
+
+    def _expand_next(self):
+        """Turn the most seen user not expanded yet into follower/follow sources"""
+        while self.frontier:
+            _, _, did = heapq.heappop(self.frontier)
+            if did not in self.expanded:
+                self.expanded.add(did)
+                self.sources.extend(get_network_sources(self.client, did, self.users[did]))
+                return True
+        return False
+
+    def _next_sources(self, busy, count):
+        """Best idle sources, adding graph sources when the others run dry"""
+        now = time.monotonic()
+        while True:
+            idle = [s for s in self.sources if not s.exhausted and s not in busy and s.retry_at <= now]
+            if len(idle) >= count or not self._expand_next():
+                break
+        return heapq.nlargest(count, idle, key=lambda s: s.priority())
+
+    def _failed(self, source, error):
+        """Back off a source after a failed request, drop it once retrying is pointless"""
+        source.failures += 1
+        if not retryable(error) or source.failures > DISCOVERY_MAX_RETRIES:
+            print(f"Error with {source.name}: {error}, dropping it")
+            source.exhausted = True
+            return
+        delay = min(2 ** source.failures, 60)
+        source.retry_at = time.monotonic() + delay
+        print(f"Error with {source.name}: {error}, retrying in {delay}s")
+
+    def _fetch(self, source):
+        source.requests += 1
+        return source.fetch(source.cursor)
+
+    def run(self):
+        running = {}  # future -> source
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while len(self.users) < self.max_users:
+                for source in self._next_sources(running.values(), self.workers - len(running)):
+                    running[pool.submit(self._fetch, source)] = source
+                if not running:
+                    waiting = [s.retry_at for s in self.sources if not s.exhausted]
+                    if not waiting:
+                        print("No more sources to discover users from")
+                        break
+                    # Only sources backing off after errors are left
+                    time.sleep(max(min(waiting) - time.monotonic(), 0))
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    source = running.pop(future)
+                    self.requests += 1
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self._failed(source, e)
+                        continue
+                    source.failures = 0
+
+                    new_users = sum(self.add_user(did, handle) for did, handle in extract_users(result))
+                    source.found += new_users
+                    source.cursor = getattr(result, 'cursor', None)
+                    source.exhausted = not source.cursor
+                    print(f"{source.name}: {new_users} new users, {len(self.users)} unique users so far")
+
+                # Forget finished sources
+                self.sources = [s for s in self.sources if not s.exhausted]
+
+            for future in running:
+                future.cancel()
+
+        print(f"Discovered {len(self.users)} users with {self.requests} requests")
+        return list(self.users.items())[:self.max_users]
 
 
 def get_initial_users(max_users=100):
     """Get a set of initial users to start with - optimized for diverse user discovery."""
 
-    client = authenticate_client()
+    client = get_client()
     print(f"Finding initial users (target: {max_users})...")
 
-    users_seen = set()
-    users_processed = 0
-    strategies = get_search_strategies(client)
-    strategies_used = set()
-
-    while len(users_seen) < max_users and users_processed < max_users * 3:
-        if len(strategies_used) == len(strategies) and users_seen:
-            print("Tried all search strategies, expanding through follower network...")
-            users_seen = expand_user_network(users_seen, client, max_users)
-
-            if len(users_seen) < max_users:
-                strategies_used.clear()
-        else:
-            users_seen, users_processed = discover_users_with_strategy(
-                strategies_used, users_seen, users_processed, strategies
-            )
-
-    return list(users_seen)[:max_users]
+    return DiscoveryEngine(client, max_users).run()
@@ -1,5 +1,7 @@
-import datetime
+from datetime import datetime, timezone
 import re
+import numpy as np
+import pandas as pd
 
 
 #this file contains utility functions used across multiple modules
@@ -23,28 +25,162 @@ def parse_datetime(datetime_str):
             return datetime.strptime(datetime_str.replace('Z', '+0000'), "%Y-%m-%dT%H:%M:%S.%f%z")
 
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+US_PER_DAY = 86_400_000_000
+_MICROSECOND = datetime.resolution
+
+
+def to_epoch_us(moment):
+    """Microseconds since the epoch of an aware datetime, the form timestamps are stored in"""
+    return (moment - EPOCH) // _MICROSECOND
+
+
+# - - - - - - - - - - - - - - - - BULK TIMESTAMP PARSING - - - - - - - - - - - - - - - - - - -
+
+# Bytes kept per timestamp: 19 for the date and time, up to 20 fraction digits, the offset
+_WIDTH = 48
+_MAX_FRACTION = 20
+_CHUNK = 1_000_000
+
+
+def _number(chars, start, count):
+    """Decimal number in the byte columns [start, start + count) of every row"""
+    value = np.zeros(len(chars), dtype=np.int64)
+    for i in range(start, start + count):
+        value = value * 10 + (chars[:, i].astype(np.int64) - 48)
+    return value
+
+
+def _is_digit(chars):
+    return (chars >= 48) & (chars <= 57)
+
+
+_MONTH_DAYS = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+
+def _days_in_month(year, month):
+    """Length of every month, February 29 days in leap years (month must be 1..12)"""
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    return _MONTH_DAYS[month] + (leap & (month == 2))
+
+
+def _days_from_civil(year, month, day):
+    """Days since 1970-01-01 of proleptic Gregorian dates"""
+    year = year - (month <= 2)
+    era = np.floor_divide(year, 400)
+    year_of_era = year - era * 400
+    day_of_year = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def _parse_chunk(strings):
+    """Epoch microseconds of ISO timestamps as bytes, and which rows could be parsed"""
+    n = len(strings)
+    chars = np.frombuffer(strings.tobytes(), dtype=np.uint8).reshape(n, _WIDTH)
+    rows = np.arange(n)
+
+    # YYYY-MM-DDTHH:MM:SS
+    valid = _is_digit(chars[:, [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]]).all(axis=1)
+    valid &= (chars[:, 4] == ord('-')) & (chars[:, 7] == ord('-')) & (chars[:, 13] == ord(':')) & (chars[:, 16] == ord(':'))
+    valid &= np.isin(chars[:, 10], [ord('T'), ord('t'), ord(' ')])
+    year, month, day = _number(chars, 0, 4), _number(chars, 5, 2), _number(chars, 8, 2)
+    hour, minute, second = _number(chars, 11, 2), _number(chars, 14, 2), _number(chars, 17, 2)
+    valid &= (month >= 1) & (month <= 12) & (hour < 24) & (minute < 60) & (second < 60)
+    valid &= (day >= 1) & (day <= _days_in_month(year, np.where(valid, month, 1)))
+    us = (_days_from_civil(year, month, day) * 86400 + hour * 3600 + minute * 60 + second) * 1_000_000
+
+    # Fraction of any length, only the first 6 digits are kept (Bluesky often sends 9)
+    has_fraction = chars[:, 19] == ord('.')
+    fraction_digits = _is_digit(chars[:, 20:20 + _MAX_FRACTION + 1])
+    fraction_length = np.where(has_fraction, fraction_digits.argmin(axis=1), 0)
+    valid &= ~has_fraction | (fraction_length > 0)
+    microseconds = np.zeros(n, dtype=np.int64)
+    for i in range(6):
+        digit = chars[:, 20 + i].astype(np.int64) - 48
+        microseconds = microseconds * 10 + np.where(i < fraction_length, digit, 0)
+    us += microseconds
+
+    # Offset: Z, +HH:MM, +HHMM or nothing (taken as UTC)
+    zone = np.where(has_fraction, 20 + fraction_length, 19)
+    sign = chars[rows, zone]
+    is_utc = (sign == ord('Z')) | (sign == ord('z'))
+    has_offset = (sign == ord('+')) | (sign == ord('-'))
+    colon = chars[rows, zone + 3] == ord(':')
+    offset_hours = (chars[rows, zone + 1].astype(np.int64) - 48) * 10 + chars[rows, zone + 2] - 48
+    minute_start = np.where(colon, zone + 4, zone + 3)
+    offset_minutes = (chars[rows, minute_start].astype(np.int64) - 48) * 10 + chars[rows, minute_start + 1] - 48
+    offset_digits = (
+        _is_digit(chars[rows, zone + 1]) & _is_digit(chars[rows, zone + 2])
+        & _is_digit(chars[rows, minute_start]) & _is_digit(chars[rows, minute_start + 1])
+    )
+    end = np.where(has_offset, minute_start + 2, np.where(is_utc, zone + 1, zone))
+    valid &= (sign == 0) | is_utc | (has_offset & offset_digits & (offset_hours < 24) & (offset_minutes < 60))
+    valid &= chars[rows, np.minimum(end, _WIDTH - 1)] == 0
+    offset = (offset_hours * 60 + offset_minutes) * 60_000_000
+    us -= np.where(has_offset, np.where(sign == ord('-'), -offset, offset), 0)
+    return us, valid
+
+
+def parse_timestamps(values):
+    """Parse a whole column of ATProto timestamps at once.
+
+    Handles 'Z' and numeric offsets and fractions longer than 6 digits, like
+    parse_datetime but vectorised. Returns datetime64[us] in UTC, NaT for missing or
+    unparseable values (.view('int64') gives epoch microseconds). Rows the fast path does
+    not recognise go through parse_datetime one by one.
+    """
+    values = np.asarray(values, dtype=object)
+    result = np.full(len(values), np.iinfo(np.int64).min, dtype=np.int64)  # NaT
+    present = np.flatnonzero(pd.notna(values) & (values != ''))
+
+    for start in range(0, len(present), _CHUNK):
+        rows = present[start:start + _CHUNK]
+        try:
+            strings = values[rows].astype(f'S{_WIDTH}')
+            slow = rows[:0]
+        except UnicodeEncodeError:
+            # Non-ASCII values go through parse_datetime, the rest of the chunk still does not
+            ascii = np.array([not isinstance(value, str) or value.isascii() for value in values[rows]], dtype=bool)
+            rows, slow = rows[ascii], rows[~ascii]
+            strings = values[rows].astype(f'S{_WIDTH}')
+        us, valid = _parse_chunk(strings)
+        result[rows[valid]] = us[valid]
+        for row in np.concatenate([slow, rows[~valid]]):
+            try:
+                moment = parse_datetime(values[row])
+                # Without an offset the timestamp is UTC, as in the fast path
+                result[row] = to_epoch_us(moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc))
+            except (ValueError, TypeError, AttributeError):
+                pass
+    return result.view('datetime64[us]')
+
+
 def calculate_posting_frequency(posts, user_created_at=None):
     """Calculate posting frequency (posts per day)"""
     if not posts:
         return 0.0
     
-    # Get date range for posts
-    post_dates = [parse_datetime(post['created_at']) for post in posts if post.get('created_at')]
-    if not post_dates:
+    # Get date range for posts, parsed in one pass (or already parsed by the collector)
+    post_times = np.array([post.get('created_at_us') for post in posts], dtype=object)
+    unparsed = np.array([t is None for t in post_times])
+    if unparsed.any():
+        post_times[unparsed] = parse_timestamps([post.get('created_at') for post in posts])[unparsed].view(np.int64)
+    post_times = post_times.astype(np.int64)
+    post_times = post_times[post_times != np.iinfo(np.int64).min]
+    if not len(post_times):
         return 0.0
     
-    earliest_post = min(post_dates)
-    latest_post = max(post_dates)
+    earliest_post = post_times.min()
+    latest_post = post_times.max()
     
     # Use account creation date if available and earlier
     if user_created_at:
-        try:
-            created_date = parse_datetime(user_created_at)
+        created_date = parse_timestamps([user_created_at]).view(np.int64)[0]
+        if created_date != np.iinfo(np.int64).min:
             earliest_post = min(earliest_post, created_date)
-        except:
-            pass
     
     # Calculate days between first and last post
-    days_active = (latest_post - earliest_post).days + 1
+    days_active = (latest_post - earliest_post) // US_PER_DAY + 1
     
     return len(posts) / days_active if days_active > 0 else 0.0
@@ -1,29 +1,19 @@
 import pandas as pd
-from sklearn.decomposition import PCA
-from sklearn.preprocessing import StandardScaler
 import numpy as np
-from sklearn import decomposition
+from pca_analysis import analyse_profiles
+from profile_reader import GRAPH_FEATURES
 
 
-data = pd.read_csv('./users/csv/users_comprehensive_profiles_2024-02-01_to_2025-02-01.csv')
-print(data)
-selected_columns = ['followers_count', 'following_count', 'posts_count_total', 'reposts_count_total',	'likes_given_count', 'posting_frequency_total', 'total_likes_received',	'total_reposts_received']
-data[selected_columns]
+selected_columns = ['followers_count', 'following_count', 'posts_count_total', 'reposts_count_total',	'likes_given_count', 'posting_frequency_total', 'total_likes_received',	'total_reposts_received'] + GRAPH_FEATURES
+# One SVD of the standardised columns, read from the feature matrix cache after the first run
+pca, scaled_data = analyse_profiles(selected_columns)
+print(f"{len(scaled_data)} users, {len(selected_columns)} features")
 
-data=data[selected_columns]
-scaler = StandardScaler()
-scaled_data = scaler.fit_transform(data)
-# Applying PCA
-pca = PCA(n_components=2)  #choose the number of components
-pca_result = pca.fit_transform(scaled_data)
-variances = pca.explained_variance_
+# 2 and 3 component projections
+variances = pca.explained_variance(2)
+pca_result = pca.transform(scaled_data, 3)
 
-pca = PCA(n_components=3)  #choose the number of components
-pca_result = pca.fit_transform(scaled_data)
-
-pca = PCA(n_components=6)
-pca_result = pca.fit_transform(scaled_data)
-explained_variance_ratio = pca.explained_variance_ratio_
+explained_variance_ratio = pca.explained_variance_ratio(6)
 
 # Print the explained variance ratio for each principal component
 for i, evr in enumerate(explained_variance_ratio):
@@ -34,12 +24,8 @@ total_variance_explained = np.sum(explained_variance_ratio)
 print(f"Total variance explained: {total_variance_explained:.2f}")
 
 
-# Applying PCA
-pca = decomposition.PCA(n_components=4)
-pca.fit(data)
-
-features=['followers_count',	'following_count',	'posts_count_total',	'reposts_count_total',	'likes_given_count',	'posting_frequency_total',		'total_likes_received',	'total_reposts_received']
-loadings = pd.DataFrame(pca.components_.T, columns=['PC1', 'PC2', 'PC3','PC4'], index=features)
+# Loadings of the first 4 components, on the same standardised data as above
+loadings = pca.loadings(4)
 loadings
 # Show which features contribute most to each component
 for component in loadings.columns:
@@ -4,31 +4,18 @@ import numpy as np
 import seaborn as sns
 import copy
 from sklearn.cluster import KMeans
-from yellowbrick.cluster import KElbowVisualizer
 from scipy.stats import norm
 from sklearn.metrics import silhouette_score
 from yellowbrick.cluster import SilhouetteVisualizer
 import sklearn.metrics as metrics
+from profile_reader import load_profiles
+from feature_matrix import load_feature_matrix
+from k_sweep import k_sweep
+from cluster_model import ClusterModel
 
-df = pd.read_csv('./users/csv/users_comprehensive_profiles_2024-02-01_to_2025-02-01.csv')
-print(df)
 columnas_utilizadas= ['followers_count',	'following_count',	'posts_count_total',	'total_reposts_received',		'total_likes_received']
-
-data= df[columnas_utilizadas]
-
 integers_columns= ['followers_count',	'following_count',	'posts_count_total',	'total_reposts_received',		'total_likes_received']
 
-for atributo_integer in integers_columns:
-    data[atributo_integer]= data[atributo_integer].astype(int)
-
-print(data.dtypes)
-
-dataset_inicial= copy.deepcopy(data)
-ids_users = df["user_id"]
-dataset_inicial["id"] = ids_users
-
-dataset_inicial.head()
-
 # Elbow Method
 def plot_results_method_elbow(inertials):
     print("\n")
@@ -42,14 +29,13 @@ def plot_results_method_elbow(inertials):
 def select_clusters(data_tmp):
     X= data_tmp.to_numpy()
 
-    # Instantiate the clustering model and visualizer
-    model = KMeans()
-    visualizer = KElbowVisualizer(model, k=(2,20), timings=False)
-
-    visualizer.fit(X)        # Fit the data to the visualizer
-    visualizer.show()        # Finalize and render the figure
+    # Every k fitted once, in parallel: inertia, silhouette, Calinski-Harabasz and Davies-Bouldin
+    results = k_sweep(X, range(2, 20), n_init=20, max_iter=50000)
+    results.to_csv('k_sweep_results.csv', index=False)
+    print(results.to_string(index=False))
 
-select_clusters(data)
+    plot_results_method_elbow(zip(results['k'], results['inertia']))
+    return results
 
 
 def print_results_kmm(centroids, num_cluster_points):
@@ -79,6 +65,9 @@ def k_means(data, num_clusters, max_iterations, init_cluster, tolerance, dataset
     # Print final result
     print_results_kmm(centroides, etiquetas.tolist())
 
+    # Keep the fitted model, new users are assigned with cluster_model.py without refitting
+    model = ClusterModel.from_kmeans(kmeans, list(data.columns), integers_columns, rows=len(X))
+    print(f"\nModel {model.version} saved to {model.save()}")
 
     return df_labels
 
@@ -87,25 +76,43 @@ MAX_ITERATIONS = 50000
 INITIALIZE_CLUSTERS = 'k-means++'
 CONVERGENCE_TOLERANCE = 0.0000001
 
-print(f"\n\n------------------------ KMeans with {NUM_CLUSTERS} clusters ------------------------")
-df_labels= k_means(data, NUM_CLUSTERS, MAX_ITERATIONS, INITIALIZE_CLUSTERS,
-           CONVERGENCE_TOLERANCE, dataset_inicial)
-            
-            
-df_labels["Cluster"].value_counts()
 
+# The sweep runs in worker processes, which import this file: everything else only runs in the main one
+if __name__ == "__main__":
+    # The used columns come from the feature matrix cache (integer columns already truncated),
+    # the profiles file is only read for the user ids
+    matrix = load_feature_matrix(columnas_utilizadas, integer_columns=integers_columns)
+    df = pd.DataFrame(matrix.raw, columns=columnas_utilizadas)
+    df['user_id'] = load_profiles(['user_id'])['user_id']
+    print(df)
 
+    data= df[columnas_utilizadas]
+
+    for atributo_integer in integers_columns:
+        data[atributo_integer]= data[atributo_integer].astype(int)
+
+    print(data.dtypes)
+
+    dataset_inicial= copy.deepcopy(data)
+    ids_users = df["user_id"]
+    dataset_inicial["id"] = ids_users
+
+    dataset_inicial.head()
+
+    sweep_results = select_clusters(data)
+
+
+    print(f"\n\n------------------------ KMeans with {NUM_CLUSTERS} clusters ------------------------")
+    df_labels= k_means(data, NUM_CLUSTERS, MAX_ITERATIONS, INITIALIZE_CLUSTERS,
+               CONVERGENCE_TOLERANCE, dataset_inicial)
+            
+            
+    df_labels["Cluster"].value_counts()
 
-# Silhouette Score
-columnas_utilizadas= ['followers_count',	'following_count',	'posts_count_total',	'total_reposts_received',		'total_likes_received']
-data= df[columnas_utilizadas]
 
-sil_score = []
-SK = list(range(2, 20))  
 
-for i in SK:
-    labels = KMeans(n_clusters=i, init="k-means++", n_init=20, max_iter=50000, random_state=42).fit(data).labels_
-    score = metrics.silhouette_score(data, labels, metric="euclidean", sample_size=10000)
-    sil_score.append(score)
-    print(f"Silhouette score for k = {i} is {score}")
+    # Silhouette Score, from the fits of the sweep above (exact, or estimated with its interval)
+    for _, row in sweep_results.iterrows():
+        print(f"Silhouette score for k = {row['k']} is {row['silhouette']} "
+              f"[{row['silhouette_ci_low']}, {row['silhouette_ci_high']}] on {row['silhouette_sampled']} users")
     
\ No newline at end of file
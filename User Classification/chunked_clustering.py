@@ -0,0 +1,132 @@
+import argparse
+import os
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import IncrementalPCA
+from cluster_model import ClusterModel
+from feature_matrix import load_feature_matrix
+from profile_reader import BLOCK_ROWS, iter_profile_blocks
+
+#this file contains the chunked analysis mode, for profile tables larger than memory
+#the features are streamed in row blocks from the feature matrix cache into an incremental PCA,
+#then into mini-batch k-means on the PCA coordinates; a second streaming pass over the profiles
+#assigns the clusters and appends them to the output CSV, so memory holds a few blocks whatever
+#the number of users
+#like the k_means of the elbow script the raw integer columns are clustered by default, --scaled
+#clusters the standardised ones instead (clusters are then defined differently)
+#usage: python chunked_clustering.py --clusters 5 --components 4 --output 5_clustered_users.csv [--scaled]
+
+COLUMNS = ['followers_count', 'following_count', 'posts_count_total', 'total_reposts_received', 'total_likes_received']
+INTEGER_COLUMNS = COLUMNS
+
+
+def row_blocks(rows, block_rows=BLOCK_ROWS, minimum=1):
+    """(start, end) of consecutive blocks, a last block smaller than `minimum` joins the previous one"""
+    bounds = list(range(0, rows, block_rows)) + [rows]
+    if len(bounds) > 2 and bounds[-1] - bounds[-2] < minimum:
+        del bounds[-2]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+class ChunkedClustering:
+    """Incremental PCA and mini-batch k-means fitted one block of rows at a time"""
+
+    def __init__(self, n_clusters=5, n_components=None, batch_size=8192, epochs=3, random_state=42, scaled=False):
+        self.n_clusters = n_clusters
+        self.scaled = scaled
+        self.n_components = n_components
+        self.batch_size = batch_size
+        self.epochs = epochs
+        self.random_state = random_state
+        self.pca = IncrementalPCA(n_components) if n_components else None
+        self.kmeans = MiniBatchKMeans(n_clusters, batch_size=batch_size, random_state=random_state, n_init=3)
+
+    def reduce(self, block):
+        return self.pca.transform(block).astype(np.float32) if self.pca else block
+
+    def fit(self, X, block_rows=BLOCK_ROWS):
+        """Fit on X, the raw or the standardised feature matrix (a memmap is read one block at a time)"""
+        rng = np.random.default_rng(self.random_state)
+        if self.pca:
+            for start, end in row_blocks(len(X), block_rows, self.n_components):
+                self.pca.partial_fit(np.asarray(X[start:end]))
+
+        # A few passes over the blocks in random order, each block split into mini-batches
+        blocks = row_blocks(len(X), block_rows, self.n_clusters)
+        for _ in range(self.epochs):
+            for i in rng.permutation(len(blocks)):
+                start, end = blocks[i]
+                reduced = self.reduce(np.asarray(X[start:end]))
+                for batch_start, batch_end in row_blocks(len(reduced), self.batch_size, self.n_clusters):
+                    self.kmeans.partial_fit(reduced[batch_start:batch_end])
+        return self
+
+    def predict(self, block):
+        return self.kmeans.predict(self.reduce(block))
+
+    def centroids(self, matrix):
+        """Cluster centres in the units of the profile columns"""
+        return self.cluster_model(matrix).centroids_in_columns()
+
+    def cluster_model(self, matrix):
+        """The fit as a ClusterModel on the matrix columns; the nearest centroid in the PCA
+        coordinates is also the nearest of the centroids mapped back to the full space"""
+        centres = self.kmeans.cluster_centers_
+        if self.pca:
+            centres = self.pca.inverse_transform(centres)
+        mean, scale = matrix.mean, matrix.scale
+        if not self.scaled:
+            mean, scale = np.zeros_like(mean), np.ones_like(scale)
+        return ClusterModel(matrix.columns, matrix.integer_columns, mean, scale, centres,
+                            metadata={'rows': matrix.rows, 'n_components': self.n_components, 'scaled': self.scaled})
+
+
+def cluster_profiles(output='5_clustered_users.csv', columns=COLUMNS, integer_columns=INTEGER_COLUMNS,
+                     n_clusters=5, n_components=None, path=None, block_rows=BLOCK_ROWS, scaled=False, **options):
+    """Cluster every profile with bounded memory and write them with their cluster to `output`.
+    The raw columns are clustered unless `scaled`. Returns the fitted model and the number of
+    users per cluster"""
+    matrix = load_feature_matrix(columns, path, integer_columns)
+    X = matrix.scaled(block_rows) if scaled else matrix.raw
+    model = ChunkedClustering(n_clusters, n_components, scaled=scaled, **options).fit(X, block_rows)
+
+    # Second pass: same row order as the cached matrix
+    counts = np.zeros(n_clusters, dtype=np.int64)
+    temporary_path = output + '.tmp'
+    offset = 0
+    header = True
+    for block in iter_profile_blocks(columns + ['user_id'], path, block_rows):
+        labels = model.predict(np.asarray(X[offset:offset + len(block)]))
+        offset += len(block)
+        counts += np.bincount(labels, minlength=n_clusters)
+
+        rows = block[columns].fillna(0)
+        for column in integer_columns:
+            rows[column] = rows[column].astype(int)
+        rows['id'] = block['user_id'].astype(str).to_numpy()
+        rows['Cluster'] = labels
+        rows.to_csv(temporary_path, mode='w' if header else 'a', header=header, index=False)
+        header = False
+    os.replace(temporary_path, output)
+
+    print(f"\n{offset} users in {n_clusters} clusters written to {output}")
+    cluster_model = model.cluster_model(matrix)
+    print(f"Model {cluster_model.version} saved to {cluster_model.save()}")
+    for i, (centroid, count) in enumerate(zip(model.centroids(matrix), counts)):
+        print(f"\tCluster {i + 1}: {count} users, centroid {np.round(centroid, 2).tolist()}")
+    return model, counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cluster profile tables larger than memory")
+    parser.add_argument('--clusters', type=int, default=5)
+    parser.add_argument('--components', type=int, help="incremental PCA components to cluster on (default: none)")
+    parser.add_argument('--output', default='5_clustered_users.csv')
+    parser.add_argument('--block-rows', type=int, default=BLOCK_ROWS)
+    parser.add_argument('--batch-size', type=int, default=8192)
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--scaled', action='store_true', help="cluster the standardised columns instead of the raw ones")
+    args = parser.parse_args()
+
+    cluster_profiles(args.output, n_clusters=args.clusters, n_components=args.components, block_rows=args.block_rows,
+                     scaled=args.scaled, batch_size=args.batch_size, epochs=args.epochs)
@@ -0,0 +1,153 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from feature_matrix import prepare_features
+from profile_reader import DATA_DIR, BLOCK_ROWS, iter_table_blocks
+
+#this file contains the persisted clustering model and the assignment of new profiles to its clusters
+#a fitted model is saved as a versioned JSON artifact with everything needed to label a profile row:
+#the used columns, which of them are cast to integers, the scaling and the centroids
+#the scaling is folded into one linear map, so the nearest centroid of a block of rows is a single
+#matrix product and an argmax; files are streamed in blocks and never refitted
+#usage: python cluster_model.py --input new_profiles.parquet --output new_clustered_users.csv [--model FILE]
+
+FORMAT_VERSION = 1
+MODEL_DIR = os.path.join(DATA_DIR, 'models')
+
+
+class ClusterModel:
+    """Column selection, integer casting, scaling and centroids of a fitted clustering"""
+
+    def __init__(self, columns, integer_columns, mean, scale, centroids, version=None, metadata=None):
+        self.columns = list(columns)
+        self.integer_columns = [column for column in self.columns if column in set(integer_columns)]
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.centroids = np.asarray(centroids, dtype=np.float64)  # in the scaled space
+        self.metadata = dict(metadata or {})
+        self.version = version or self._new_version()
+
+        # |x_s - c|^2 = |x_s|^2 - 2 x_s.c + |c|^2 with x_s = (x - mean) / scale, so the nearest
+        # centroid maximises x @ weights - offsets
+        self.weights = (self.centroids / self.scale).T
+        self.offsets = ((self.centroids ** 2).sum(axis=1) + 2 * (self.centroids @ (self.mean / self.scale))) / 2
+        self.integer_mask = np.isin(self.columns, self.integer_columns)
+
+    @property
+    def n_clusters(self):
+        return len(self.centroids)
+
+    def _new_version(self):
+        digest = hashlib.blake2b(self.centroids.tobytes(), digest_size=4).hexdigest()
+        return f"{time.strftime('%Y%m%dT%H%M%S')}-{digest}"
+
+    @classmethod
+    def from_kmeans(cls, kmeans, columns, integer_columns=(), mean=None, scale=None, **metadata):
+        """Model of a fitted KMeans; without mean and scale it was fitted on the raw columns"""
+        mean = np.zeros(len(columns)) if mean is None else mean
+        scale = np.ones(len(columns)) if scale is None else scale
+        metadata.setdefault('inertia', float(kmeans.inertia_))
+        return cls(columns, integer_columns, mean, scale, kmeans.cluster_centers_, metadata=metadata)
+
+    def centroids_in_columns(self):
+        """Centroids in the units of the profile columns"""
+        return self.centroids * self.scale + self.mean
+
+    def features(self, rows):
+        """Model columns of a DataFrame, or of an array already in column order, as float64:
+        missing values are 0 and integer columns are truncated"""
+        if isinstance(rows, pd.DataFrame):
+            return prepare_features(rows, self.columns, set(self.integer_columns))
+        values = np.array(rows, dtype=np.float64, ndmin=2)
+        values[np.isnan(values)] = 0
+        values[:, self.integer_mask] = np.trunc(values[:, self.integer_mask])
+        return values
+
+    def assign(self, rows, block_rows=BLOCK_ROWS):
+        """Cluster of every row (DataFrame or array), computed in blocks of `block_rows`"""
+        return self.nearest(self.features(rows), block_rows)
+
+    def nearest(self, values, block_rows=BLOCK_ROWS):
+        """Nearest centroid of rows already in model features"""
+        labels = np.empty(len(values), dtype=np.int32)
+        for start in range(0, len(values), block_rows):
+            scores = values[start:start + block_rows] @ self.weights
+            scores -= self.offsets
+            labels[start:start + block_rows] = scores.argmax(axis=1)
+        return labels
+
+    def assign_file(self, path, output, id_column='user_id', block_rows=BLOCK_ROWS):
+        """Stream a profiles file (Parquet or CSV) into `output`, a CSV of the model columns, id
+        and Cluster. Returns the number of users per cluster"""
+        counts = np.zeros(self.n_clusters, dtype=np.int64)
+        temporary_path = output + '.tmp'
+        header = True
+        for block in iter_table_blocks(None, self.columns + [id_column], path, block_rows):
+            values = self.features(block)
+            labels = self.nearest(values, block_rows)
+            counts += np.bincount(labels, minlength=self.n_clusters)
+
+            rows = pd.DataFrame(values, columns=self.columns)
+            for column in self.integer_columns:
+                rows[column] = rows[column].astype(np.int64)
+            rows['id'] = block[id_column].astype(str).to_numpy()
+            rows['Cluster'] = labels
+            rows.to_csv(temporary_path, mode='w' if header else 'a', header=header, index=False)
+            header = False
+        os.replace(temporary_path, output)
+        return counts
+
+    def to_dict(self):
+        return {
+            'format_version': FORMAT_VERSION, 'version': self.version, 'columns': self.columns,
+            'integer_columns': self.integer_columns, 'mean': self.mean.tolist(), 'scale': self.scale.tolist(),
+            'centroids': self.centroids.tolist(), 'metadata': self.metadata,
+        }
+
+    def save(self, path=None):
+        """Write the model (to MODEL_DIR under its version by default). Returns the path"""
+        if path is None:
+            os.makedirs(MODEL_DIR, exist_ok=True)
+            path = os.path.join(MODEL_DIR, f"cluster_model_{self.version}.json")
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(path + '.tmp', path)
+        return path
+
+
+def load_cluster_model(path=None):
+    """Load a saved model, the latest version in MODEL_DIR by default"""
+    if path is None:
+        saved = sorted(glob.glob(os.path.join(MODEL_DIR, 'cluster_model_*.json')))
+        if not saved:
+            raise FileNotFoundError(f"No saved cluster model in {MODEL_DIR}")
+        path = saved[-1]
+    with open(path, 'r', encoding='utf-8') as f:
+        model = json.load(f)
+    if model.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"{path} has model format {model.get('format_version')}, expected {FORMAT_VERSION}")
+    return ClusterModel(model['columns'], model['integer_columns'], model['mean'], model['scale'],
+                        model['centroids'], model['version'], model['metadata'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assign profiles to the clusters of a saved model, without refitting")
+    parser.add_argument('--input', required=True, help="profiles file (Parquet or CSV)")
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--model', help="saved model file (default: the latest in the models directory)")
+    parser.add_argument('--id-column', default='user_id')
+    parser.add_argument('--block-rows', type=int, default=BLOCK_ROWS)
+    args = parser.parse_args()
+
+    model = load_cluster_model(args.model)
+    start = time.perf_counter()
+    counts = model.assign_file(args.input, args.output, args.id_column, args.block_rows)
+    elapsed = time.perf_counter() - start
+    print(f"{counts.sum()} users assigned with model {model.version} in {elapsed:.1f}s, written to {args.output}")
+    for i, (centroid, count) in enumerate(zip(model.centroids_in_columns(), counts)):
+        print(f"\tCluster {i + 1}: {count} users, centroid {np.round(centroid, 2).tolist()}")
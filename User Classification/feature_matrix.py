@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import numpy as np
+from profile_reader import DATA_DIR, BLOCK_ROWS, table_path, iter_profile_blocks
+
+#this file contains the cached feature matrix shared by the PCA and clustering scripts
+#the selected profile columns are read once, block by block, into a float32 file that is
+#memory-mapped afterwards, together with its standardised copy; the cache key is a hash of the
+#profiles file and the column list, so a new collection run or other columns build a new one
+
+CACHE_DIR = os.path.join(DATA_DIR, 'feature_cache')
+HASH_BLOCK_BYTES = 1 << 24
+
+
+def file_hash(path):
+    """Hash of a file's content"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(path, columns, integer_columns=()):
+    description = json.dumps([file_hash(path), list(columns), sorted(integer_columns)])
+    return hashlib.blake2b(description.encode(), digest_size=16).hexdigest()
+
+
+class FeatureMatrix:
+    """Profile columns as a memory-mapped float32 matrix (rows in profiles file order)"""
+
+    def __init__(self, directory, key):
+        self.directory = directory
+        self.key = key
+        with open(self._file('json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.columns = meta['columns']
+        self.integer_columns = meta['integer_columns']
+        self.source = meta['source']
+        self.rows = meta['rows']
+        self.mean = np.array(meta['mean'])
+        self.scale = np.array(meta['scale'])  # standard deviation, 1 for constant columns
+        self.raw = self._map('raw')
+
+    def _file(self, kind):
+        return os.path.join(self.directory, f"{self.key}.{kind}")
+
+    def _map(self, kind):
+        if not self.rows:
+            return np.zeros((0, len(self.columns)), dtype=np.float32)
+        return np.memmap(self._file(kind), dtype=np.float32, mode='r', shape=(self.rows, len(self.columns)))
+
+    @property
+    def shape(self):
+        return self.raw.shape
+
+    def scaled(self, block_rows=BLOCK_ROWS):
+        """The standardised matrix (zero mean, unit variance per column), written on first use"""
+        path = self._file('scaled')
+        if self.rows and not os.path.exists(path):
+            temporary_path = path + '.tmp'
+            out = np.memmap(temporary_path, dtype=np.float32, mode='w+', shape=self.raw.shape)
+            for start in range(0, self.rows, block_rows):
+                block = self.raw[start:start + block_rows]
+                out[start:start + block_rows] = (block - self.mean) / self.scale
+            out.flush()
+            del out
+            os.replace(temporary_path, path)
+        return self._map('scaled')
+
+    def standardise(self, values):
+        """Scale other rows of the same columns like the cached matrix"""
+        return ((np.asarray(values, dtype=np.float64) - self.mean) / self.scale).astype(np.float32)
+
+
+def prepare_features(block, columns, integer_columns):
+    """Block of profile rows as float32 features: missing values are 0, integer columns truncated"""
+    values = block[columns].to_numpy(dtype=np.float64, na_value=np.nan)
+    values[np.isnan(values)] = 0
+    for i, column in enumerate(columns):
+        if column in integer_columns:
+            values[:, i] = np.trunc(values[:, i])
+    return values
+
+
+def build_feature_matrix(columns, path, key, integer_columns=(), directory=CACHE_DIR, block_rows=BLOCK_ROWS):
+    """Stream the profiles file into the cache, with the column means and deviations"""
+    os.makedirs(directory, exist_ok=True)
+    raw_path = os.path.join(directory, f"{key}.raw")
+    rows = 0
+    mean = np.zeros(len(columns))
+    squares = np.zeros(len(columns))  # sum of squared deviations from the mean
+    with open(raw_path + '.tmp', 'wb') as out:
+        for block in iter_profile_blocks(columns, path, block_rows):
+            values = prepare_features(block, columns, set(integer_columns))
+            if not len(values):
+                continue
+            # Merge the block statistics into the running ones (Chan et al.)
+            block_mean = values.mean(axis=0)
+            block_squares = ((values - block_mean) ** 2).sum(axis=0)
+            total = rows + len(values)
+            delta = block_mean - mean
+            mean = mean + delta * len(values) / total
+            squares = squares + block_squares + delta ** 2 * rows * len(values) / total
+            rows = total
+            values.astype(np.float32).tofile(out)
+    os.replace(raw_path + '.tmp', raw_path)
+
+    scale = np.sqrt(squares / rows) if rows else np.ones(len(columns))
+    scale[scale == 0] = 1.0
+    with open(os.path.join(directory, f"{key}.json"), 'w', encoding='utf-8') as f:
+        json.dump({
+            'columns': list(columns), 'integer_columns': sorted(integer_columns), 'source': os.path.abspath(path),
+            'rows': rows, 'mean': mean.tolist(), 'scale': scale.tolist(),
+        }, f)
+    print(f"Cached {rows} x {len(columns)} feature matrix of {os.path.basename(path)}")
+    return FeatureMatrix(directory, key)
+
+
+def load_feature_matrix(columns, path=None, integer_columns=(), directory=CACHE_DIR, refresh=False):
+    """Feature matrix of `columns` of the profiles file, from the cache when it has it"""
+    if path is None:
+        path = table_path('users_comprehensive_profiles')
+    key = cache_key(path, columns, integer_columns)
+    if not refresh and os.path.exists(os.path.join(directory, f"{key}.json")):
+        return FeatureMatrix(directory, key)
+    return build_feature_matrix(columns, path, key, integer_columns, directory)
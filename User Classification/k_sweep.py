@@ -0,0 +1,171 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from sklearn.metrics import calinski_harabasz_score, davies_bouldin_score
+from feature_matrix import load_feature_matrix
+from silhouette import SAMPLE_SIZE, silhouette_table
+
+#this file contains the model selection sweep over the number of clusters
+#the k range is cut into contiguous chains of about the same cost, one per worker process; every k
+#keeps the best of its k-means++ fits and of one fit started from the k - 1 centroids plus one new
+#centre drawn like k-means++, all seeded by k so any number of workers gives the same results; the
+#data matrix is put once in shared memory and every worker maps it
+#inertia, Calinski-Harabasz and Davies-Bouldin all come from the same fit; the silhouettes of all the
+#labelings are computed together at the end, sharing their distances (see silhouette.py)
+#usage: python k_sweep.py --k-min 2 --k-max 19 --workers 4 --output k_sweep_results.csv
+
+COLUMNS = ['followers_count', 'following_count', 'posts_count_total', 'total_reposts_received', 'total_likes_received']
+DISTANCE_BLOCK_ROWS = 65536
+
+
+def chains(ks, workers):
+    """Cut the sorted ks into at most `workers` contiguous runs of about the same total k"""
+    ks = sorted(ks)
+    target = sum(ks) / max(min(workers, len(ks)), 1)
+    runs, run, cost = [], [], 0
+    for k in ks:
+        if run and cost + k / 2 > target and len(runs) < workers - 1:
+            runs.append(run)
+            run, cost = [], 0
+        run.append(k)
+        cost += k
+    return runs + [run] if run else runs
+
+
+def next_centre(X, centres, rng):
+    """One more initial centre, drawn with probability proportional to the squared distance to
+    the closest existing one (the k-means++ step), computed in blocks"""
+    distances = np.empty(len(X))
+    squared_centres = (centres ** 2).sum(axis=1)
+    for start in range(0, len(X), DISTANCE_BLOCK_ROWS):
+        block = np.asarray(X[start:start + DISTANCE_BLOCK_ROWS], dtype=np.float64)
+        d = (block ** 2).sum(axis=1)[:, None] - 2 * block @ centres.T + squared_centres
+        distances[start:start + len(block)] = np.maximum(d.min(axis=1), 0)
+    total = distances.sum()
+    i = rng.choice(len(X), p=distances / total) if total > 0 else rng.integers(len(X))
+    return np.vstack([centres, X[i]])
+
+
+def score(X, model):
+    """Quality metrics of one fitted model, other than the silhouette"""
+    labels = model.labels_
+    distinct = len(np.unique(labels))
+    valid = 1 < distinct < len(X)
+    return {
+        'k': model.n_clusters,
+        'inertia': model.inertia_,
+        'calinski_harabasz': calinski_harabasz_score(X, labels) if valid else np.nan,
+        'davies_bouldin': davies_bouldin_score(X, labels) if valid else np.nan,
+        'n_iter': model.n_iter_,
+    }
+
+
+def cold_fit(X, k, n_init=20, max_iter=300, tol=1e-4, random_state=42):
+    """The n_init k-means++ fits of k, seeded by k alone"""
+    return KMeans(k, init='k-means++', n_init=n_init, max_iter=max_iter, tol=tol, random_state=random_state + k).fit(X)
+
+
+def sweep_chain(X, ks, n_init=20, max_iter=300, tol=1e-4, random_state=42):
+    """Fit the ks of one chain in order. Every k keeps the best of its n_init k-means++ fits and
+    of one more fit started from the centroids of the k - 1 k-means++ fit plus one new centre.
+    Every seed depends on k only, so the results do not depend on how the ks are split among
+    workers. Every row keeps the labels of its fit for the silhouette"""
+    options = {'max_iter': max_iter, 'tol': tol, 'random_state': random_state}
+    results = []
+    cold = {}
+    for k in ks:
+        start = time.perf_counter()
+        cold[k] = model = cold_fit(X, k, n_init, **options)
+        warm_start = False
+        if k > 2:
+            if k - 1 not in cold:  # first k of the chain
+                cold[k - 1] = cold_fit(X, k - 1, n_init, **options)
+            rng = np.random.default_rng([random_state, k])
+            init = next_centre(X, cold.pop(k - 1).cluster_centers_, rng)
+            warm = KMeans(k, init=init, n_init=1, max_iter=max_iter, tol=tol).fit(X)
+            if warm.inertia_ < model.inertia_:
+                model, warm_start = warm, True
+        fit_seconds = time.perf_counter() - start
+        results.append({**score(X, model), 'fit_seconds': fit_seconds, 'warm_start': warm_start,
+                        'labels': model.labels_.astype(np.int32)})
+    return results
+
+
+def _sweep_shared(name, shape, dtype, ks, options):
+    """Worker: map the shared matrix and sweep one chain with a single BLAS/OpenMP thread"""
+    from threadpoolctl import threadpool_limits
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        with threadpool_limits(1):
+            return sweep_chain(np.ndarray(shape, dtype=dtype, buffer=memory.buf), ks, **options)
+    finally:
+        memory.close()
+
+
+def add_silhouettes(X, results, silhouette_options=None):
+    """Silhouette columns (with their interval and sample size) for the labels of every fit"""
+    labels = results.pop('labels').tolist()
+    valid = np.array([1 < len(np.unique(l)) < len(X) for l in labels])
+    table = pd.DataFrame(np.nan, index=results.index, columns=['silhouette', 'ci_low', 'ci_high', 'sampled'])
+    if valid.any():
+        scores = silhouette_table(X, [l for l, ok in zip(labels, valid) if ok], **(silhouette_options or {}))
+        table.loc[valid] = scores.to_numpy()
+    results.insert(2, 'silhouette', table['silhouette'])
+    for column in ['ci_low', 'ci_high', 'sampled']:
+        results[f'silhouette_{column}'] = table[column]
+    results['silhouette_sampled'] = results['silhouette_sampled'].astype('Int64')
+    return results
+
+
+def k_sweep(X, ks=range(2, 20), workers=None, silhouette_options=None, **options):
+    """Fit and score every k, in parallel across worker processes. Returns one row per k.
+    `silhouette_options` go to silhouette_table (exact, sample_size, ...)"""
+    ks = sorted(ks)
+    X = np.asarray(X)
+    workers = min(workers or os.cpu_count() or 1, len(ks))
+    if workers <= 1:
+        return add_silhouettes(X, pd.DataFrame(sweep_chain(X, ks, **options)), silhouette_options)
+
+    memory = shared_memory.SharedMemory(create=True, size=max(X.nbytes, 1))
+    try:
+        shared = np.ndarray(X.shape, dtype=X.dtype, buffer=memory.buf)
+        shared[:] = X
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_sweep_shared, memory.name, X.shape, X.dtype, run, options)
+                       for run in chains(ks, workers)]
+            results = [row for future in futures for row in future.result()]
+        del shared
+    finally:
+        memory.close()
+        memory.unlink()
+    results = pd.DataFrame(results).sort_values('k').reset_index(drop=True)
+    return add_silhouettes(X, results, silhouette_options)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Elbow and silhouette model selection over k")
+    parser.add_argument('--k-min', type=int, default=2)
+    parser.add_argument('--k-max', type=int, default=19)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--scaled', action='store_true', help="cluster the standardised columns")
+    parser.add_argument('--n-init', type=int, default=20)
+    parser.add_argument('--max-iter', type=int, default=300)
+    parser.add_argument('--exact-silhouette', action='store_true', help="exact silhouettes whatever the number of rows")
+    parser.add_argument('--silhouette-sample', type=int, default=SAMPLE_SIZE)
+    parser.add_argument('--output', default='k_sweep_results.csv')
+    args = parser.parse_args()
+
+    matrix = load_feature_matrix(COLUMNS, integer_columns=COLUMNS)
+    X = matrix.scaled() if args.scaled else matrix.raw
+    start = time.perf_counter()
+    silhouette_options = {'exact': True} if args.exact_silhouette else {'sample_size': args.silhouette_sample}
+    results = k_sweep(X, range(args.k_min, args.k_max + 1), args.workers, silhouette_options,
+                      n_init=args.n_init, max_iter=args.max_iter)
+    print(results.to_string(index=False))
+    print(f"Sweep of {len(results)} values of k in {time.perf_counter() - start:.1f}s")
+    results.to_csv(args.output, index=False)
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+from feature_matrix import load_feature_matrix
+from profile_reader import BLOCK_ROWS
+
+#this file contains the PCA of the profile features, computed with a single decomposition
+#the standardised matrix is reduced block by block to its R factor (X = QR), whose SVD has the
+#same singular values and directions as X: explained variance, loadings and projections for any
+#number of components all come from that one SVD, without holding X in memory
+
+
+def _r_factor(X, block_rows=BLOCK_ROWS):
+    """R of the QR decomposition of X, one block of rows at a time"""
+    R = np.zeros((0, X.shape[1]))
+    for start in range(0, len(X), block_rows):
+        block = np.asarray(X[start:start + block_rows], dtype=np.float64)
+        R = np.linalg.qr(np.vstack([R, block]), mode='r')
+    return R
+
+
+class PCAAnalysis:
+    """Principal components of a standardised feature matrix"""
+
+    def __init__(self, X, columns, block_rows=BLOCK_ROWS):
+        self.columns = list(columns)
+        self.rows = len(X)
+        _, singular_values, components = np.linalg.svd(_r_factor(X, block_rows), full_matrices=False)
+        # Same sign convention as scikit-learn: the largest loading of each component is positive
+        signs = np.sign(components[np.arange(len(components)), np.abs(components).argmax(axis=1)])
+        signs[signs == 0] = 1
+        self.components = components * signs[:, None]
+        self.singular_values = singular_values
+        self.block_rows = block_rows
+
+    def explained_variance(self, n_components=None):
+        return (self.singular_values[:n_components] ** 2) / max(self.rows - 1, 1)
+
+    def explained_variance_ratio(self, n_components=None):
+        squares = self.singular_values ** 2
+        return squares[:n_components] / squares.sum()
+
+    def loadings(self, n_components):
+        """Weight of every feature in the first `n_components` components"""
+        return pd.DataFrame(
+            self.components[:n_components].T,
+            columns=[f'PC{i+1}' for i in range(n_components)],
+            index=self.columns
+        )
+
+    def transform(self, X, n_components):
+        """Coordinates of standardised rows on the first `n_components` components"""
+        components = self.components[:n_components].T.astype(np.float32)
+        return np.vstack([
+            np.asarray(X[start:start + self.block_rows], dtype=np.float32) @ components
+            for start in range(0, len(X), self.block_rows)
+        ]) if len(X) else np.zeros((0, n_components), dtype=np.float32)
+
+
+def analyse_profiles(columns, path=None):
+    """PCA of profile columns, using (or filling) the feature matrix cache.
+    Returns the analysis and the standardised matrix it was computed on"""
+    scaled = load_feature_matrix(columns, path).scaled()
+    return PCAAnalysis(scaled, columns), scaled
@@ -0,0 +1,54 @@
+import os
+import pandas as pd
+
+#this file contains the readers for the tables written by the data collection
+#the Parquet output is preferred, only the requested columns are decoded from it
+
+DATE_RANGE = '2024-02-01_to_2025-02-01'
+DATA_DIR = './users'
+CSV_DIR = './users/csv'
+# Rows per block when a table is streamed instead of loaded whole
+BLOCK_ROWS = 100_000
+
+# Columns added to the profiles by the graph features stage of the collection (graph_features.py)
+GRAPH_FEATURES = ['reciprocity', 'in_degree_sample', 'out_degree_sample', 'pagerank', 'core_number', 'clustering_coefficient']
+
+
+def table_path(name, date_range=DATE_RANGE):
+    """Parquet file of a table if the collector wrote one, its CSV export otherwise"""
+    parquet_path = os.path.join(DATA_DIR, f'{name}_{date_range}.parquet')
+    if os.path.exists(parquet_path):
+        return parquet_path
+    return os.path.join(CSV_DIR, f'{name}_{date_range}.csv')
+
+
+def load_table(name, columns=None, path=None):
+    """Load a collected table (e.g. 'posts_all'), reading only `columns`"""
+    if path is None:
+        path = table_path(name)
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+
+def load_profiles(columns=None, path=None):
+    """Load the comprehensive user profiles, reading only `columns`"""
+    return load_table('users_comprehensive_profiles', columns, path)
+
+
+def iter_table_blocks(name, columns=None, path=None, block_rows=BLOCK_ROWS):
+    """Read a collected table in blocks of about `block_rows` rows, with `columns` in that order"""
+    if path is None:
+        path = table_path(name)
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=block_rows, columns=columns):
+            yield batch.to_pandas()
+    else:
+        for block in pd.read_csv(path, usecols=columns, chunksize=block_rows):
+            yield block[columns] if columns else block
+
+
+def iter_profile_blocks(columns=None, path=None, block_rows=BLOCK_ROWS):
+    """Stream the comprehensive user profiles in row blocks, for cohorts larger than memory"""
+    return iter_table_blocks('users_comprehensive_profiles', columns, path, block_rows)
@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+#this file contains the silhouette computation used for choosing the number of clusters
+#distances from a block of rows to every row are computed once, in float32 tiles, and shared by all
+#the candidate labelings: one product with their stacked one-hot matrices gives the distance sums
+#to every cluster of every labeling, so memory is bounded by the tile whatever n is
+#exact scores cost O(n^2); the sampled mode scores a sample of rows stratified by cluster exactly
+#against all the rows, O(sample n), weights each cluster by its size and gives a confidence interval
+
+MEMORY_BYTES = 256 * 2**20  # distance block size
+EXACT_MAX_ROWS = 20000  # above this many rows the sampled mode is used by default
+SAMPLE_SIZE = 2000
+
+
+def silhouette_values(X, labelings, rows=None, memory_bytes=MEMORY_BYTES):
+    """Exact silhouette of the `rows` of X (default all) under every labeling, each row against
+    all the rows of X. Returns an array of shape (labelings, rows).
+
+    The distances are computed in float32 tiles of at most `memory_bytes`, on the data centred
+    around its mean to keep the rounding error small for large counts.
+    """
+    X = np.asarray(X, dtype=np.float32)
+    X = X - X.mean(axis=0, dtype=np.float64).astype(np.float32)
+    n = len(X)
+    rows = np.arange(n) if rows is None else np.asarray(rows)
+    squared = np.einsum('ij,ij->i', X, X)[:, None]
+    # |x - y|^2 = [-2x, |x|^2, 1] . [y, 1, |y|^2], so each tile of squared distances is one product
+    ones = np.ones((n, 1), dtype=np.float32)
+    left = np.hstack([-2 * X, squared, ones])
+    right = np.hstack([X, ones, squared])
+
+    dense_labels, sizes = [], []
+    for labels in labelings:
+        _, dense = np.unique(np.asarray(labels), return_inverse=True)
+        dense_labels.append(dense)
+        sizes.append(np.bincount(dense))
+    offsets = np.cumsum([0] + [len(size) for size in sizes])
+
+    values = np.empty((len(labelings), len(rows)))
+    row_block = max(1, min(len(rows), 4096))
+    column_block = max(1, memory_bytes // (4 * (row_block + offsets[-1])))
+    for row_start in range(0, len(rows), row_block):
+        block = rows[row_start:row_start + row_block]
+        # Sum of the distances from every row of the block to every cluster of every labeling
+        sums = np.zeros((len(block), offsets[-1]))
+        for start in range(0, n, column_block):
+            end = min(start + column_block, n)
+            distances = left[block] @ right[start:end].T
+            np.maximum(distances, 0, out=distances)
+            np.sqrt(distances, out=distances)
+            inside = (block >= start) & (block < end)
+            distances[np.flatnonzero(inside), block[inside] - start] = 0
+            # One product with the stacked one-hot matrices of all the labelings
+            indicators = np.zeros((end - start, offsets[-1]), dtype=np.float32)
+            for l, dense in enumerate(dense_labels):
+                indicators[np.arange(end - start), offsets[l] + dense[start:end]] = 1
+            sums += distances @ indicators
+
+        for l, (dense, size) in enumerate(zip(dense_labels, sizes)):
+            own = dense[block]
+            cluster_sums = sums[:, offsets[l]:offsets[l + 1]]
+            own_size = size[own]
+            a = cluster_sums[np.arange(len(block)), own] / np.maximum(own_size - 1, 1)
+            means = cluster_sums / size
+            means[np.arange(len(block)), own] = np.inf
+            b = means.min(axis=1)
+            s = np.where(own_size > 1, (b - a) / np.maximum(np.maximum(a, b), np.finfo(np.float64).tiny), 0.0)
+            values[l, row_start:row_start + len(block)] = np.where(np.isfinite(b), s, 0.0)
+    return values
+
+
+def silhouette_scores(X, labelings, memory_bytes=MEMORY_BYTES):
+    """Exact mean silhouette of every labeling, sharing the distance computation"""
+    return silhouette_values(X, labelings, memory_bytes=memory_bytes).mean(axis=1)
+
+
+def sampled_silhouette_scores(X, labelings, sample_size=SAMPLE_SIZE, min_per_cluster=30, confidence=0.95,
+                              random_state=42, memory_bytes=MEMORY_BYTES):
+    """Silhouette of every labeling estimated from a stratified sample of rows.
+
+    Every labeling gets one shared uniform sample of rows, plus extra rows drawn inside the
+    clusters with fewer than `min_per_cluster` of them. The exact silhouette of every sampled
+    row is computed against all the rows, once for all the labelings. Each cluster's mean is
+    weighted by its share of the data, and the interval comes from the stratified variance.
+    Returns silhouette, ci_low, ci_high and sampled per labeling.
+    """
+    n = len(X)
+    rng = np.random.default_rng(random_state)
+    base = rng.choice(n, size=min(sample_size, n), replace=False)
+    in_base = np.zeros(n, dtype=bool)
+    in_base[base] = True
+
+    # Per labeling: the base sample plus the extra rows of its small clusters
+    chosen = []
+    for labels in labelings:
+        _, dense = np.unique(np.asarray(labels), return_inverse=True)
+        extra = []
+        for c, count in enumerate(np.bincount(dense[base], minlength=dense.max() + 1)):
+            if count < min_per_cluster:
+                candidates = np.flatnonzero((dense == c) & ~in_base)
+                extra.append(rng.choice(candidates, size=min(min_per_cluster - count, len(candidates)), replace=False))
+        chosen.append(np.concatenate([base] + extra))
+
+    rows = np.unique(np.concatenate(chosen))
+    values = silhouette_values(X, labelings, rows, memory_bytes)
+    z = norm.ppf(0.5 + confidence / 2)
+
+    results = []
+    for l, labels in enumerate(labelings):
+        _, dense = np.unique(np.asarray(labels), return_inverse=True)
+        sample = np.sort(chosen[l])
+        s = values[l, np.searchsorted(rows, sample)]
+        estimate, variance = 0.0, 0.0
+        for c, size in enumerate(np.bincount(dense)):
+            stratum = s[dense[sample] == c]
+            weight = size / n
+            estimate += weight * stratum.mean()
+            if len(stratum) > 1:
+                variance += weight ** 2 * (1 - len(stratum) / size) * stratum.var(ddof=1) / len(stratum)
+        margin = z * np.sqrt(variance)
+        results.append({'silhouette': estimate, 'ci_low': estimate - margin, 'ci_high': estimate + margin,
+                        'sampled': len(sample)})
+    return pd.DataFrame(results)
+
+
+def silhouette_table(X, labelings, exact=None, **options):
+    """Exact scores for small data, stratified estimates with intervals above EXACT_MAX_ROWS"""
+    if exact is None:
+        exact = len(X) <= EXACT_MAX_ROWS
+    if exact:
+        scores = silhouette_scores(X, labelings, options.get('memory_bytes', MEMORY_BYTES))
+        return pd.DataFrame({'silhouette': scores, 'ci_low': scores, 'ci_high': scores, 'sampled': len(X)})
+    return sampled_silhouette_scores(X, labelings, **options)
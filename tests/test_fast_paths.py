@@ -0,0 +1,207 @@
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'User Classification'))
+sys.path.insert(0, os.path.join(ROOT, 'Data Collection'))
+
+import data_processor
+import graph_store
+import sinks
+from silhouette import silhouette_values
+from utils import parse_datetime, parse_timestamps, to_epoch_us
+
+#this file contains the checks of the vectorised code paths against the code they replace:
+#the bulk timestamp parser against parse_datetime, the silhouette of every row against
+#sklearn, and the profiles rebuilt from the stored tables against the ones built at crawl time
+#usage: python -m pytest tests
+
+
+# - - - - - - - - - - - - - - - - - - TIMESTAMPS - - - - - - - - - - - - - - - - - - - - - - -
+
+def slow_epoch_us(value):
+    """What parse_datetime makes of one value, as epoch microseconds (None when it fails).
+    Timestamps without an offset are UTC"""
+    try:
+        moment = parse_datetime(value)
+    except (ValueError, TypeError, AttributeError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return to_epoch_us(moment)
+
+
+def assert_same_as_parse_datetime(values):
+    parsed = parse_timestamps(values)
+    for value, fast in zip(values, parsed):
+        expected = slow_epoch_us(value)
+        if expected is None:
+            assert np.isnat(fast), value
+        else:
+            assert fast.astype('int64') == expected, value
+
+
+EDGE_TIMESTAMPS = [
+    '2024-01-15T10:30:00Z',
+    '2024-01-15T10:30:00.123Z',
+    '2024-01-15T10:30:00.123456Z',
+    '2024-01-15T10:30:00.123456789Z',
+    '2024-01-15T10:30:00.000000001Z',
+    '2024-01-15T10:30:00+05:30',
+    '2024-01-15T10:30:00.5-08:00',
+    '2024-01-15T23:59:59.999999999+14:00',
+    '2024-01-15T00:00:00-12:00',
+    '2024-01-15T10:30:00+00:00',
+    '2024-01-15T10:30:00',
+    '2024-01-15 10:30:00Z',
+    '2024-02-29T12:00:00Z',
+    '2000-02-29T12:00:00Z',
+    '2023-02-29T12:00:00Z',
+    '1900-02-29T12:00:00Z',
+    '2024-04-31T00:00:00Z',
+    '2024-06-31T00:00:00Z',
+    '2024-12-31T23:59:59Z',
+    '2024-00-10T00:00:00Z',
+    '2024-13-01T00:00:00Z',
+    '2024-01-00T00:00:00Z',
+    '2024-01-32T00:00:00Z',
+    '2024-01-15T24:00:00Z',
+    '2024-01-15T10:60:00Z',
+    '2024-01-15T10:30:00.Z',
+    '2024-01-15T10:30:00Zjunk',
+    '2024-01-15',
+    'not a timestamp',
+    '２０２４-01-15T10:30:00Z',
+    '',
+    None,
+    float('nan'),
+]
+
+
+def test_parse_timestamps_edge_inputs():
+    assert_same_as_parse_datetime(EDGE_TIMESTAMPS)
+
+
+def test_parse_timestamps_random_inputs():
+    rng = random.Random(18)
+    values = []
+    for _ in range(5000):
+        year = rng.choice([1900, 1999, 2000, 2023, 2024, 2100])
+        month = rng.randint(1, 12)
+        day = rng.randint(1, 31)
+        text = f"{year:04d}-{month:02d}-{day:02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}"
+        if rng.random() < 0.7:
+            text += '.' + ''.join(rng.choice('0123456789') for _ in range(rng.randint(1, 9)))
+        sign = rng.choice(['+', '-'])
+        text += rng.choice(['Z', '', f"{sign}{rng.randint(0, 14):02d}:{rng.choice([0, 30, 45]):02d}"])
+        values.append(text)
+    assert_same_as_parse_datetime(values)
+
+
+def test_parse_timestamps_empty():
+    assert len(parse_timestamps([])) == 0
+
+
+# - - - - - - - - - - - - - - - - - - SILHOUETTE - - - - - - - - - - - - - - - - - - - - - - -
+
+def test_silhouette_values_match_sklearn():
+    from sklearn.metrics import silhouette_samples
+
+    rng = np.random.default_rng(24)
+    # Heavy-tailed columns like the profile counts, far from the origin
+    X = np.hstack([rng.lognormal(3, 1.5, (600, 3)), 1000 + rng.normal(0, 5, (600, 2))])
+    labelings = [rng.integers(0, k, len(X)) for k in (2, 5, 9)]
+    labelings[2][:3] = 9  # a cluster of a few points
+    labelings[2][3] = 10  # and a singleton, which scores 0
+
+    values = silhouette_values(X, labelings, memory_bytes=64 * 1024)  # several column blocks
+    for labels, row_values in zip(labelings, values):
+        np.testing.assert_allclose(row_values, silhouette_samples(X, labels), atol=1e-5)
+
+    rows = rng.choice(len(X), 50, replace=False)
+    np.testing.assert_allclose(silhouette_values(X, labelings, rows=rows), values[:, rows], atol=1e-5)
+
+
+# - - - - - - - - - - - - - - - - - - PROFILES - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def crawl_result(i, dids, rng):
+    """Collected data of user i, as crawler.collect_user returns it"""
+    did, handle = dids[i], f"user{i}.bsky.social"
+    start = datetime(2024, 2, 1, tzinfo=timezone.utc)
+    others = [j for j in range(len(dids)) if j != i]
+
+    def moment():
+        return start + timedelta(days=rng.uniform(-60, 400))
+
+    user_info = {
+        'did': did, 'handle': handle, 'display_name': f"User {i}", 'description': None,
+        'followers_count': 100, 'following_count': 100, 'posts_count': 10,
+        'created_at': (start - timedelta(days=100 + i)).isoformat(),
+    }
+    # Lists cut short like past FOLLOWS_LIMIT: the graph also gets the edges other users saw
+    followers = [
+        {'user_did': did, 'user_handle': handle, 'follower_did': dids[j],
+         'follower_handle': f"user{j}.bsky.social", 'follower_display_name': None}
+        for j in rng.sample(others, rng.randint(0, 2))
+    ]
+    following = [
+        {'user_did': did, 'user_handle': handle, 'following_did': dids[j],
+         'following_handle': f"user{j}.bsky.social", 'following_display_name': None}
+        for j in rng.sample(others, rng.randint(0, 3))
+    ]
+    posts = []
+    for k in range(rng.randint(0, 6)):
+        created = moment()
+        posts.append({
+            'uri': f"at://{did}/app.bsky.feed.post/{k}", 'cid': f"cid{i}-{k}", 'text': '',
+            'created_at': created.isoformat(), 'created_at_us': to_epoch_us(created),
+            'author_did': did, 'author_handle': handle,
+            'like_count': rng.randint(0, 9), 'repost_count': rng.randint(0, 3), 'reply_count': rng.randint(0, 2),
+            'in_timeframe': created <= datetime(2025, 2, 1, tzinfo=timezone.utc) and created >= start,
+        })
+    reposts = []
+    for k in range(rng.randint(0, 3)):
+        reposted = moment()
+        reposts.append({
+            'repost_by': did, 'repost_by_handle': handle, 'original_uri': f"at://x/app.bsky.feed.post/{i}{k}",
+            'original_cid': 'cid', 'original_author_did': 'did:plc:x', 'original_author_handle': 'x',
+            'repost_time': reposted.isoformat(), 'repost_time_us': to_epoch_us(reposted),
+            'in_timeframe': start <= reposted <= datetime(2025, 2, 1, tzinfo=timezone.utc),
+        })
+    likes_given = []
+    for k in range(rng.randint(0, 4)):
+        liked = moment()
+        likes_given.append({'user_did': did, 'subject_uri': f"at://x/{k}", 'created_at': liked.isoformat(),
+                            'created_at_us': to_epoch_us(liked)})
+
+    result = {'did': did, 'handle': handle, 'user_info': user_info, 'followers': followers,
+              'following': following, 'posts': posts, 'reposts': reposts, 'likes_given': likes_given}
+    result['profile'] = data_processor.create_comprehensive_user_profile(
+        user_info, posts, reposts, likes_given, followers, following
+    )
+    return result
+
+
+@pytest.mark.parametrize('output_format', ['jsonl', 'parquet'])
+def test_rebuilt_profiles_match_crawl_time_profiles(tmp_path, monkeypatch, output_format):
+    monkeypatch.setattr(sinks, 'OUTPUT_DIR', str(tmp_path))
+    monkeypatch.setattr(graph_store, 'OUTPUT_DIR', str(tmp_path))
+    rng = random.Random(17)
+    dids = [f"did:plc:user{i:04d}" for i in range(12)]
+    results = [crawl_result(i, dids, rng) for i in range(len(dids))]
+
+    date_range = '2024-02-01_to_2025-02-01'
+    with sinks.OutputSinks(date_range, output_format) as output:
+        for result in results:
+            output.write_user(result)
+
+    rebuilt = data_processor.build_profiles(*data_processor.read_tables(date_range, output_format))
+    # Everything but the time each profile was built
+    columns = [column for column in data_processor.PROFILE_COLUMNS if column != 'data_collected_at']
+    crawled = pd.DataFrame([result['profile'] for result in results])[columns]
+    pd.testing.assert_frame_equal(rebuilt[columns].reset_index(drop=True), crawled, check_dtype=False)